@@ -4,7 +4,26 @@ Analyze Claude Code session data and compute token usage and costs.
 Reads all local session files and generates a detailed cost report.
 
 Usage:
-    python3 analyze_claude_sessions.py [--start-date YYYY-MM-DD] [--end-date YYYY-MM-DD] [--by-day]
+    python3 analyze_claude_sessions.py [--start-date YYYY-MM-DD] [--end-date YYYY-MM-DD] [--by hour|day|week|month]
+                                      [--top N | --limit N] [--offset N] [--sort created|cost|context|turns|cache_write]
+                                      [--cache-file PATH] [--no-cache] [--jobs N] [--filter-turns]
+                                      [--turns-out PATH] [--pricing PATH] [--profile [--profile-out PATH]]
+                                      [--output PATH] [--export-format json|compact|ndjson] [--gzip]
+                                      [--cache-efficiency] [--by-tool] [--latency] [--no-rollups]
+                                      [--group-by project,git_branch,model,hour,day,week,month,session,subagent]
+                                      [--sample [FRACTION]]
+    python3 analyze_claude_sessions.py --watch [--watch-output PATH] [--watch-interval SECONDS]
+    python3 analyze_claude_sessions.py turns PATH [--by model|project|session|hour|day]
+    python3 analyze_claude_sessions.py ingest [--db PATH]
+    python3 analyze_claude_sessions.py query day|project|branch|model|session [--days N] [--order-by METRIC]
+                                             [--limit N] [--db PATH]
+    python3 analyze_claude_sessions.py query --sql "SELECT ..." [--db PATH]
+    python3 analyze_claude_sessions.py validate-sample [--sample FRACTION]
+    python3 analyze_claude_sessions.py --shard-out PATH
+    python3 analyze_claude_sessions.py merge SHARD... [--shard-out PATH] [--by hour|day|week|month] [--top N]
+                                      [--group-by DIM[,DIM...]]
+    python3 analyze_claude_sessions.py archive [--older-than DAYS] [--zstd] [--prune-after DAYS] [--dry-run]
+    python3 analyze_claude_sessions.py serve [--host HOST] [--port PORT] [--interval SECONDS]
 
 Examples:
     # Analyze all sessions
@@ -19,402 +38,628 @@ Examples:
     # Analyze sessions up to a specific date
     python3 analyze_claude_sessions.py --end-date 2026-01-22
 
-    # Aggregate sessions by day
+    # Aggregate API turns by day (a session running past midnight is split)
     python3 analyze_claude_sessions.py --by-day
 
+    # Monthly totals
+    python3 analyze_claude_sessions.py --by month
+
+    # Cost per project and model for each day, in one pass
+    python3 analyze_claude_sessions.py --group-by project,model,day --sort cost
+
+    # The 10 most expensive sessions (totals still cover every session)
+    python3 analyze_claude_sessions.py --top 10
+
+    # Page through sessions by peak context, 20 at a time
+    python3 analyze_claude_sessions.py --sort context --limit 20 --offset 20
+
     # Daily breakdown for a specific week
     python3 analyze_claude_sessions.py --start-date 2026-01-20 --end-date 2026-01-26 --by-day
 
-The script will:
-1. Scan ~/.claude/projects/ for all session files
-2. Parse token usage from each session
-3. Calculate costs based on current Anthropic pricing
-4. Generate a detailed report to stdout
-5. Export full analysis to claude_sessions_analysis.json in current directory
+    # Ignore the parse cache and decode every file from scratch
+    python3 analyze_claude_sessions.py --no-cache
 
-Requirements:
-    - Python 3.6+
-    - Standard library only (no external dependencies)
-"""
+    # Price turns with a custom effective-dated price table
+    python3 analyze_claude_sessions.py --pricing ~/claude_pricing.json
 
-import argparse
-import json
-import os
-import re
-from pathlib import Path
-from datetime import datetime
-from collections import defaultdict
-from typing import Dict, List, Tuple, Optional
-
-# Claude API pricing (as of January 2025)
-# https://www.anthropic.com/api#pricing
-PRICING = {
-    "claude-opus-4-5": {
-        "input": 0.015 / 1000,      # $15 per MTok
-        "output": 0.075 / 1000,     # $75 per MTok
-        "cache_write": 0.01875 / 1000,  # $18.75 per MTok
-        "cache_read": 0.0015 / 1000,    # $1.50 per MTok
-    },
-    "claude-sonnet-4-5": {
-        "input": 0.003 / 1000,      # $3 per MTok
-        "output": 0.015 / 1000,     # $15 per MTok
-        "cache_write": 0.00375 / 1000,  # $3.75 per MTok
-        "cache_read": 0.0003 / 1000,    # $0.30 per MTok
-    },
-    "claude-sonnet-3-5": {
-        "input": 0.003 / 1000,      # $3 per MTok
-        "output": 0.015 / 1000,     # $15 per MTok
-        "cache_write": 0.00375 / 1000,  # $3.75 per MTok
-        "cache_read": 0.0003 / 1000,    # $0.30 per MTok
-    },
-    "claude-haiku-4-5": {
-        "input": 0.0008 / 1000,     # $0.80 per MTok
-        "output": 0.004 / 1000,     # $4 per MTok
-        "cache_write": 0.001 / 1000,    # $1 per MTok
-        "cache_read": 0.00008 / 1000,   # $0.08 per MTok
-    },
-    "claude-haiku-3-5": {
-        "input": 0.0008 / 1000,     # $0.80 per MTok
-        "output": 0.004 / 1000,     # $4 per MTok
-        "cache_write": 0.001 / 1000,    # $1 per MTok
-        "cache_read": 0.00008 / 1000,   # $0.08 per MTok
-    },
-}
+    # Parse session files on 8 processes
+    python3 analyze_claude_sessions.py --jobs 8
 
-# Model name mapping (various formats to canonical)
-MODEL_MAP = {
-    "claude-opus-4-5": "claude-opus-4-5",
-    "claude-opus-4": "claude-opus-4-5",
-    "claude-opus": "claude-opus-4-5",
-    "claude-sonnet-4-5": "claude-sonnet-4-5",
-    "claude-sonnet-4": "claude-sonnet-4-5",
-    "claude-sonnet": "claude-sonnet-4-5",
-    "claude-sonnet-3-5": "claude-sonnet-3-5",
-    "claude-haiku-4-5": "claude-haiku-4-5",
-    "claude-haiku-3-5": "claude-haiku-3-5",
-    "claude-haiku": "claude-haiku-4-5",
-}
+    # Write a gzipped NDJSON export (one session per line) to a chosen path
+    python3 analyze_claude_sessions.py --export-format ndjson --gzip --output ~/claude-usage.ndjson.gz
 
+    # See where the time goes, and dump a call profile of the parse phase
+    python3 analyze_claude_sessions.py --profile --profile-out parse.prof
+    python3 -m pstats parse.prof
 
-def normalize_model_name(model: str) -> str:
-    """Normalize model name to canonical form."""
-    # Remove version suffixes like -20250929 or -20251101
-    base_model = re.sub(r'-20\d{6}$', '', model)
-    return MODEL_MAP.get(base_model, base_model)
-
-
-def calculate_cost(model: str, usage: Dict) -> float:
-    """Calculate cost for a given usage object."""
-    normalized_model = normalize_model_name(model)
-
-    if normalized_model not in PRICING:
-        # Skip synthetic model (internal Claude Code marker)
-        if normalized_model != "<synthetic>":
-            print(f"Warning: Unknown model {model} (normalized: {normalized_model}), using Sonnet 4.5 pricing")
-        normalized_model = "claude-sonnet-4-5"
-
-    pricing = PRICING[normalized_model]
-
-    input_tokens = usage.get("input_tokens", 0)
-    output_tokens = usage.get("output_tokens", 0)
-    cache_creation = usage.get("cache_creation_input_tokens", 0)
-    cache_read = usage.get("cache_read_input_tokens", 0)
-
-    cost = (
-        input_tokens * pricing["input"] +
-        output_tokens * pricing["output"] +
-        cache_creation * pricing["cache_write"] +
-        cache_read * pricing["cache_read"]
-    )
-
-    return cost
-
-
-def parse_session_file(session_path: Path) -> Tuple[Dict, List[Dict]]:
-    """Parse a session JSONL file and extract usage data."""
-    messages = []
-    session_data = {
-        "input_tokens": 0,
-        "output_tokens": 0,
-        "cache_creation_tokens": 0,
-        "cache_read_tokens": 0,
-        "max_context_per_turn": 0,
-        "total_context_all_turns": 0,
-        "turn_count": 0,
-        "turns_over_200k": 0,
-        "cost_by_model": defaultdict(float),
-        "tokens_by_model": defaultdict(lambda: {
-            "input": 0,
-            "output": 0,
-            "cache_creation": 0,
-            "cache_read": 0
-        })
-    }
+    # Prompt cache hit ratios, and which turns re-wrote the cache and what that cost
+    python3 analyze_claude_sessions.py --cache-efficiency --start-date 2026-01-01
 
-    try:
-        with open(session_path, 'r') as f:
-            for line in f:
-                if not line.strip():
-                    continue
-                try:
-                    msg = json.loads(line)
-                    messages.append(msg)
-
-                    # Extract usage data - it can be in msg.usage or msg.message.usage
-                    usage = None
-                    model = None
-
-                    if "usage" in msg:
-                        usage = msg["usage"]
-                        model = msg.get("model", "unknown")
-                    elif "message" in msg and isinstance(msg["message"], dict) and "usage" in msg["message"]:
-                        usage = msg["message"]["usage"]
-                        model = msg["message"].get("model", "unknown")
-
-                    if usage and model:
-                        normalized_model = normalize_model_name(model)
-
-                        input_tok = usage.get("input_tokens", 0)
-                        output_tok = usage.get("output_tokens", 0)
-                        cache_create = usage.get("cache_creation_input_tokens", 0)
-                        cache_read = usage.get("cache_read_input_tokens", 0)
-
-                        session_data["input_tokens"] += input_tok
-                        session_data["output_tokens"] += output_tok
-                        session_data["cache_creation_tokens"] += cache_create
-                        session_data["cache_read_tokens"] += cache_read
-
-                        # Track context size per turn
-                        turn_context = input_tok + cache_create + cache_read
-                        session_data["max_context_per_turn"] = max(session_data["max_context_per_turn"], turn_context)
-                        session_data["total_context_all_turns"] += turn_context
-                        session_data["turn_count"] += 1
-                        if turn_context > 200_000:
-                            session_data["turns_over_200k"] += 1
-
-                        # Track by model
-                        session_data["tokens_by_model"][normalized_model]["input"] += input_tok
-                        session_data["tokens_by_model"][normalized_model]["output"] += output_tok
-                        session_data["tokens_by_model"][normalized_model]["cache_creation"] += cache_create
-                        session_data["tokens_by_model"][normalized_model]["cache_read"] += cache_read
-
-                        # Calculate cost
-                        cost = calculate_cost(model, usage)
-                        session_data["cost_by_model"][normalized_model] += cost
-
-                except json.JSONDecodeError:
-                    continue
-    except Exception as e:
-        print(f"Error reading {session_path}: {e}")
-
-    return session_data, messages
-
-
-def format_number(num: int) -> str:
-    """Format large numbers with commas and k/M suffixes."""
-    if num >= 1_000_000:
-        return f"{num / 1_000_000:.1f}M"
-    elif num >= 1_000:
-        return f"{num / 1_000:.1f}k"
-    return str(num)
-
-
-def parse_date_filter(date_str: str) -> datetime:
-    """Parse date string in YYYY-MM-DD format to datetime with UTC timezone."""
-    try:
-        # Parse date and make it timezone-aware (UTC) at start of day
-        dt = datetime.strptime(date_str, "%Y-%m-%d")
-        return dt.replace(tzinfo=datetime.now().astimezone().tzinfo)
-    except ValueError:
-        raise ValueError(f"Invalid date format: {date_str}. Expected YYYY-MM-DD")
+    # Roughly what this quarter cost, with error bounds, from 5% of the sessions (check the bounds first)
+    python3 analyze_claude_sessions.py validate-sample
+    python3 analyze_claude_sessions.py --sample 0.05 --start-date 2026-01-01
 
+    # Which tools grow the context (and the bill) the most
+    python3 analyze_claude_sessions.py --by-tool
 
-def is_in_date_range(session_date_str: Optional[str], start_date: Optional[datetime], end_date: Optional[datetime]) -> bool:
-    """Check if a session date is within the specified range."""
-    if not session_date_str:
-        return True  # Include sessions with no date
+    # How long responses take and how fast tokens stream, per model and context size
+    python3 analyze_claude_sessions.py --latency
 
-    try:
-        session_date = datetime.fromisoformat(session_date_str.replace('Z', '+00:00'))
-    except:
-        return True  # Include sessions with invalid dates
-
-    if start_date and session_date < start_date:
-        return False
-    if end_date:
-        # Set end_date to end of day (23:59:59)
-        end_of_day = end_date.replace(hour=23, minute=59, second=59)
-        if session_date > end_of_day:
-            return False
+    # Count only the API turns made on Jan 20, even in sessions started earlier
+    python3 analyze_claude_sessions.py --start-date 2026-01-20 --end-date 2026-01-20 --filter-turns
 
-    return True
+    # Also write a columnar per-turn store, then re-aggregate it by hour
+    python3 analyze_claude_sessions.py --turns-out turns.bin
+    python3 analyze_claude_sessions.py turns turns.bin --by hour
 
+    # Load everything into SQLite, then ask questions without rescanning
+    python3 analyze_claude_sessions.py ingest
+    python3 analyze_claude_sessions.py query branch --days 30
+    python3 analyze_claude_sessions.py query session --order-by cache_write --limit 20
 
-def aggregate_by_day(sessions: List[Dict]) -> Dict[str, Dict]:
-    """Aggregate sessions by day."""
-    daily_data = defaultdict(lambda: {
-        "sessions": [],
-        "total_cost": 0.0,
-        "input_tokens": 0,
-        "output_tokens": 0,
-        "cache_read_tokens": 0,
-        "cache_creation_tokens": 0,
-        "max_context_per_turn": 0,
-        "total_turns": 0,
-        "turns_over_200k": 0,
-        "tokens_by_model": defaultdict(lambda: {
-            "input": 0,
-            "output": 0,
-            "cache_read": 0,
-            "cache_creation": 0
-        }),
-        "cost_by_model": defaultdict(float)
-    })
-
-    for session in sessions:
-        created = session.get("created")
-        if not created:
-            day_key = "Unknown"
-        else:
-            try:
-                dt = datetime.fromisoformat(created.replace('Z', '+00:00'))
-                day_key = dt.strftime("%Y-%m-%d")
-            except:
-                day_key = "Unknown"
-
-        daily = daily_data[day_key]
-        daily["sessions"].append(session)
-        daily["total_cost"] += session["total_cost"]
-        daily["input_tokens"] += session["usage"]["input_tokens"]
-        daily["output_tokens"] += session["usage"]["output_tokens"]
-        daily["cache_read_tokens"] += session["usage"]["cache_read_tokens"]
-        daily["cache_creation_tokens"] += session["usage"]["cache_creation_tokens"]
-        daily["max_context_per_turn"] = max(daily["max_context_per_turn"], session["usage"]["max_context_per_turn"])
-        daily["total_turns"] += session["usage"]["turn_count"]
-        daily["turns_over_200k"] += session["usage"]["turns_over_200k"]
-
-        # Aggregate by model
-        for model, tokens in session["usage"]["tokens_by_model"].items():
-            daily["tokens_by_model"][model]["input"] += tokens["input"]
-            daily["tokens_by_model"][model]["output"] += tokens["output"]
-            daily["tokens_by_model"][model]["cache_read"] += tokens["cache_read"]
-            daily["tokens_by_model"][model]["cache_creation"] += tokens["cache_creation"]
-
-        for model, cost in session["usage"]["cost_by_model"].items():
-            daily["cost_by_model"][model] += cost
-
-    return dict(daily_data)
-
-
-def analyze_all_sessions(start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, aggregate_by_day_flag: bool = False):
-    """Analyze all Claude Code sessions, optionally filtered by date range."""
-    claude_dir = Path.home() / ".claude"
-    projects_dir = claude_dir / "projects"
+    # Keep live totals for the waybar custom/claude module
+    python3 analyze_claude_sessions.py --watch
 
-    if not projects_dir.exists():
-        print(f"Error: Claude projects directory not found at {projects_dir}")
-        return
+    # Roll up several machines: write a shard on each, then merge them anywhere
+    python3 analyze_claude_sessions.py --shard-out ~/sync/claude-$(hostname).json.gz
+    python3 analyze_claude_sessions.py merge ~/sync/claude-*.json.gz --by month
 
-    all_sessions = []
+    # Compress sessions idle for 30 days and drop their archives after a year; the report
+    # then counts them from per-session rollups instead of rescanning them
+    python3 analyze_claude_sessions.py archive --older-than 30 --prune-after 365
 
-    # Find all project directories
-    for project_dir in projects_dir.iterdir():
-        if not project_dir.is_dir():
-            continue
+    # Browse usage by day, project, branch, model or session at http://127.0.0.1:8765/
+    python3 analyze_claude_sessions.py serve
 
-        index_file = project_dir / "sessions-index.json"
-        if not index_file.exists():
-            continue
+The script will:
+1. Scan ~/.claude/projects/ for all session files
+2. Parse token usage from each session (only bytes appended since the last run;
+   per-file aggregates are cached in ~/.cache/claude-sessions/parse-cache.json;
+   sessions archived with the archive command are read from their rollups)
+3. Calculate costs from claude_pricing.json (per-model prices with effective dates,
+   so older turns are priced at the rate in force at the time)
+4. Generate a detailed report to stdout
+5. Export full analysis to claude_sessions_analysis.json in current directory
+   (or --output; compact JSON or NDJSON with --export-format, gzipped with --gzip)
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies; the optional zstandard
+      module adds .zst archives)
+"""
 
-        # Load session index
+import argparse
+import cProfile
+import heapq
+import math
+import os
+import socket
+import sys
+import time
+from pathlib import Path
+from datetime import datetime, timezone
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple, Optional
+
+from claude_session_archive import ARCHIVE_AFTER_DAYS, archive_sessions
+from claude_session_cache import CacheEfficiencyAnalyzer, render_cache_efficiency
+from claude_session_db import DB_GROUP_COLUMNS, DB_ORDER_BY, default_db_file, ingest_sessions, query_sessions
+from claude_session_export import EXPORT_FORMATS, default_export_file, write_export
+from claude_session_index import SERVE_HOST, SERVE_INTERVAL, SERVE_PORT, serve_dashboard
+from claude_session_inventory import SessionInventory, plan_sessions
+from claude_session_latency import LatencyAnalyzer, render_latency
+from claude_session_pricing import PriceTable, price_table, price_tokens, set_price_table
+from claude_session_sample import SAMPLE_FRACTION, SAMPLE_Z, estimate_sessions, report_sample, validate_sample
+from claude_session_scan import (RecordSource, ScanStats, ShardCollector, UsageCounters, UsageRecord,
+                                 default_cache_file, end_of_day, format_number, hour_timestamp, is_archived,
+                                 is_in_date_range, load_parse_cache, parse_date_filter, parse_session_files,
+                                 parse_timestamp, save_parse_cache, session_file_id, set_scan_stats)
+from claude_session_shards import (add_shard_buckets, load_shard, merge_shard_sessions, shard_session_in_range,
+                                   shard_session_usages, write_shard)
+from claude_session_sketch import CONTEXT_HISTOGRAM_WIDTH, QuantileSketch, add_context_sketches, merge_sketches
+from claude_session_tools import ToolAttribution, render_tool_attribution
+from claude_session_turns import TurnStore, report_turn_store
+from claude_session_watch import default_waybar_file, watch_sessions
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import zstandard
+except ImportError:  # optional: only needed for .zst archives
+    zstandard = None
+
+# --group-by dimensions, with the width of their column in the breakdown
+GROUP_DIMENSIONS = {"project": 30, "git_branch": 20, "model": 20, "hour": 16, "day": 10, "week": 8, "month": 7,
+                    "session": 36, "subagent": 20}
+
+# --sort orders for the breakdown (largest first; "created" is newest first), as
+# (session sort key, bucket sort key) pairs
+REPORT_SORTS = {
+    "created": (lambda s: s.get("created") or "", lambda key, b: key),
+    "cost": (lambda s: s["total_cost"], lambda key, b: b["total_cost"]),
+    "context": (lambda s: s["usage"]["max_context_per_turn"], lambda key, b: b["max_context_per_turn"]),
+    "turns": (lambda s: s["usage"]["turn_count"], lambda key, b: b["total_turns"]),
+    "cache_write": (lambda s: s["usage"]["cache_creation_tokens"], lambda key, b: b["cache_creation_tokens"]),
+}
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Peak resident set size of this process and its worker processes, if known."""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Profiler:
+    """Wall-clock time per report phase plus the scanners' ScanStats, for --profile.
+
+    Phases are timed as laps: lap(name) charges the time since the previous
+    lap to name, so the report code only marks where each phase ends.
+    profile_calls() additionally runs a block under cProfile and dumps the
+    call statistics to pstats_file.
+    """
+
+    def __init__(self, pstats_file: Optional[Path] = None):
+        self.pstats_file = pstats_file
+        self.phases: Dict[str, float] = {}
+        self.stats = ScanStats()
+        self.started = self.last = time.perf_counter()
+
+    def lap(self, phase: str):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    @contextmanager
+    def profile_calls(self):
+        if self.pstats_file is None:
+            yield
+            return
+        calls = cProfile.Profile()
+        calls.enable()
         try:
-            with open(index_file, 'r') as f:
-                index_data = json.load(f)
-        except Exception as e:
-            print(f"Error reading {index_file}: {e}")
-            continue
+            yield
+        finally:
+            calls.disable()
+            try:
+                calls.dump_stats(str(self.pstats_file))
+            except OSError as e:
+                print(f"Warning: could not write {self.pstats_file}: {e}")
+                self.pstats_file = None
+
+    def to_dict(self) -> Dict:
+        """Phase timings (seconds) and counters, as embedded in the JSON export."""
+        return {
+            "phases": {phase: round(seconds, 6) for phase, seconds in self.phases.items()},
+            "total_seconds": round(self.last - self.started, 6),
+            "counters": dict(self.stats.counts),
+        }
+
+    def print_summary(self):
+        total = self.last - self.started
+        print(f"\n{'PROFILE':<30} {'Seconds':<12} {'Share':<12}")
+        print("-" * 120)
+        for phase, seconds in self.phases.items():
+            share = seconds / total * 100 if total else 0.0
+            print(f"  {phase:<28} {seconds:<12.3f} {share:.1f}%")
+        print(f"  {'total':<28} {total:<12.3f}")
+        print()
+        for field, value in self.stats.counts.items():
+            print(f"  {field.replace('_', ' ') + ':':<28} {value:,}")
+        parse_seconds = self.phases.get("parse", 0.0)
+        if parse_seconds:
+            megabytes = self.stats.counts["bytes_read"] / (1024 * 1024)
+            print(f"  {'parse throughput:':<28} {megabytes / parse_seconds:.1f} MB/s")
+        if self.pstats_file is not None:
+            print(f"  Parse phase call profile written to: {self.pstats_file.absolute()} "
+                  f"(view with python3 -m pstats)")
+
+
+def format_percentiles(percentiles: Dict[str, int]) -> str:
+    """Render {"p50": n, ...} as "p50=35.2k p90=80.1k p99=120.3k"."""
+    return " ".join(f"{name}={format_number(value)}" for name, value in percentiles.items())
+
+
+def build_session_info(entry: Dict, original_path: str, usage_data: UsageCounters,
+                       subagent_usages: List[Tuple[Path, UsageCounters]]) -> Dict:
+    """Combine a sessions-index entry with the parsed usage of its main and subagent files.
+
+    Token counters are merged first and priced once per (session, model).
+    Sessions missing from the index are marked "orphan" (see plan_sessions()).
+    """
+    subagents_list = []
+    for subagent_file, subagent_usage in subagent_usages:
+        tokens_by_model, cost_by_model = price_tokens(subagent_usage.by_price)
+        subagent_cost = sum(cost_by_model.values())
+        # Determine primary model for this subagent
+        primary_model = max(
+            cost_by_model.items(),
+            key=lambda x: x[1],
+            default=("unknown", 0)
+        )[0] if cost_by_model else "unknown"
+
+        subagents_list.append({
+            "id": session_file_id(subagent_file),  # agent-xxxxx
+            "model": primary_model,
+            "turns": subagent_usage["turn_count"],
+            "cost": subagent_cost,
+            "tokens_by_model": tokens_by_model,
+            "cost_by_model": cost_by_model,
+        })
 
-        entries = index_data.get("entries", [])
-        original_path = index_data.get("originalPath", "Unknown")
+        # Merge subagent usage into main session totals
+        usage_data += subagent_usage
+
+    usage = usage_data.usage()
+    total_cost = sum(usage["cost_by_model"].values())
+
+    return {
+        "session_id": entry.get("sessionId"),
+        "project_path": original_path,
+        "first_prompt": entry.get("firstPrompt", "")[:100],
+        "summary": entry.get("summary", ""),
+        "message_count": entry.get("messageCount", 0),
+        "created": entry.get("created"),
+        "modified": entry.get("modified"),
+        "git_branch": entry.get("gitBranch", ""),
+        "usage": usage,
+        "total_cost": total_cost,
+        "subagents": subagents_list,
+        **({"orphan": True} if entry.get("orphan") else {}),
+    }
 
-        # Process each session
-        for entry in entries:
-            session_id = entry.get("sessionId")
-            session_file = project_dir / f"{session_id}.jsonl"
 
-            if not session_file.exists():
+class GroupAggregator:
+    """Hash aggregation of API turns over any combination of GROUP_DIMENSIONS (--group-by).
+
+    Each record is counted into the one UsageCounters row of its group, a
+    tuple holding its value for every dimension, as it streams out of the
+    parser; nothing else is kept, so memory is O(groups x models) and any
+    pivot costs a single pass. Time dimensions use each record's own
+    timestamp (UTC), so a session running past midnight is split across the
+    days its turns fell on. Sessions are counted by remembering the first
+    and last session id seen in each group, which is exact because a
+    session's files are fed (and merged) contiguously. Acts as a collector
+    for parse_session_files(); cost is computed once per (group, price key).
+    """
+
+    TIME_DIMENSIONS = ("hour", "day", "week", "month")
+
+    def __init__(self, dimensions: Tuple[str, ...]):
+        self.dimensions = tuple(dimensions)
+        self._groups: Dict[Tuple[str, ...], Dict] = {}
+        self._week_keys = {}
+
+    def time_key(self, granularity: str, timestamp_str: Optional[str]) -> str:
+        """Hour/day/week/month label for a record timestamp (UTC), or "Unknown"."""
+        if not timestamp_str:
+            return "Unknown"
+        if timestamp_str.endswith("Z") and len(timestamp_str) >= 13 and timestamp_str[10] == "T":
+            # Common case: slice the label straight out of "YYYY-MM-DDTHH:MM:SS.fffZ"
+            if granularity == "hour":
+                return f"{timestamp_str[:10]} {timestamp_str[11:13]}:00"
+            if granularity == "day":
+                return timestamp_str[:10]
+            if granularity == "month":
+                return timestamp_str[:7]
+            key = self._week_keys.get(timestamp_str[:10])
+            if key is not None:
+                return key
+        timestamp = parse_timestamp(timestamp_str)
+        if timestamp is None:
+            return "Unknown"
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc)
+        if granularity == "hour":
+            return timestamp.strftime("%Y-%m-%d %H:00")
+        if granularity == "day":
+            return timestamp.strftime("%Y-%m-%d")
+        if granularity == "month":
+            return timestamp.strftime("%Y-%m")
+        iso_year, iso_week, _ = timestamp.isocalendar()
+        key = self._week_keys[timestamp.strftime("%Y-%m-%d")] = f"{iso_year}-W{iso_week:02d}"
+        return key
+
+    def _value(self, dimension: str, source: RecordSource, model: str, timestamp: Optional[str]) -> str:
+        if dimension in self.TIME_DIMENSIONS:
+            return self.time_key(dimension, timestamp)
+        if dimension == "model":
+            return model
+        if dimension == "project":
+            return source.project_path or "Unknown"
+        if dimension == "git_branch":
+            return source.git_branch or "(none)"
+        if dimension == "session":
+            return source.session_id or "Unknown"
+        return source.agent_id or "(main)"
+
+    def group_key(self, source: RecordSource, model: str, timestamp: Optional[str]) -> Tuple[str, ...]:
+        return tuple([self._value(dimension, source, model, timestamp) for dimension in self.dimensions])
+
+    @staticmethod
+    def _new_group() -> Dict:
+        return {"sessions": 0, "first_session": None, "last_session": None, "usage": UsageCounters()}
+
+    def _group(self, key: Tuple[str, ...], session_id: str) -> Dict:
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = self._new_group()
+        if not group["sessions"]:
+            group["first_session"] = session_id
+        if not group["sessions"] or group["last_session"] != session_id:
+            group["sessions"] += 1
+            group["last_session"] = session_id
+        return group
+
+    def add(self, record: UsageRecord):
+        group = self._group(self.group_key(record.source, record.model, record.timestamp), record.source.session_id)
+        group["usage"].add_turn(record.model, price_table().price_key(record.model, record.timestamp),
+                                record.input_tokens, record.output_tokens,
+                                record.cache_creation_tokens, record.cache_read_tokens)
+
+    def add_counts(self, source: RecordSource, timestamp: Optional[str], counters: List):
+        """Fold in pre-aggregated turns of one file, in ShardCollector's hour counter layout.
+
+        Like add(), a session's counts must be fed contiguously. When model
+        is a dimension an hour holding several models is split by model,
+        with each model's own turns over 200k.
+        """
+        tokens_by_model, context_by_model, over_by_model = counters[4], counters[5], counters[6]
+        if "model" not in self.dimensions or len(tokens_by_model) == 1:
+            model = next(iter(tokens_by_model), "unknown")
+            self._group(self.group_key(source, model, timestamp), source.session_id)["usage"].add_hour(
+                timestamp, counters)
+            return
+        for model, tokens in tokens_by_model.items():
+            sketch = QuantileSketch.from_json(context_by_model[model])
+            over = over_by_model.get(model, 0)
+            part = [len(sketch), tokens[0] + tokens[2] + tokens[3], sketch.max or 0, over,
+                    {model: tokens}, {model: context_by_model[model]}, {model: over} if over else {}]
+            self._group(self.group_key(source, model, timestamp), source.session_id)["usage"].add_hour(
+                timestamp, part)
+
+    def add_hours(self, source: RecordSource, hours: Dict[str, List]):
+        """Fold in the hour counters of one file (a shard's, or a parse cache entry's) with add_counts()."""
+        for hour, counters in hours.items():
+            self.add_counts(source, hour_timestamp(hour), counters)
+
+    def spawn(self) -> "GroupAggregator":
+        return GroupAggregator(self.dimensions)
+
+    def merge(self, other: "GroupAggregator"):
+        """Fold in the groups of a collector fed with the files that follow ours."""
+        for key, theirs in other._groups.items():
+            ours = self._groups.get(key)
+            if ours is None:
+                self._groups[key] = theirs
                 continue
+            sessions = theirs["sessions"]
+            if sessions and ours["sessions"] and ours["last_session"] == theirs["first_session"]:
+                sessions -= 1  # same session continued in the next file (e.g. a subagent)
+            if not ours["sessions"]:
+                ours["first_session"] = theirs["first_session"]
+            if theirs["sessions"]:
+                ours["last_session"] = theirs["last_session"]
+            ours["sessions"] += sessions
+            ours["usage"] += theirs["usage"]
+
+    def rows(self) -> Iterator[Tuple[Tuple[str, ...], Dict]]:
+        """(group key, totals including cost_by_model, total_cost and context percentiles) in the export shape."""
+        for key, group in self._groups.items():
+            usage = group["usage"].usage()
+            data = {"sessions": group["sessions"]}
+            for name in ("input_tokens", "output_tokens", "cache_read_tokens", "cache_creation_tokens",
+                         "max_context_per_turn", "total_context_all_turns"):
+                data[name] = usage[name]
+            data["total_turns"] = usage["turn_count"]
+            for name in ("turns_over_200k", "context_percentiles", "context_histogram", "tokens_by_model",
+                         "cost_by_model"):
+                data[name] = usage[name]
+            data["total_cost"] = sum(data["cost_by_model"].values())
+            yield key, data
+
+    def groups(self) -> Dict[str, Dict]:
+        """Group label (the values joined by " | ") -> the dimension values followed by the rows() totals."""
+        return {" | ".join(key): dict(zip(self.dimensions, key), **data) for key, data in self.rows()}
+
+
+class TimeBucketAggregator(GroupAggregator):
+    """Per-turn totals in hour/day/week/month buckets (--by): a GroupAggregator over one time dimension."""
+
+    GRANULARITIES = list(GroupAggregator.TIME_DIMENSIONS)
+    TITLES = {"hour": "HOURLY", "day": "DAILY", "week": "WEEKLY", "month": "MONTHLY"}
+
+    def __init__(self, by: str):
+        super().__init__((by,))
+        self.by = by
+
+    def spawn(self) -> "TimeBucketAggregator":
+        return TimeBucketAggregator(self.by)
+
+    def buckets(self) -> Dict[str, Dict]:
+        """Bucket label -> totals including cost_by_model, total_cost and context percentiles, in the export shape."""
+        return {key[0]: data for key, data in self.rows()}
+
+
+def merge_shards(shard_files: List[Path], shard_out: Optional[Path] = None, by: Optional[str] = None,
+                 sort_by: str = "created", limit: Optional[int] = None, offset: int = 0,
+                 output_file: Optional[Path] = None, export_format: str = "json", export_gzip: bool = False,
+                 group_by: Optional[Tuple[str, ...]] = None) -> bool:
+    """Combine per-host shards into one report without reading any transcript.
+
+    A session present in several shards is counted once (see
+    merge_shard_sessions()), so merging is associative and commutative:
+    shards, and shards of merged shards (shard_out), can be combined in any
+    order and grouping. Costs use the local price table. Returns False if a
+    shard could not be read.
+    """
+    sessions: Dict[str, Dict] = {}
+    hosts = []
+    signature = price_table().signature()
+    for shard_file in shard_files:
+        try:
+            shard = load_shard(shard_file)
+        except (OSError, ValueError) as e:
+            print(f"Error reading shard {shard_file}: {e}")
+            return False
+        hosts.extend(shard.get("hosts", []))
+        if shard.get("pricing") != signature:
+            print(f"Note: {shard_file} was written with another price table; pricing with the local one")
+        merge_shard_sessions(sessions, shard.get("sessions", []))
+
+    merged = sorted(sessions.values(), key=lambda session: session["session_id"] or "")
+    print(f"Merged {len(shard_files)} shard{'s' if len(shard_files) != 1 else ''} "
+          f"from {len(set(hosts))} host{'s' if len(set(hosts)) != 1 else ''}: {len(merged)} sessions")
+    if shard_out:
+        try:
+            write_shard(shard_out, merged, hosts)
+            print(f"Merged shard written to: {shard_out.absolute()}")
+        except OSError as e:
+            print(f"Error writing {shard_out}: {e}")
 
-            usage_data, messages = parse_session_file(session_file)
-
-            # Also scan subagent sessions if they exist
-            subagents_list = []
-            subagents_dir = project_dir / session_id / "subagents"
-            if subagents_dir.exists():
-                for subagent_file in sorted(subagents_dir.glob("agent-*.jsonl")):
-                    subagent_usage, _ = parse_session_file(subagent_file)
-                    subagent_cost = sum(subagent_usage["cost_by_model"].values())
-                    # Determine primary model for this subagent
-                    primary_model = max(
-                        subagent_usage["cost_by_model"].items(),
-                        key=lambda x: x[1],
-                        default=("unknown", 0)
-                    )[0] if subagent_usage["cost_by_model"] else "unknown"
-
-                    subagents_list.append({
-                        "id": subagent_file.stem,  # agent-xxxxx
-                        "model": primary_model,
-                        "turns": subagent_usage["turn_count"],
-                        "cost": subagent_cost,
-                        "tokens_by_model": dict(subagent_usage["tokens_by_model"]),
-                        "cost_by_model": dict(subagent_usage["cost_by_model"]),
-                    })
-
-                    # Merge subagent usage into main session totals
-                    usage_data["input_tokens"] += subagent_usage["input_tokens"]
-                    usage_data["output_tokens"] += subagent_usage["output_tokens"]
-                    usage_data["cache_creation_tokens"] += subagent_usage["cache_creation_tokens"]
-                    usage_data["cache_read_tokens"] += subagent_usage["cache_read_tokens"]
-                    usage_data["max_context_per_turn"] = max(
-                        usage_data["max_context_per_turn"],
-                        subagent_usage["max_context_per_turn"]
-                    )
-                    usage_data["total_context_all_turns"] += subagent_usage["total_context_all_turns"]
-                    usage_data["turn_count"] += subagent_usage["turn_count"]
-                    usage_data["turns_over_200k"] += subagent_usage["turns_over_200k"]
-                    # Merge model-specific data
-                    for model, tokens in subagent_usage["tokens_by_model"].items():
-                        usage_data["tokens_by_model"][model]["input"] += tokens["input"]
-                        usage_data["tokens_by_model"][model]["output"] += tokens["output"]
-                        usage_data["tokens_by_model"][model]["cache_creation"] += tokens["cache_creation"]
-                        usage_data["tokens_by_model"][model]["cache_read"] += tokens["cache_read"]
-                    for model, cost in subagent_usage["cost_by_model"].items():
-                        usage_data["cost_by_model"][model] += cost
-
-            # Calculate total cost
-            total_cost = sum(usage_data["cost_by_model"].values())
-
-            session_info = {
-                "session_id": session_id,
-                "project_path": original_path,
-                "first_prompt": entry.get("firstPrompt", "")[:100],
-                "summary": entry.get("summary", ""),
-                "message_count": entry.get("messageCount", 0),
-                "created": entry.get("created"),
-                "modified": entry.get("modified"),
-                "git_branch": entry.get("gitBranch", ""),
-                "usage": usage_data,
-                "total_cost": total_cost,
-                "subagents": subagents_list,
-            }
-
-            # Filter by date range if specified
-            if is_in_date_range(session_info["created"], start_date, end_date):
-                all_sessions.append(session_info)
+    all_sessions = []
+    context_by_model: Dict[str, QuantileSketch] = {}
+    bucket_aggregator = GroupAggregator(group_by) if group_by else TimeBucketAggregator(by) if by else None
+    for session in merged:
+        usage_data, subagent_usages = shard_session_usages(session)
+        add_context_sketches(context_by_model, [usage_data] + [usage for _, usage in subagent_usages])
+        if bucket_aggregator is not None:
+            add_shard_buckets(bucket_aggregator, session)
+            continue
+        entry = dict(session["entry"], sessionId=session["session_id"])
+        all_sessions.append(build_session_info(entry, session["project_path"], usage_data, subagent_usages))
+    all_sessions.sort(key=lambda x: x.get("created") or "", reverse=True)
+
+    buckets = None
+    if bucket_aggregator is not None:
+        buckets = bucket_aggregator.groups() if group_by else bucket_aggregator.buckets()
+    report_analysis(all_sessions, buckets, len(merged), by, sort_by=sort_by, limit=limit, offset=offset,
+                    output_file=output_file, export_format=export_format, export_gzip=export_gzip,
+                    context_by_model=context_by_model, group_by=group_by)
+    return True
 
-    # Sort by creation date (newest first)
-    all_sessions.sort(key=lambda x: x.get("created", ""), reverse=True)
 
+def select_page(items: List, key: Callable, offset: int = 0, limit: Optional[int] = None) -> List:
+    """items[offset:offset + limit] in descending key order.
+
+    A limit selects with a bounded heap (heapq.nlargest), so only
+    offset + limit items are ever ordered and kept; ties keep input order.
+    """
+    if limit is None:
+        return sorted(items, key=key, reverse=True)[offset:]
+    return heapq.nlargest(offset + limit, items, key=key)[offset:]
+
+
+def _render_model_table(lines: List[str], data: Dict, total_cost: float):
+    """Append the per-model token table of a session or bucket to lines."""
+    lines.append(f"    {'-' * 100}")
+    for model, tokens in data["tokens_by_model"].items():
+        cost = data["cost_by_model"][model]
+        lines.append(f"    {model:<20} {format_number(tokens['input']):<12} {format_number(tokens['output']):<12} "
+                     f"{format_number(tokens['cache_read']):<12} {format_number(tokens['cache_creation']):<12} ${cost:.4f}")
+    lines.append(f"    {'-' * 100}")
+    lines.append(f"    {'TOTAL':<20} {format_number(data['input_tokens']):<12} {format_number(data['output_tokens']):<12} "
+                 f"{format_number(data['cache_read_tokens']):<12} {format_number(data['cache_creation_tokens']):<12} "
+                 f"${total_cost:.4f}")
+
+
+def render_bucket(lines: List[str], bucket: str, data: Dict):
+    """Append the breakdown of one time bucket to lines."""
+    bucket_sessions = data["sessions"]
+    lines.append(f"\n{bucket} ({bucket_sessions} session{'s' if bucket_sessions != 1 else ''}) "
+                 f"| peak ctx: {format_number(data['max_context_per_turn'])} "
+                 f"| ctx {format_percentiles(data['context_percentiles'])} | turns: {data['total_turns']}"
+                 + (f" | ⚠ {data['turns_over_200k']} over 200k" if data["turns_over_200k"] > 0 else ""))
+    lines.append(f"    {'Model':<20} {'Input':<12} {'Output':<12} {'Cache Read':<12} {'Cache Write':<12} {'Cost':<12}")
+    _render_model_table(lines, data, data["total_cost"])
+
+
+def render_group_header(lines: List[str], dimensions: Tuple[str, ...]):
+    """Append the column titles of the --group-by breakdown to lines."""
+    names = " ".join(f"{dimension.replace('_', ' ').title():<{GROUP_DIMENSIONS[dimension]}}" for dimension in dimensions)
+    lines.append(f"  {names} {'Sessions':>8} {'Turns':>7}  {'Input':<10} {'Output':<10} {'Cache Read':<10} "
+                 f"{'Cache Write':<11} {'Peak ctx':<9} {'Cost':<12}")
+
+
+def render_group(lines: List[str], dimensions: Tuple[str, ...], data: Dict):
+    """Append one row of the --group-by breakdown (a GroupAggregator.groups() value) to lines."""
+    cells = []
+    for dimension in dimensions:
+        width = GROUP_DIMENSIONS[dimension]
+        value = data[dimension]
+        if dimension == "project":
+            value = Path(value).name or value
+        cells.append(f"{value[:width]:<{width}}")
+    lines.append(f"  {' '.join(cells)} {data['sessions']:>8} {data['total_turns']:>7}  "
+                 f"{format_number(data['input_tokens']):<10} {format_number(data['output_tokens']):<10} "
+                 f"{format_number(data['cache_read_tokens']):<10} {format_number(data['cache_creation_tokens']):<11} "
+                 f"{format_number(data['max_context_per_turn']):<9} ${data['total_cost']:.4f}")
+
+
+def render_session(lines: List[str], idx: int, session: Dict):
+    """Append the breakdown of one session (numbered idx) to lines."""
+    usage = session["usage"]
+    created = session["created"]
+    if created:
+        try:
+            dt = datetime.fromisoformat(created.replace('Z', '+00:00'))
+            date_str = dt.strftime("%Y-%m-%d %H:%M")
+        except:
+            date_str = created[:16]
+    else:
+        date_str = "Unknown"
+
+    lines.append(f"\n[{idx}] Session: {session['session_id'][:8]}...")
+    lines.append(f"    Project: {session['project_path']}")
+    lines.append(f"    Created: {date_str}")
+    if session['git_branch']:
+        lines.append(f"    Branch: {session['git_branch']}")
+    lines.append(f"    Messages: {session['message_count']}")
+    avg_ctx = usage["total_context_all_turns"] // usage["turn_count"] if usage["turn_count"] else 0
+    lines.append(f"    Context:  max={format_number(usage['max_context_per_turn'])} avg={format_number(avg_ctx)} "
+                 f"{format_percentiles(usage['context_percentiles'])} turns={usage['turn_count']}"
+                 + (f" ⚠ {usage['turns_over_200k']} turns over 200k" if usage["turns_over_200k"] > 0 else ""))
+    if session['first_prompt']:
+        lines.append(f"    First prompt: {session['first_prompt']}...")
+
+    lines.append(f"\n    {'Model':<20} {'Input':<12} {'Output':<12} {'Cache Read':<12} {'Cache Write':<12} {'Cost':<12}")
+    _render_model_table(lines, usage, session["total_cost"])
+
+    # Show subagents if any
+    if session.get("subagents"):
+        lines.append(f"\n    Subagents ({len(session['subagents'])}):")
+        for sa in session["subagents"]:
+            lines.append(f"      - {sa['id']}: {sa['model']} | {sa['turns']} turns | ${sa['cost']:.4f}")
+
+
+def report_analysis(all_sessions: List[Dict], buckets: Optional[Dict[str, Dict]], session_count: int,
+                    by: Optional[str] = None, start_date: Optional[datetime] = None,
+                    end_date: Optional[datetime] = None, sort_by: str = "created", limit: Optional[int] = None,
+                    offset: int = 0, output_file: Optional[Path] = None, export_format: str = "json",
+                    export_gzip: bool = False, profiler: Optional[Profiler] = None,
+                    context_by_model: Optional[Dict[str, QuantileSketch]] = None,
+                    cache_efficiency: Optional[Dict] = None, tool_attribution: Optional[Dict] = None,
+                    latency: Optional[Dict] = None, group_by: Optional[Tuple[str, ...]] = None):
+    """Print the report for analyzed sessions (or time buckets, when by is set) and write the export.
+
+    all_sessions are build_session_info() dicts, newest first; buckets are
+    TimeBucketAggregator.buckets(), or GroupAggregator.groups() when
+    group_by names its dimensions. context_by_model holds the context size
+    sketch of every counted turn per model, for the overall and per-model
+    percentiles. cache_efficiency, a CacheEfficiencyAnalyzer.summary(), adds
+    the prompt cache section and tool_attribution, a
+    ToolAttribution.summary(), the per-tool section and latency, a
+    LatencyAnalyzer.summary(), the latency and throughput section. Used by
+    analyze_all_sessions() and by the merge command.
+    See analyze_all_sessions() for the remaining arguments.
+    """
     # Print report
     print("=" * 120)
     print("CLAUDE CODE SESSION ANALYSIS")
@@ -426,15 +671,22 @@ def analyze_all_sessions(start_date: Optional[datetime] = None, end_date: Option
             date_range.append(f"To: {end_date.strftime('%Y-%m-%d')}")
         print(f"Date Range: {' | '.join(date_range)}")
     print("=" * 120)
-    print(f"\nTotal sessions found: {len(all_sessions)}")
+    print(f"\nTotal sessions found: {session_count}")
     print()
 
-    # Overall statistics
-    total_cost = sum(s["total_cost"] for s in all_sessions)
-    total_input = sum(s["usage"]["input_tokens"] for s in all_sessions)
-    total_output = sum(s["usage"]["output_tokens"] for s in all_sessions)
-    total_cache_read = sum(s["usage"]["cache_read_tokens"] for s in all_sessions)
-    total_cache_create = sum(s["usage"]["cache_creation_tokens"] for s in all_sessions)
+    # Overall statistics, summed over the time buckets when sessions were not kept
+    if buckets is not None:
+        usages = list(buckets.values())
+        total_cost = sum(b["total_cost"] for b in usages)
+        total_turns = sum(b["total_turns"] for b in usages)
+    else:
+        usages = [s["usage"] for s in all_sessions]
+        total_cost = sum(s["total_cost"] for s in all_sessions)
+        total_turns = sum(u["turn_count"] for u in usages)
+    total_input = sum(u["input_tokens"] for u in usages)
+    total_output = sum(u["output_tokens"] for u in usages)
+    total_cache_read = sum(u["cache_read_tokens"] for u in usages)
+    total_cache_create = sum(u["cache_creation_tokens"] for u in usages)
 
     print(f"{'OVERALL TOTALS':<30} {'Input':<12} {'Output':<12} {'Cache Read':<12} {'Cache Write':<12} {'Cost':<12}")
     print("-" * 120)
@@ -443,10 +695,9 @@ def analyze_all_sessions(start_date: Optional[datetime] = None, end_date: Option
     print()
 
     # Context size statistics
-    max_context = max((s["usage"]["max_context_per_turn"] for s in all_sessions), default=0)
-    total_turns = sum(s["usage"]["turn_count"] for s in all_sessions)
-    total_context_sum = sum(s["usage"]["total_context_all_turns"] for s in all_sessions)
-    total_over_200k = sum(s["usage"]["turns_over_200k"] for s in all_sessions)
+    max_context = max((u["max_context_per_turn"] for u in usages), default=0)
+    total_context_sum = sum(u["total_context_all_turns"] for u in usages)
+    total_over_200k = sum(u["turns_over_200k"] for u in usages)
     avg_context = total_context_sum // total_turns if total_turns else 0
 
     print(f"{'CONTEXT WINDOW ANALYSIS':<30} (base context: 200k tokens)")
@@ -456,94 +707,89 @@ def analyze_all_sessions(start_date: Optional[datetime] = None, end_date: Option
     print(f"  Total API turns:              {total_turns}")
     print(f"  Turns exceeding 200k:         {total_over_200k}" +
           (f"  ⚠ Extended context used!" if total_over_200k > 0 else ""))
+
+    # Context size distribution, overall and per model
+    context_by_model = context_by_model or {}
+    context = merge_sketches(context_by_model.values())
+    print(f"  Context percentiles:          {format_percentiles(context.percentiles())}")
+    for model in sorted(context_by_model, key=lambda m: len(context_by_model[m]), reverse=True):
+        sketch = context_by_model[model]
+        print(f"    {model + ':':<27} {format_percentiles(sketch.percentiles())}  ({len(sketch)} turns)")
+    histogram = context.histogram_buckets()
+    if histogram:
+        print(f"  Context histogram (turns per {CONTEXT_HISTOGRAM_WIDTH // 1000}k tokens):")
+        peak = max(histogram.values())
+        for label, turns in histogram.items():
+            print(f"    {label:<14} {turns:>8}  {'#' * max(1, round(turns / peak * 60))}")
     print()
 
-    # Breakdown (by day or by session)
-    print("\n" + "=" * 120)
-    if aggregate_by_day_flag:
-        print("DAILY BREAKDOWN")
-        print("=" * 120)
+    if cache_efficiency is not None:
+        lines = []
+        render_cache_efficiency(lines, cache_efficiency)
+        sys.stdout.write("\n".join(lines) + "\n\n")
 
-        daily_data = aggregate_by_day(all_sessions)
-        # Sort by date (newest first)
-        sorted_days = sorted(daily_data.keys(), reverse=True)
+    if tool_attribution is not None:
+        lines = []
+        render_tool_attribution(lines, tool_attribution)
+        sys.stdout.write("\n".join(lines) + "\n\n")
 
-        for day in sorted_days:
-            data = daily_data[day]
-            session_count = len(data["sessions"])
+    if latency is not None:
+        lines = []
+        render_latency(lines, latency)
+        sys.stdout.write("\n".join(lines) + "\n\n")
 
-            print(f"\n{day} ({session_count} session{'s' if session_count != 1 else ''}) "
-                  f"| peak ctx: {format_number(data['max_context_per_turn'])} | turns: {data['total_turns']}"
-                  + (f" | ⚠ {data['turns_over_200k']} over 200k" if data["turns_over_200k"] > 0 else ""))
-            print(f"    {'Model':<20} {'Input':<12} {'Output':<12} {'Cache Read':<12} {'Cache Write':<12} {'Cost':<12}")
-            print(f"    {'-' * 100}")
+    # Breakdown (by group, by day or by session), rendered into one buffer and written at once
+    print("\n" + "=" * 120)
+    lines = []
+    if buckets is not None and group_by:
+        print(f"BREAKDOWN BY {', '.join(group_by).upper()}")
+        print("=" * 120)
 
-            for model, tokens in data["tokens_by_model"].items():
-                cost = data["cost_by_model"][model]
-                print(f"    {model:<20} {format_number(tokens['input']):<12} {format_number(tokens['output']):<12} "
-                      f"{format_number(tokens['cache_read']):<12} {format_number(tokens['cache_creation']):<12} ${cost:.4f}")
+        bucket_key = REPORT_SORTS[sort_by][1]
+        shown = select_page(list(buckets.keys()), lambda group: bucket_key(group, buckets[group]), offset, limit)
+        render_group_header(lines, group_by)
+        for group in shown:
+            render_group(lines, group_by, buckets[group])
+        total_shown = len(buckets)
+
+    elif buckets is not None:
+        print(f"{TimeBucketAggregator.TITLES[by]} BREAKDOWN")
+        print("=" * 120)
 
-            print(f"    {'-' * 100}")
-            print(f"    {'TOTAL':<20} {format_number(data['input_tokens']):<12} {format_number(data['output_tokens']):<12} "
-                  f"{format_number(data['cache_read_tokens']):<12} {format_number(data['cache_creation_tokens']):<12} "
-                  f"${data['total_cost']:.4f}")
+        # Sort by bucket (newest first) unless another order was asked for
+        bucket_key = REPORT_SORTS[sort_by][1]
+        shown = select_page(list(buckets.keys()), lambda bucket: bucket_key(bucket, buckets[bucket]), offset, limit)
+        for bucket in shown:
+            render_bucket(lines, bucket, buckets[bucket])
+        total_shown = len(buckets)
 
     else:
         print("PER-SESSION BREAKDOWN")
         print("=" * 120)
 
-        for idx, session in enumerate(all_sessions, 1):
-            usage = session["usage"]
-            created = session["created"]
-            if created:
-                try:
-                    dt = datetime.fromisoformat(created.replace('Z', '+00:00'))
-                    date_str = dt.strftime("%Y-%m-%d %H:%M")
-                except:
-                    date_str = created[:16]
-            else:
-                date_str = "Unknown"
-
-            print(f"\n[{idx}] Session: {session['session_id'][:8]}...")
-            print(f"    Project: {session['project_path']}")
-            print(f"    Created: {date_str}")
-            if session['git_branch']:
-                print(f"    Branch: {session['git_branch']}")
-            print(f"    Messages: {session['message_count']}")
-            avg_ctx = usage["total_context_all_turns"] // usage["turn_count"] if usage["turn_count"] else 0
-            print(f"    Context:  max={format_number(usage['max_context_per_turn'])} avg={format_number(avg_ctx)} turns={usage['turn_count']}"
-                  + (f" ⚠ {usage['turns_over_200k']} turns over 200k" if usage["turns_over_200k"] > 0 else ""))
-            if session['first_prompt']:
-                print(f"    First prompt: {session['first_prompt']}...")
-
-            print(f"\n    {'Model':<20} {'Input':<12} {'Output':<12} {'Cache Read':<12} {'Cache Write':<12} {'Cost':<12}")
-            print(f"    {'-' * 100}")
-
-            for model, tokens in usage["tokens_by_model"].items():
-                cost = usage["cost_by_model"][model]
-                print(f"    {model:<20} {format_number(tokens['input']):<12} {format_number(tokens['output']):<12} "
-                      f"{format_number(tokens['cache_read']):<12} {format_number(tokens['cache_creation']):<12} ${cost:.4f}")
-
-            print(f"    {'-' * 100}")
-            print(f"    {'TOTAL':<20} {format_number(usage['input_tokens']):<12} {format_number(usage['output_tokens']):<12} "
-                  f"{format_number(usage['cache_read_tokens']):<12} {format_number(usage['cache_creation_tokens']):<12} "
-                  f"${session['total_cost']:.4f}")
-
-            # Show subagents if any
-            if session.get("subagents"):
-                print(f"\n    Subagents ({len(session['subagents'])}):")
-                for sa in session["subagents"]:
-                    print(f"      - {sa['id']}: {sa['model']} | {sa['turns']} turns | ${sa['cost']:.4f}")
+        shown = select_page(all_sessions, REPORT_SORTS[sort_by][0], offset, limit)
+        for idx, session in enumerate(shown, offset + 1):
+            render_session(lines, idx, session)
+        total_shown = len(all_sessions)
+
+    if offset or limit is not None or sort_by != "created":
+        what = "groups" if group_by else "buckets" if buckets is not None else "sessions"
+        lines.append(f"\nShowing {what} {offset + 1}-{offset + len(shown)} of {total_shown} by {sort_by}"
+                     if shown else f"\nNo {what} to show (offset {offset} of {total_shown})")
+    if lines:
+        sys.stdout.write("\n".join(lines) + "\n")
 
     print("\n" + "=" * 120)
     print(f"GRAND TOTAL COST: ${total_cost:.4f}")
     print("=" * 120)
+    if profiler:
+        profiler.lap("report")
 
-    # Export to JSON
-    output_file = Path.cwd() / "claude_sessions_analysis.json"
+    # Export to JSON, streamed one session or bucket at a time
+    output_file = output_file or default_export_file(export_format, export_gzip)
     export_data = {
         "generated_at": datetime.now().isoformat(),
-        "total_sessions": len(all_sessions),
+        "total_sessions": session_count,
         "total_cost": total_cost,
         "total_tokens": {
             "input": total_input,
@@ -556,19 +802,260 @@ def analyze_all_sessions(start_date: Optional[datetime] = None, end_date: Option
             "avg_context_per_turn": avg_context,
             "total_api_turns": total_turns,
             "turns_over_200k": total_over_200k,
+            **context.summary(),
+            "by_model": {model: dict(sketch.summary(), turns=len(sketch))
+                         for model, sketch in context_by_model.items()},
         },
     }
 
-    if aggregate_by_day_flag:
-        export_data["aggregated_by"] = "day"
-        export_data["daily_data"] = aggregate_by_day(all_sessions)
+    if group_by:
+        export_data["grouped_by"] = list(group_by)
+    elif buckets is not None:
+        export_data["aggregated_by"] = by
+    if cache_efficiency is not None:
+        export_data["cache_efficiency"] = cache_efficiency
+    if tool_attribution is not None:
+        export_data["tool_attribution"] = tool_attribution
+    if latency is not None:
+        export_data["latency"] = latency
+    if profiler:
+        # Covers every phase up to the report; the export's own time is only printed
+        export_data["profile"] = profiler.to_dict()
+
+    try:
+        if buckets is not None:
+            write_export(output_file, export_data, "groups" if group_by else "buckets", buckets, export_format,
+                         export_gzip)
+        else:
+            write_export(output_file, export_data, "sessions", all_sessions, export_format, export_gzip)
+        print(f"\nDetailed analysis exported to: {output_file.absolute()}")
+    except OSError as e:
+        print(f"\nError writing {output_file}: {e}")
+
+
+def analyze_all_sessions(start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, by: Optional[str] = None,
+                         cache_file: Optional[Path] = None, jobs: int = 1, filter_turns: bool = False,
+                         turns_out: Optional[Path] = None, profiler: Optional[Profiler] = None,
+                         output_file: Optional[Path] = None, export_format: str = "json",
+                         export_gzip: bool = False, sort_by: str = "created",
+                         limit: Optional[int] = None, offset: int = 0, shard_out: Optional[Path] = None,
+                         cache_efficiency: bool = False, by_tool: bool = False, latency: bool = False,
+                         use_rollups: bool = True, group_by: Optional[Tuple[str, ...]] = None,
+                         sample: Optional[float] = None):
+    """Analyze all Claude Code sessions, optionally filtered by date range.
+
+    When cache_file is given, per-file aggregates are persisted there and only
+    the bytes appended since the previous run are decoded. jobs > 1 parses
+    files in a process pool. filter_turns applies the date range to each
+    usage record's own timestamp instead of the session creation date.
+    turns_out writes a columnar TurnStore with one row per API turn.
+    by (hour, day, week or month) replaces the per-session breakdown with
+    per-turn time buckets, aggregated while parsing without keeping sessions.
+    group_by, a tuple of GROUP_DIMENSIONS, does the same for any
+    combination of dimensions (see GroupAggregator) and takes precedence
+    over by.
+    profiler, if given, times each phase and counts what the scanners read;
+    the summary is printed at the end and embedded in the export.
+    The export goes to output_file (default: claude_sessions_analysis.json
+    in the current directory) in export_format, gzipped with export_gzip;
+    see write_export().
+    The breakdown shows the sessions (or buckets) ranked offset..offset+limit
+    by sort_by (a REPORT_SORTS key); totals and the export always cover
+    everything.
+    shard_out writes this host's sessions as a partial aggregate shard for
+    the merge command (collected per record, so it bypasses the parse cache).
+    cache_efficiency adds the prompt cache hit ratios and cache-bust report
+    (see CacheEfficiencyAnalyzer; also bypasses the parse cache).
+    by_tool adds the per-tool context and output attribution (see
+    ToolAttribution; reads message content, so it also bypasses the parse
+    cache).
+    latency adds response latency and output throughput percentiles (see
+    LatencyAnalyzer; reads every record's timestamp, so likewise).
+    Sessions archived by the archive command are counted from their
+    rollups, to the hour, without opening the archive, unless use_rollups
+    is off or turns_out, cache_efficiency, by_tool or latency need their
+    individual turns.
+    Sessions whose archive was pruned are always counted from the rollup.
+    sample (a fraction, 0 to 1) only estimates the totals, per model too,
+    with confidence intervals, from a deterministic sample of sessions and
+    of the chunks of large files (see estimate_sessions()); the other
+    report options do not apply.
+    """
+    claude_dir = Path.home() / ".claude"
+    projects_dir = claude_dir / "projects"
+
+    if not projects_dir.exists():
+        print(f"Error: Claude projects directory not found at {projects_dir}")
+        return
+
+    if profiler:
+        set_scan_stats(profiler.stats)
+    cache = load_parse_cache(cache_file) if cache_file and not sample else None
+    if profiler:
+        profiler.lap("load cache")
+    all_sessions = []
+    rollups: Dict[str, Dict] = {}
+    inventory = SessionInventory(projects_dir)
+    planned = plan_sessions(projects_dir, start_date, end_date, filter_turns, rollups, inventory)
+    if sample:
+        started = time.perf_counter()
+        estimate, info = estimate_sessions(planned, rollups, inventory, sample)
+        report_sample(estimate, info, time.perf_counter() - started, output_file, export_format, export_gzip)
+        return
+
+    time_range = None
+    if filter_turns and (start_date or end_date):
+        time_range = (start_date, end_of_day(end_date).replace(microsecond=999999) if end_date else None)
+
+    # Archived sessions are counted from their rollups unless their turns are needed one by one
+    use_rollups = use_rollups and not (turns_out or cache_efficiency or by_tool or latency)
+    session_rollups = []
+    for entry, original_path, session_file, subagent_files in planned:
+        rollup = rollups.get(entry.get("sessionId"))
+        if session_file is not None and not (use_rollups and is_archived(session_file)):
+            rollup = None
+        session_rollups.append(shard_session_in_range(rollup, time_range) if rollup is not None else None)
+    rollup_only = sum(1 for _, _, session_file, _ in planned if session_file is None)
+    if profiler:
+        profiler.stats.add(sessions_rolled_up=sum(1 for rollup in session_rollups if rollup is not None))
+
+    # Parse every other file (possibly in parallel); results come back in submission order
+    all_files = []
+    sources = []
+    for (entry, original_path, session_file, subagent_files), rollup in zip(planned, session_rollups):
+        if rollup is not None:
+            continue
+        source = RecordSource(entry.get("sessionId"), original_path, entry.get("gitBranch", ""), None)
+        all_files.append(session_file)
+        sources.append(source)
+        for subagent_file in subagent_files:
+            all_files.append(subagent_file)
+            sources.append(source._replace(agent_id=session_file_id(subagent_file)))
+
+    file_stats = [inventory.stat(path) for path in all_files]
+
+    collectors = []
+    bucket_aggregator = None
+    if group_by:
+        bucket_aggregator = GroupAggregator(group_by)
+        collectors.append(bucket_aggregator)
+    elif by:
+        bucket_aggregator = TimeBucketAggregator(by)
+        collectors.append(bucket_aggregator)
+    turn_store = None
+    if turns_out:
+        turn_store = TurnStore()
+        collectors.append(turn_store)
+    shard_collector = None
+    if shard_out:
+        shard_collector = ShardCollector()
+        collectors.append(shard_collector)
+    cache_analyzer = None
+    if cache_efficiency:
+        cache_analyzer = CacheEfficiencyAnalyzer()
+        collectors.append(cache_analyzer)
+    tool_attribution = None
+    if by_tool:
+        tool_attribution = ToolAttribution()
+        collectors.append(tool_attribution)
+    latency_analyzer = None
+    if latency:
+        latency_analyzer = LatencyAnalyzer()
+        collectors.append(latency_analyzer)
+    shard_sessions = []
+
+    if profiler:
+        profiler.lap("plan")
+        with profiler.profile_calls():
+            parsed = deque(parse_session_files(all_files, cache, jobs, time_range, collectors, sources, file_stats))
+        profiler.lap("parse")
     else:
-        export_data["sessions"] = all_sessions
+        parsed = deque(parse_session_files(all_files, cache, jobs, time_range, collectors, sources, file_stats))
+    session_count = 0
+    orphans = 0
+    context_by_model: Dict[str, QuantileSketch] = {}
+
+    # Each file's counters are popped as its session is built, so they are freed once merged and priced
+    for (entry, original_path, session_file, subagent_files), rollup in zip(planned, session_rollups):
+        if rollup is not None:
+            usage_data, subagent_usages = shard_session_usages(rollup)
+            if bucket_aggregator is not None:
+                add_shard_buckets(bucket_aggregator, rollup)
+        else:
+            usage_data = parsed.popleft()
+            subagent_usages = [(subagent_file, parsed.popleft()) for subagent_file in subagent_files]
 
-    with open(output_file, 'w') as f:
-        json.dump(export_data, f, indent=2, default=str)
+        # Sessions straddling the range are kept only if some turns (main or subagent) fell inside it
+        if time_range and not is_in_date_range(entry.get("created"), start_date, end_date) and not (
+                usage_data["turn_count"] + sum(usage["turn_count"] for _, usage in subagent_usages)):
+            continue
+        add_context_sketches(context_by_model, [usage_data] + [usage for _, usage in subagent_usages])
+        session_info = build_session_info(entry, original_path, usage_data, subagent_usages)
+        session_count += 1
+        orphans += bool(entry.get("orphan"))
+        if bucket_aggregator is None:
+            all_sessions.append(session_info)
+        if shard_collector is not None:
+            shard_sessions.append(rollup if rollup is not None else
+                                  shard_collector.shard_session(entry, original_path, subagent_files))
+
+    # Sort by creation date (newest first)
+    all_sessions.sort(key=lambda x: x.get("created") or "", reverse=True)
+    if profiler:
+        set_scan_stats(None)
+        profiler.lap("merge sessions")
 
-    print(f"\nDetailed analysis exported to: {output_file.absolute()}")
+    if cache is not None:
+        save_parse_cache(cache_file, cache)
+        if profiler:
+            profiler.lap("save cache")
+
+    if turn_store is not None:
+        try:
+            turn_store.save(turns_out)
+        except OSError as e:
+            print(f"Error writing {turns_out}: {e}")
+            turn_store = None
+        if profiler:
+            profiler.lap("save turn store")
+
+    if shard_collector is not None:
+        try:
+            write_shard(shard_out, shard_sessions, [socket.gethostname()])
+        except OSError as e:
+            print(f"Error writing {shard_out}: {e}")
+            shard_collector = None
+        if profiler:
+            profiler.lap("save shard")
+
+    buckets = None
+    if bucket_aggregator is not None:
+        buckets = bucket_aggregator.groups() if group_by else bucket_aggregator.buckets()
+        if profiler:
+            profiler.lap("aggregate buckets")
+
+    report_analysis(all_sessions, buckets, session_count, by, start_date, end_date, sort_by, limit, offset,
+                    output_file, export_format, export_gzip, profiler, context_by_model,
+                    cache_analyzer.summary() if cache_analyzer is not None else None,
+                    tool_attribution.summary() if tool_attribution is not None else None,
+                    latency_analyzer.summary() if latency_analyzer is not None else None, group_by)
+    if turn_store is not None:
+        print(f"Per-turn store ({len(turn_store)} turns) written to: {turns_out.absolute()}")
+    if shard_collector is not None:
+        print(f"Shard ({len(shard_sessions)} sessions) written to: {shard_out.absolute()}")
+    if orphans:
+        print(f"Note: {orphans} sessions missing from sessions-index.json were costed from their transcripts "
+              f"(index fields inferred from the first records)")
+    if rollup_only and (turns_out or cache_efficiency or by_tool or latency):
+        print(f"Note: {rollup_only} sessions are only kept as rollups (archive pruned); "
+              f"their turns are missing from the per-turn output")
+    if profiler:
+        profiler.lap("export")
+        profiler.print_summary()
+
+    peak_rss = peak_rss_bytes()
+    if peak_rss is not None:
+        print(f"Peak memory (RSS): {peak_rss / (1024 * 1024):.1f} MB")
 
 
 if __name__ == "__main__":
@@ -589,11 +1076,77 @@ Examples:
   # Analyze sessions up to a specific date
   %(prog)s --end-date 2026-01-22
 
-  # Aggregate sessions by day
+  # Aggregate API turns by day (a session running past midnight is split)
   %(prog)s --by-day
 
+  # Monthly totals
+  %(prog)s --by month
+
+  # Cost per project and model for each day, in one pass
+  %(prog)s --group-by project,model,day --sort cost
+
+  # The 10 most expensive sessions (totals still cover every session)
+  %(prog)s --top 10
+
+  # Page through sessions by peak context, 20 at a time
+  %(prog)s --sort context --limit 20 --offset 20
+
   # Daily breakdown for a specific week
   %(prog)s --start-date 2026-01-20 --end-date 2026-01-26 --by-day
+
+  # Ignore the parse cache and decode every file from scratch
+  %(prog)s --no-cache
+
+  # Price turns with a custom effective-dated price table
+  %(prog)s --pricing ~/claude_pricing.json
+
+  # Parse session files on 8 processes
+  %(prog)s --jobs 8
+
+  # Write a gzipped NDJSON export (one session per line) to a chosen path
+  %(prog)s --export-format ndjson --gzip --output ~/claude-usage.ndjson.gz
+
+  # See where the time goes, and dump a call profile of the parse phase
+  %(prog)s --profile --profile-out parse.prof
+  python3 -m pstats parse.prof
+
+  # Prompt cache hit ratios, and which turns re-wrote the cache and what that cost
+  %(prog)s --cache-efficiency --start-date 2026-01-01
+
+  # Roughly what this quarter cost, with error bounds, from 5%% of the sessions (check the bounds first)
+  %(prog)s validate-sample
+  %(prog)s --sample 0.05 --start-date 2026-01-01
+
+  # Which tools grow the context (and the bill) the most
+  %(prog)s --by-tool
+
+  # How long responses take and how fast tokens stream, per model and context size
+  %(prog)s --latency
+
+  # Count only the API turns made on Jan 20, even in sessions started earlier
+  %(prog)s --start-date 2026-01-20 --end-date 2026-01-20 --filter-turns
+
+  # Also write a columnar per-turn store, then re-aggregate it by hour
+  %(prog)s --turns-out turns.bin
+  %(prog)s turns turns.bin --by hour
+
+  # Load everything into SQLite, then ask questions without rescanning
+  %(prog)s ingest
+  %(prog)s query branch --days 30
+  %(prog)s query session --order-by cache_write --limit 20
+
+  # Keep live totals for the waybar custom/claude module
+  %(prog)s --watch
+
+  # Roll up several machines: write a shard on each, then merge them anywhere
+  %(prog)s --shard-out ~/sync/claude-$(hostname).json.gz
+  %(prog)s merge ~/sync/claude-*.json.gz --by month
+
+  # Compress sessions idle for 30 days and drop their archives after a year
+  %(prog)s archive --older-than 30 --prune-after 365
+
+  # Browse usage by day, project, branch, model or session at http://127.0.0.1:8765/
+  %(prog)s serve
         """
     )
     parser.add_argument(
@@ -606,14 +1159,340 @@ Examples:
         type=str,
         help="End date for filtering sessions (YYYY-MM-DD format, inclusive)"
     )
+    parser.add_argument(
+        "--by",
+        dest="bucket_by",
+        choices=TimeBucketAggregator.GRANULARITIES,
+        help="Aggregate API turns into hour/day/week/month buckets (UTC) instead of showing individual sessions"
+    )
     parser.add_argument(
         "--by-day",
+        dest="bucket_by",
+        action="store_const",
+        const="day",
+        help="Same as --by day"
+    )
+    parser.add_argument(
+        "--group-by",
+        metavar="DIM[,DIM...]",
+        help="Aggregate API turns by any combination of " + ", ".join(GROUP_DIMENSIONS) + " (comma-separated, "
+             "e.g. project,model) in one pass instead of showing individual sessions; sorted by cost by default"
+    )
+    parser.add_argument(
+        "--sort",
+        choices=list(REPORT_SORTS),
+        help="Order of the breakdown, largest first (default: created, newest first; cost with --top or --group-by)"
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        metavar="N",
+        help="Show only the N highest-ranked sessions (or buckets); same as --limit N --sort cost"
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        metavar="N",
+        help="Show at most N sessions (or buckets) of the breakdown; totals still cover everything"
+    )
+    parser.add_argument(
+        "--offset",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Skip the first N sessions (or buckets) of the breakdown, for paging with --limit"
+    )
+    parser.add_argument(
+        "--cache-file",
+        type=Path,
+        help="Path of the persistent parse cache (default: ~/.cache/claude-sessions/parse-cache.json)"
+    )
+    parser.add_argument(
+        "--no-cache",
         action="store_true",
-        help="Aggregate sessions by day instead of showing individual sessions"
+        help="Do not read or update the parse cache"
+    )
+    parser.add_argument(
+        "--no-rollups",
+        action="store_true",
+        help="Read archived transcripts instead of counting archived sessions from their rollups"
+    )
+    parser.add_argument(
+        "--pricing",
+        type=Path,
+        help="Price table with effective dates (default: claude_pricing.json next to this script, "
+             "falling back to built-in prices)"
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes used to parse session files (0 = one per CPU, default: 1)"
+    )
+    parser.add_argument(
+        "--filter-turns",
+        action="store_true",
+        help="Apply the date range to each API turn's timestamp instead of the session creation date"
+    )
+    parser.add_argument(
+        "--shard-out",
+        type=Path,
+        help="Also write this host's sessions as a partial aggregate shard for the merge command "
+             "(gzipped if PATH ends in .gz; bypasses the parse cache)"
+    )
+    parser.add_argument(
+        "--cache-efficiency",
+        action="store_true",
+        help="Report prompt cache hit ratios per model, day and session, and the turns that busted the "
+             "cache with the dollars they lost (bypasses the parse cache)"
+    )
+    parser.add_argument(
+        "--by-tool",
+        action="store_true",
+        help="Attribute each turn's context growth and output tokens to the tools that caused them, "
+             "with totals, cost and per-call percentiles per tool (bypasses the parse cache)"
+    )
+    parser.add_argument(
+        "--latency",
+        action="store_true",
+        help="Report response latency and output tokens per second (p50/p95/p99) per model, day, project "
+             "and context size, from the timestamps of each request and its response (bypasses the parse cache)"
+    )
+    parser.add_argument(
+        "--sample",
+        type=float,
+        nargs="?",
+        const=SAMPLE_FRACTION,
+        metavar="FRACTION",
+        help=f"Only estimate the totals, with {round(100 * math.erf(SAMPLE_Z / math.sqrt(2)))}%% confidence "
+             f"intervals, from this fraction of the sessions in each project and of the chunks of large files "
+             f"(default: {SAMPLE_FRACTION:g}; see the validate-sample command)"
+    )
+    parser.add_argument(
+        "--turns-out",
+        type=Path,
+        help="Also write a compact columnar file with one row per API turn (bypasses the parse cache)"
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="Where to write the exported analysis (default: claude_sessions_analysis.json, "
+             ".ndjson for --export-format ndjson, plus .gz with --gzip, in the current directory)"
+    )
+    parser.add_argument(
+        "--export-format",
+        choices=EXPORT_FORMATS,
+        default="json",
+        help="Export layout: indented JSON, single-line JSON, or NDJSON with the totals on the first "
+             "line and one session or bucket per line (default: json)"
+    )
+    parser.add_argument(
+        "--gzip",
+        action="store_true",
+        help="Gzip-compress the export"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print and export per-phase timings and scan counters (files, bytes, lines, records)"
+    )
+    parser.add_argument(
+        "--profile-out",
+        type=Path,
+        help="Write a cProfile dump of the parse phase here (implies --profile; "
+             "covers the main process only, so use --jobs 1)"
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Run as a daemon that follows session files and publishes a waybar JSON payload"
+    )
+    parser.add_argument(
+        "--watch-output",
+        type=Path,
+        help="Where --watch writes the waybar payload (default: ~/.cache/claude-sessions/waybar.json)"
+    )
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=2.0,
+        help="Seconds between checks for appended turns and new sessions (default: 2)"
+    )
+
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    turns_parser = subparsers.add_parser(
+        "turns",
+        help="Re-aggregate a per-turn store written with --turns-out"
+    )
+    turns_parser.add_argument("store", type=Path, help="Per-turn store file")
+    turns_parser.add_argument(
+        "--by",
+        choices=TurnStore.GROUP_BY,
+        default="model",
+        help="Grouping dimension (default: model)"
+    )
+
+    ingest_parser = subparsers.add_parser(
+        "ingest",
+        help="Incrementally load sessions and per-turn usage into a SQLite database"
+    )
+    ingest_parser.add_argument(
+        "--db",
+        type=Path,
+        help="Database file (default: ~/.cache/claude-sessions/sessions.db)"
+    )
+    query_parser = subparsers.add_parser(
+        "query",
+        help="Answer grouped usage questions from the SQLite database"
+    )
+    query_parser.add_argument(
+        "group",
+        nargs="?",
+        choices=list(DB_GROUP_COLUMNS),
+        default="day",
+        help="Grouping dimension (default: day)"
+    )
+    query_parser.add_argument(
+        "--order-by",
+        choices=DB_ORDER_BY,
+        default="cost",
+        help="Metric to sort groups by, descending (default: cost)"
+    )
+    query_parser.add_argument(
+        "--days",
+        type=int,
+        help="Only count turns from the last N days"
+    )
+    query_parser.add_argument(
+        "--limit",
+        type=int,
+        default=20,
+        help="Maximum number of rows (default: 20)"
+    )
+    query_parser.add_argument(
+        "--sql",
+        help="Run a raw SQL query against the sessions/files/turns tables instead"
+    )
+    query_parser.add_argument(
+        "--db",
+        type=Path,
+        help="Database file (default: ~/.cache/claude-sessions/sessions.db)"
+    )
+
+    merge_parser = subparsers.add_parser(
+        "merge",
+        help="Combine per-host shards written with --shard-out into one report"
+    )
+    merge_parser.add_argument("shards", nargs="+", type=Path, help="Shard files (.json or .json.gz)")
+    merge_parser.add_argument(
+        "--shard-out",
+        type=Path,
+        help="Also write the merged sessions as a new shard (mergeable again)"
+    )
+    merge_parser.add_argument(
+        "--by",
+        dest="bucket_by",
+        choices=TimeBucketAggregator.GRANULARITIES,
+        help="Aggregate API turns into hour/day/week/month buckets (UTC) instead of showing individual sessions"
+    )
+    merge_parser.add_argument("--group-by", metavar="DIM[,DIM...]", help="Aggregate API turns by dimensions, as above")
+    merge_parser.add_argument("--sort", choices=list(REPORT_SORTS), help="Order of the breakdown, as above")
+    merge_parser.add_argument("--top", type=int, metavar="N", help="Show only the N highest-ranked entries")
+    merge_parser.add_argument("--limit", type=int, metavar="N", help="Show at most N entries of the breakdown")
+    merge_parser.add_argument("--offset", type=int, default=0, metavar="N", help="Skip the first N entries")
+    merge_parser.add_argument("--output", type=Path, help="Where to write the exported analysis")
+    merge_parser.add_argument("--export-format", choices=EXPORT_FORMATS, default="json", help="Export layout")
+    merge_parser.add_argument("--gzip", action="store_true", help="Gzip-compress the export")
+
+    validate_parser = subparsers.add_parser(
+        "validate-sample",
+        help="Compare the --sample estimates against the exact totals on the same sessions"
+    )
+    validate_parser.add_argument(
+        "--sample",
+        type=float,
+        default=SAMPLE_FRACTION,
+        metavar="FRACTION",
+        help=f"Sampling fraction to check (default: {SAMPLE_FRACTION:g})"
+    )
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Serve a local dashboard and JSON API answered from an in-memory index kept up to date"
+    )
+    serve_parser.add_argument("--host", default=SERVE_HOST, help=f"Address to listen on (default: {SERVE_HOST})")
+    serve_parser.add_argument("--port", type=int, default=SERVE_PORT, help=f"Port to listen on (default: {SERVE_PORT})")
+    serve_parser.add_argument(
+        "--interval",
+        type=float,
+        default=SERVE_INTERVAL,
+        help=f"Seconds between checks for appended turns and new sessions (default: {SERVE_INTERVAL:g})"
+    )
+    archive_parser = subparsers.add_parser(
+        "archive",
+        help="Compress finished sessions and keep per-session rollups the report reads instead"
+    )
+    archive_parser.add_argument(
+        "--older-than",
+        type=int,
+        default=ARCHIVE_AFTER_DAYS,
+        metavar="DAYS",
+        help=f"Archive sessions with no activity for this many days (default: {ARCHIVE_AFTER_DAYS})"
+    )
+    archive_parser.add_argument(
+        "--zstd",
+        action="store_true",
+        help="Write .jsonl.zst archives (needs the zstandard module) instead of .jsonl.gz"
+    )
+    archive_parser.add_argument(
+        "--prune-after",
+        type=int,
+        metavar="DAYS",
+        help="Also delete the archives of sessions idle this many days, keeping only their rollups"
+    )
+    archive_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only list what would be archived and pruned"
     )
 
     args = parser.parse_args()
 
+    if args.pricing:
+        try:
+            set_price_table(PriceTable.load(args.pricing))
+        except (OSError, ValueError) as e:
+            print(f"Error reading price table {args.pricing}: {e}")
+            exit(1)
+
+    if args.command == "turns":
+        report_turn_store(args.store, args.by)
+        exit(0)
+    if args.command == "ingest":
+        ingest_sessions(args.db or default_db_file())
+        exit(0)
+    if args.command == "query":
+        query_sessions(args.db or default_db_file(), args.group, args.order_by, args.days, args.limit, args.sql)
+        exit(0)
+    if args.sample is not None and not 0 < args.sample <= 1:
+        print("Error: --sample must be a fraction between 0 and 1")
+        exit(1)
+    if args.command == "validate-sample":
+        exit(0 if validate_sample(args.sample) else 1)
+    if args.command == "serve":
+        serve_dashboard(args.host, args.port, args.interval, use_rollups=not args.no_rollups)
+        exit(0)
+    if args.command == "archive":
+        if args.older_than < 1 or (args.prune_after is not None and args.prune_after < args.older_than):
+            print("Error: --older-than must be at least 1 day and --prune-after at least --older-than")
+            exit(1)
+        if args.zstd and zstandard is None:
+            print("Error: --zstd needs the zstandard module (pip install zstandard)")
+            exit(1)
+        exit(0 if archive_sessions(args.older_than, args.zstd, args.prune_after, args.dry_run) else 1)
+    if args.watch:
+        watch_sessions(args.watch_output or default_waybar_file(), args.watch_interval)
+        exit(0)
+
     # Parse dates if provided
     start_date = None
     end_date = None
@@ -633,4 +1512,53 @@ Examples:
         print("Error: Start date cannot be after end date")
         exit(1)
 
-    analyze_all_sessions(start_date=start_date, end_date=end_date, aggregate_by_day_flag=args.by_day)
+    if args.jobs < 0:
+        print("Error: --jobs must be 0 or a positive number")
+        exit(1)
+    jobs = args.jobs or os.cpu_count() or 1
+
+    for option, value in (("--top", args.top), ("--limit", args.limit), ("--offset", args.offset)):
+        if value is not None and value < 0:
+            print(f"Error: {option} must be 0 or a positive number")
+            exit(1)
+    if args.top is not None and args.limit is not None:
+        print("Error: use either --top or --limit")
+        exit(1)
+    limit = args.top if args.top is not None else args.limit
+
+    group_by = None
+    if args.group_by is not None:
+        group_by = tuple(dict.fromkeys(name.strip() for name in args.group_by.split(",") if name.strip()))
+        unknown = [name for name in group_by if name not in GROUP_DIMENSIONS]
+        if unknown or not group_by:
+            print(f"Error: unknown --group-by dimension {', '.join(unknown) or repr(args.group_by)} "
+                  f"(choose from {', '.join(GROUP_DIMENSIONS)})")
+            exit(1)
+        if args.bucket_by:
+            print("Error: use either --by or --group-by")
+            exit(1)
+    sort_by = args.sort or ("cost" if args.top is not None or group_by else "created")
+    if args.sample is not None:
+        excluded = [option for option, value in (
+            ("--by", args.bucket_by), ("--group-by", group_by), ("--filter-turns", args.filter_turns),
+            ("--turns-out", args.turns_out), ("--shard-out", args.shard_out),
+            ("--cache-efficiency", args.cache_efficiency), ("--by-tool", args.by_tool), ("--latency", args.latency),
+        ) if value]
+        if excluded:
+            print(f"Error: --sample only estimates totals; it cannot be combined with {', '.join(excluded)}")
+            exit(1)
+
+    if args.command == "merge":
+        exit(0 if merge_shards(args.shards, args.shard_out, args.bucket_by, sort_by, limit, args.offset,
+                               args.output, args.export_format, args.gzip, group_by) else 1)
+
+    cache_file = None if args.no_cache else (args.cache_file or default_cache_file())
+    profiler = Profiler(args.profile_out) if args.profile or args.profile_out else None
+
+    analyze_all_sessions(start_date=start_date, end_date=end_date, by=args.bucket_by,
+                         cache_file=cache_file, jobs=jobs, filter_turns=args.filter_turns,
+                         turns_out=args.turns_out, profiler=profiler,
+                         output_file=args.output, export_format=args.export_format, export_gzip=args.gzip,
+                         sort_by=sort_by, limit=limit, offset=args.offset, shard_out=args.shard_out,
+                         cache_efficiency=args.cache_efficiency, by_tool=args.by_tool, latency=args.latency,
+                         use_rollups=not args.no_rollups, group_by=group_by, sample=args.sample)
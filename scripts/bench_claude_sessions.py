@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+"""
+Benchmark analyze_claude_sessions.py against a synthetic session corpus.
+
+Builds a fake ~/.claude/projects tree (sessions-index.json files, session
+JSONL transcripts and subagent transcripts in the shapes the analyzer reads)
+under a scratch home directory, then runs analyze_all_sessions() on it in a
+fresh process per scenario and reports wall time, MB/s, lines/s and peak RSS.
+Results can be saved as a baseline and later runs compared against it.
+
+Usage:
+    python3 bench_claude_sessions.py generate HOME [--projects N] [--sessions N] [--subagents N]
+                                            [--lines N] [--payload-bytes N] [--seed N]
+    python3 bench_claude_sessions.py run HOME [--scenario NAME ...] [--repeat N]
+                                       [--save-baseline PATH] [--baseline PATH] [--tolerance PCT]
+
+Examples:
+    # Build a corpus of 4 projects x 25 sessions, ~200 turns each
+    python3 bench_claude_sessions.py generate /tmp/claude-bench --projects 4 --sessions 25 --lines 200
+
+    # Benchmark every scenario and keep the numbers as the baseline
+    python3 bench_claude_sessions.py run /tmp/claude-bench --save-baseline bench-baseline.json
+
+    # After changing the parser: compare, exit 1 if anything got >10% slower
+    python3 bench_claude_sessions.py run /tmp/claude-bench --baseline bench-baseline.json
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies)
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPT_DIR))
+import analyze_claude_sessions as analyzer  # noqa: E402
+
+# Model strings as they appear in transcripts, with rough usage weights
+MODELS = [
+    ("claude-opus-4-5-20251101", 5),
+    ("claude-sonnet-4-5-20250929", 3),
+    ("claude-haiku-4-5-20251001", 2),
+    ("<synthetic>", 0.1),
+]
+TOOLS = ["Bash", "Read", "Edit", "Grep", "Glob", "Write", "WebFetch"]
+CLAUDE_CODE_VERSION = "2.1.3"
+
+# Keyword arguments for analyze_all_sessions() per scenario; "warm_cache" also
+# primes the parse cache with an unmeasured run first
+SCENARIOS = {
+    "serial": {},
+    "jobs-4": {"jobs": 4},
+    "by-day": {"by": "day"},
+    "filter-turns": {"filter_turns": True, "start_date": "2026-01-10", "end_date": "2026-01-20"},
+    "warm-cache": {"warm_cache": True},
+}
+# Metrics compared against a baseline, and whether larger is better
+COMPARED_METRICS = {"wall_seconds": False, "mb_per_second": True, "peak_rss_mb": False}
+
+
+def _timestamp(t: datetime) -> str:
+    return t.strftime("%Y-%m-%dT%H:%M:%S.") + f"{t.microsecond // 1000:03d}Z"
+
+
+def _payload(rng: random.Random, mean_bytes: int) -> str:
+    """Tool output of roughly mean_bytes (exponentially distributed), made of source-like lines."""
+    size = int(rng.expovariate(1 / max(mean_bytes, 1)))
+    line = "    result = compute(value, options)  # synthetic tool output\n"
+    return (line * (size // len(line) + 1))[:size]
+
+
+def _write_transcript(path: Path, rng: random.Random, session_id: str, cwd: str, branch: str, start: datetime,
+                      turns: int, payload_bytes: int, agent_id: str = "") -> Dict:
+    """Write one session (or subagent) transcript; returns its line count, byte size and last timestamp."""
+    models = [model for model, _ in MODELS]
+    weights = [weight for _, weight in MODELS]
+    common = {"isSidechain": bool(agent_id), "userType": "external", "cwd": cwd, "sessionId": session_id,
+              "version": CLAUDE_CODE_VERSION, "gitBranch": branch}
+    if agent_id:
+        common["agentId"] = agent_id
+
+    t = start
+    parent = None
+    context = rng.randint(8_000, 20_000)
+    lines = 0
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        for turn in range(turns):
+            tool_use_id = f"toolu_{uuid.UUID(int=rng.getrandbits(128)).hex[:24]}"
+            model = rng.choices(models, weights)[0]
+
+            # Assistant turn: a tool call, with the usage object the analyzer reads
+            t += timedelta(seconds=rng.randint(2, 90))
+            output_tokens = rng.randint(20, 2500)
+            cache_write = rng.randint(0, 6000) if rng.random() < 0.6 else 0
+            record_id = str(uuid.UUID(int=rng.getrandbits(128)))
+            f.write(json.dumps(dict(common, **{
+                "parentUuid": parent,
+                "message": {
+                    "model": model,
+                    "id": f"msg_{uuid.UUID(int=rng.getrandbits(128)).hex[:24]}",
+                    "type": "message",
+                    "role": "assistant",
+                    "content": [
+                        {"type": "text", "text": "Let me look at that. " * rng.randint(1, 20)},
+                        {"type": "tool_use", "id": tool_use_id, "name": rng.choice(TOOLS),
+                         "input": {"command": "rg -n pattern src/", "description": "Search the sources"}},
+                    ],
+                    "stop_reason": "tool_use",
+                    "stop_sequence": None,
+                    "usage": {
+                        "input_tokens": rng.randint(1, 60),
+                        "cache_creation_input_tokens": cache_write,
+                        "cache_read_input_tokens": context,
+                        "cache_creation": {"ephemeral_5m_input_tokens": cache_write, "ephemeral_1h_input_tokens": 0},
+                        "output_tokens": output_tokens,
+                        "service_tier": "standard",
+                    },
+                },
+                "requestId": f"req_{uuid.UUID(int=rng.getrandbits(128)).hex[:24]}",
+                "type": "assistant",
+                "uuid": record_id,
+                "timestamp": _timestamp(t),
+            }), separators=(",", ":")) + "\n")
+            parent = record_id
+            lines += 1
+
+            # User turn: the tool result, usually the bulk of the bytes
+            t += timedelta(seconds=rng.randint(1, 30))
+            output = _payload(rng, payload_bytes)
+            record_id = str(uuid.UUID(int=rng.getrandbits(128)))
+            f.write(json.dumps(dict(common, **{
+                "parentUuid": parent,
+                "type": "user",
+                "message": {"role": "user", "content": [
+                    {"tool_use_id": tool_use_id, "type": "tool_result", "content": output, "is_error": False}]},
+                "uuid": record_id,
+                "timestamp": _timestamp(t),
+                "toolUseResult": {"stdout": output, "stderr": "", "interrupted": False},
+            }), separators=(",", ":")) + "\n")
+            parent = record_id
+            lines += 1
+
+            context = min(context + output_tokens + len(output) // 4, 180_000)
+            if context > 150_000 and rng.random() < 0.1:
+                context = rng.randint(15_000, 30_000)  # compaction
+
+        if not agent_id:
+            f.write(json.dumps({"type": "summary", "summary": "Synthetic benchmark session",
+                                "leafUuid": parent}, separators=(",", ":")) + "\n")
+            lines += 1
+
+    return {"lines": lines, "bytes": path.stat().st_size, "end": t}
+
+
+def generate_corpus(home: Path, projects: int = 3, sessions: int = 20, subagents: int = 2, lines: int = 100,
+                    payload_bytes: int = 4000, seed: int = 1, start: str = "2026-01-01") -> Dict:
+    """Build a fake ~/.claude/projects tree under home; returns a summary with totals.
+
+    Each session has about lines/2 assistant turns, each followed by a tool
+    result of about payload_bytes. Up to subagents subagent transcripts are
+    attached to each session. The same seed always yields the same corpus.
+    """
+    rng = random.Random(seed)
+    base = datetime.strptime(start, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    projects_dir = home / ".claude" / "projects"
+    totals = {"files": 0, "lines": 0, "bytes": 0}
+
+    for p in range(projects):
+        cwd = f"/home/bench/src/project-{p}"
+        project_dir = projects_dir / cwd.replace("/", "-")
+        entries = []
+        for _ in range(sessions):
+            session_id = str(uuid.UUID(int=rng.getrandbits(128)))
+            branch = rng.choice(["main", "main", "feature/parser", "fix/cache", ""])
+            created = base + timedelta(days=rng.randint(0, 29), hours=rng.randint(0, 23), minutes=rng.randint(0, 59))
+            session_file = project_dir / f"{session_id}.jsonl"
+            written = _write_transcript(session_file, rng, session_id, cwd, branch, created,
+                                        max(1, rng.randint(lines // 4, lines) // 2), payload_bytes)
+            totals["files"] += 1
+            totals["lines"] += written["lines"]
+            totals["bytes"] += written["bytes"]
+
+            for _ in range(rng.randint(0, subagents)):
+                agent_id = uuid.UUID(int=rng.getrandbits(128)).hex[:8]
+                agent_file = project_dir / session_id / "subagents" / f"agent-{agent_id}.jsonl"
+                agent_written = _write_transcript(agent_file, rng, session_id, cwd, branch,
+                                                  created + timedelta(minutes=rng.randint(1, 30)),
+                                                  max(1, rng.randint(lines // 8, lines // 2) // 2),
+                                                  payload_bytes, agent_id=agent_id)
+                totals["files"] += 1
+                totals["lines"] += agent_written["lines"]
+                totals["bytes"] += agent_written["bytes"]
+
+            entries.append({
+                "sessionId": session_id,
+                "fullPath": str(session_file),
+                "fileMtime": int(written["end"].timestamp() * 1000),
+                "firstPrompt": "Refactor the parser so that the benchmark runs faster " * 3,
+                "summary": "Synthetic benchmark session",
+                "messageCount": written["lines"],
+                "created": _timestamp(created),
+                "modified": _timestamp(written["end"]),
+                "gitBranch": branch,
+                "projectPath": cwd,
+                "isSidechain": False,
+            })
+
+        with open(project_dir / "sessions-index.json", "w") as f:
+            json.dump({"version": 1, "originalPath": cwd, "entries": entries}, f, indent=2)
+
+    summary = dict(totals, projects=projects, sessions=sessions, subagents=subagents, lines_per_session=lines,
+                   payload_bytes=payload_bytes, seed=seed)
+    with open(home / ".claude" / "bench-corpus.json", "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def corpus_size(home: Path) -> Dict:
+    """Count the JSONL files, bytes and lines under home's projects tree."""
+    totals = {"files": 0, "lines": 0, "bytes": 0}
+    for path in (home / ".claude" / "projects").rglob("*.jsonl"):
+        totals["files"] += 1
+        totals["bytes"] += path.stat().st_size
+        with open(path, "rb") as f:
+            totals["lines"] += sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+    return totals
+
+
+def _run_once(home: Path, scenario: str) -> Dict:
+    """Child-process side: run one scenario against home and return its timing and peak RSS."""
+    # Absolute, as the run below changes into a scratch directory
+    os.environ["HOME"] = str(home.resolve())
+    os.environ.pop("XDG_CACHE_HOME", None)
+
+    kwargs = dict(SCENARIOS[scenario])
+    warm_cache = kwargs.pop("warm_cache", False)
+    for key in ("start_date", "end_date"):
+        if key in kwargs:
+            kwargs[key] = analyzer.parse_date_filter(kwargs[key])
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)  # the report exports claude_sessions_analysis.json to the cwd
+        if warm_cache:
+            kwargs["cache_file"] = Path(workdir) / "parse-cache.json"
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                if warm_cache:
+                    analyzer.analyze_all_sessions(**kwargs)
+                started = time.perf_counter()
+                analyzer.analyze_all_sessions(**kwargs)
+                wall = time.perf_counter() - started
+            finally:
+                sys.stdout = stdout
+
+    peak_rss = analyzer.peak_rss_bytes()
+    return {"wall_seconds": wall, "peak_rss_mb": peak_rss / (1024 * 1024) if peak_rss is not None else None}
+
+
+def run_scenario(home: Path, scenario: str) -> Dict:
+    """Run one scenario in a fresh interpreter so peak RSS is not shared between scenarios."""
+    result = subprocess.run([sys.executable, str(Path(__file__).resolve()), "_run-once", str(home), scenario],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"scenario {scenario} failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run_benchmarks(home: Path, scenarios: List[str], repeat: int = 3) -> Dict:
+    """Run each scenario repeat times and keep the fastest run (and its peak RSS)."""
+    size = corpus_size(home)
+    megabytes = size["bytes"] / (1024 * 1024)
+    results = {}
+    for scenario in scenarios:
+        runs = [run_scenario(home, scenario) for _ in range(repeat)]
+        best = min(runs, key=lambda run: run["wall_seconds"])
+        results[scenario] = {
+            "wall_seconds": best["wall_seconds"],
+            "mb_per_second": megabytes / best["wall_seconds"],
+            "lines_per_second": size["lines"] / best["wall_seconds"],
+            "peak_rss_mb": best["peak_rss_mb"],
+            "runs": [run["wall_seconds"] for run in runs],
+        }
+    return {
+        "generated_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "corpus": size,
+        "results": results,
+    }
+
+
+def print_results(report: Dict, baseline: Dict = None, tolerance: float = 10.0) -> List[str]:
+    """Print the results table, with deltas against baseline; returns the regressed metrics."""
+    corpus = report["corpus"]
+    print("=" * 100)
+    print(f"BENCHMARK: {corpus['files']} files, {corpus['bytes'] / (1024 * 1024):.1f} MB, {corpus['lines']} lines "
+          f"(Python {report['python']}, {report['cpu_count']} CPUs)")
+    print("=" * 100)
+    print(f"{'Scenario':<16} {'Wall (s)':<18} {'MB/s':<18} {'Lines/s':<14} {'Peak RSS (MB)':<18}")
+    print("-" * 100)
+
+    regressions = []
+    base_results = (baseline or {}).get("results", {})
+    if baseline and baseline.get("corpus") != corpus:
+        print("Warning: baseline was measured on a different corpus; deltas are not comparable")
+
+    for scenario, data in report["results"].items():
+        cells = {}
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            value = data[metric]
+            cells[metric] = "n/a" if value is None else f"{value:.2f}" if metric != "mb_per_second" else f"{value:.1f}"
+            base_value = base_results.get(scenario, {}).get(metric)
+            if value is None or not base_value:
+                continue
+            change = (value - base_value) / base_value * 100
+            cells[metric] += f" ({change:+.0f}%)"
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{scenario} {metric}: {base_value:.2f} -> {value:.2f} ({change:+.0f}%)")
+        print(f"{scenario:<16} {cells['wall_seconds']:<18} {cells['mb_per_second']:<18} "
+              f"{data['lines_per_second']:<14,.0f} {cells['peak_rss_mb']:<18}")
+
+    if baseline:
+        print()
+        if regressions:
+            print(f"REGRESSIONS (>{tolerance:.0f}% worse than baseline from {baseline.get('generated_at', '?')}):")
+            for regression in regressions:
+                print(f"  {regression}")
+        else:
+            print(f"No regressions beyond {tolerance:.0f}% against baseline from {baseline.get('generated_at', '?')}")
+    return regressions
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "_run-once":
+        # Internal: one measured run, executed in a child process by run_scenario()
+        print(json.dumps(_run_once(Path(sys.argv[2]), sys.argv[3])))
+        exit(0)
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark analyze_claude_sessions.py against a synthetic session corpus.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Build a corpus of 4 projects x 25 sessions, ~200 turns each
+  %(prog)s generate /tmp/claude-bench --projects 4 --sessions 25 --lines 200
+
+  # Benchmark every scenario and keep the numbers as the baseline
+  %(prog)s run /tmp/claude-bench --save-baseline bench-baseline.json
+
+  # After changing the parser: compare, exit 1 if anything got >10%% slower
+  %(prog)s run /tmp/claude-bench --baseline bench-baseline.json
+        """
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    subparsers.required = True
+
+    generate_parser = subparsers.add_parser("generate", help="Build a synthetic ~/.claude tree under HOME")
+    generate_parser.add_argument("home", type=Path, help="Scratch home directory (created if missing)")
+    generate_parser.add_argument("--projects", type=int, default=3, help="Number of projects (default: 3)")
+    generate_parser.add_argument("--sessions", type=int, default=20, help="Sessions per project (default: 20)")
+    generate_parser.add_argument("--subagents", type=int, default=2,
+                                 help="Maximum subagent transcripts per session (default: 2)")
+    generate_parser.add_argument("--lines", type=int, default=100,
+                                 help="Maximum transcript lines per session (default: 100)")
+    generate_parser.add_argument("--payload-bytes", type=int, default=4000,
+                                 help="Mean size of a tool result payload (default: 4000)")
+    generate_parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+
+    run_parser = subparsers.add_parser("run", help="Benchmark the analyzer against a generated HOME")
+    run_parser.add_argument("home", type=Path, help="Home directory built with the generate command")
+    run_parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                            help="Scenario to run, may be repeated (default: all)")
+    run_parser.add_argument("--repeat", type=int, default=3,
+                            help="Runs per scenario; the fastest is reported (default: 3)")
+    run_parser.add_argument("--save-baseline", type=Path, help="Write the results to this JSON file")
+    run_parser.add_argument("--baseline", type=Path, help="Compare against a saved baseline")
+    run_parser.add_argument("--tolerance", type=float, default=10.0,
+                            help="Percent change counted as a regression (default: 10)")
+
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        if (args.home / ".claude" / "projects").exists():
+            print(f"Error: {args.home / '.claude' / 'projects'} already exists; pick an empty HOME")
+            exit(1)
+        started = time.perf_counter()
+        summary = generate_corpus(args.home, args.projects, args.sessions, args.subagents, args.lines,
+                                  args.payload_bytes, args.seed)
+        print(f"Generated {summary['files']} files, {summary['bytes'] / (1024 * 1024):.1f} MB, "
+              f"{summary['lines']} lines under {args.home} in {time.perf_counter() - started:.1f}s")
+        exit(0)
+
+    if not (args.home / ".claude" / "projects").exists():
+        print(f"Error: no corpus at {args.home}; create one with the generate command")
+        exit(1)
+    if args.repeat < 1:
+        print("Error: --repeat must be at least 1")
+        exit(1)
+
+    baseline = None
+    if args.baseline:
+        try:
+            with open(args.baseline, "r") as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error reading baseline {args.baseline}: {e}")
+            exit(1)
+
+    try:
+        report = run_benchmarks(args.home, args.scenario or list(SCENARIOS), args.repeat)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        exit(1)
+    regressions = print_results(report, baseline, args.tolerance)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nBaseline saved to: {args.save_baseline.absolute()}")
+
+    exit(1 if regressions else 0)
@@ -0,0 +1,208 @@
+"""
+Tiered retention (the archive command) for analyze_claude_sessions.py.
+
+archive_sessions() compresses the transcripts of finished sessions into
+.jsonl.gz (or .jsonl.zst) archives next to them and keeps each session's
+hour counters in its project's rollup shard, so reports stop rescanning
+them; archives idle long enough can be pruned down to the rollup alone.
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies; the optional zstandard
+      module writes .zst archives)
+"""
+
+import gzip
+import os
+import shutil
+import socket
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from claude_session_inventory import SessionInventory, plan_sessions
+from claude_session_scan import (RecordSource, ScanStats, ShardCollector, UsageCounters, is_archived,
+                                 make_usage_handler, scan_session_file, session_file_id, set_scan_stats)
+from claude_session_shards import ROLLUP_FILE, write_shard
+
+try:
+    import zstandard
+except ImportError:  # optional: only needed for .zst archives
+    zstandard = None
+
+# Tiered retention (archive command): when sessions are archived by default, and the
+# compression levels used
+ARCHIVE_AFTER_DAYS = 30
+ARCHIVE_GZIP_LEVEL = 6
+ARCHIVE_ZSTD_LEVEL = 10
+
+
+def archive_session_file(session_path: Path, use_zstd: bool = False) -> Path:
+    """Compress a transcript into an archive next to it, keeping its mtime; returns the archive path.
+
+    The original is left in place for the caller to remove once the rollup
+    is safely written. Raises OSError.
+    """
+    archive = session_path.with_name(session_path.name + (".zst" if use_zstd else ".gz"))
+    tmp_file = archive.with_name(archive.name + ".tmp")
+    try:
+        with open(session_path, 'rb') as src:
+            if use_zstd:
+                with open(tmp_file, 'wb') as dst:
+                    zstandard.ZstdCompressor(level=ARCHIVE_ZSTD_LEVEL).copy_stream(src, dst)
+            else:
+                with gzip.open(tmp_file, 'wb', compresslevel=ARCHIVE_GZIP_LEVEL) as dst:
+                    shutil.copyfileobj(src, dst)
+        st = session_path.stat()
+        os.utime(tmp_file, ns=(st.st_atime_ns, st.st_mtime_ns))
+        os.replace(tmp_file, archive)
+    except OSError:
+        try:
+            os.unlink(tmp_file)
+        except OSError:
+            pass
+        raise
+    return archive
+
+
+def archive_sessions(older_than_days: int = ARCHIVE_AFTER_DAYS, use_zstd: bool = False,
+                     prune_after_days: Optional[int] = None, dry_run: bool = False) -> bool:
+    """Compress finished sessions and keep a rollup of each, so reports stop rescanning them.
+
+    A session is finished when neither its transcript nor any of its
+    subagents' has been written to for older_than_days. Its files are
+    replaced by .jsonl.gz (or .jsonl.zst) archives, and its per-hour
+    counters are stored in the project's ROLLUP_FILE, which the report uses
+    instead of the archive unless per-turn detail is needed. With
+    prune_after_days, archives of sessions idle that long are deleted too,
+    leaving only the rollup. Sessions missing from sessions-index.json are
+    archived too, with the entry plan_sessions() infers for them. Returns
+    False if anything could not be written.
+    """
+    projects_dir = Path.home() / ".claude" / "projects"
+    if not projects_dir.exists():
+        print(f"Error: Claude projects directory not found at {projects_dir}")
+        return False
+
+    now = time.time()
+    archive_cutoff = now - older_than_days * 86400
+    prune_cutoff = now - prune_after_days * 86400 if prune_after_days is not None else None
+    ok = True
+    archived = pruned = 0
+    bytes_before = bytes_after = bytes_pruned = 0
+
+    inventory = SessionInventory(projects_dir)
+    planned: Dict[Path, List[Tuple[Dict, str, Path, List[Path]]]] = {}
+    for entry, original_path, session_file, subagent_files in plan_sessions(projects_dir, rollups={},
+                                                                            inventory=inventory):
+        if session_file is not None:
+            planned.setdefault(session_file.parent, []).append((entry, original_path, session_file, subagent_files))
+
+    for project_dir in inventory.projects:
+        rollups = inventory.rollups(project_dir)
+
+        # Roll up and compress each finished session that still has live transcripts
+        done = []
+        for entry, original_path, session_file, subagent_files in planned.get(project_dir, []):
+            session_id = entry.get("sessionId")
+            if not session_id or is_archived(session_file):
+                continue
+            subagent_files = [path for path in subagent_files if not is_archived(path)]
+            files = [session_file] + subagent_files
+            stats = [inventory.stat(path) for path in files]
+            if None in stats:
+                print(f"Error reading {session_id}: a transcript disappeared")
+                ok = False
+                continue
+            if max(st.st_mtime for st in stats) > archive_cutoff:
+                continue
+            if session_id in rollups:
+                print(f"Skipping {session_id}: it was archived before and has live transcripts again")
+                continue
+
+            archived += 1
+            bytes_before += sum(st.st_size for st in stats)
+            if dry_run:
+                print(f"Would archive {session_id} ({len(files)} files, "
+                      f"{sum(st.st_size for st in stats) / (1024 * 1024):.1f} MB) in {original_path}")
+                continue
+
+            collector = ShardCollector()
+            source = RecordSource(session_id, original_path, entry.get("gitBranch", ""), None)
+            sources = [source] + [source._replace(agent_id=session_file_id(path)) for path in subagent_files]
+            scan_stats = ScanStats()
+            set_scan_stats(scan_stats)
+            try:
+                for path, file_source in zip(files, sources):
+                    scan_session_file(path, UsageCounters(), on_usage=make_usage_handler([collector], file_source))
+            finally:
+                set_scan_stats(None)
+            try:
+                if scan_stats.counts["read_errors"]:
+                    raise OSError("a transcript could not be read to the end")
+                archives = [archive_session_file(path, use_zstd) for path in files]
+            except OSError as e:
+                print(f"Error archiving {session_id}: {e}")
+                ok = False
+                archived -= 1
+                bytes_before -= sum(st.st_size for st in stats)
+                continue
+            bytes_after += sum(path.stat().st_size for path in archives)
+            rollups[session_id] = collector.shard_session(entry, original_path, subagent_files)
+            done.append(files)
+
+        # Drop the archives of sessions idle past prune_after_days; their rollups stay
+        prune = []
+        if prune_cutoff is not None:
+            for session_id in rollups:
+                session_file = inventory.session_file(project_dir, session_id)
+                if session_file is None or not is_archived(session_file):
+                    continue
+                files = [session_file] + inventory.subagent_files(project_dir, session_id)
+                if not all(is_archived(path) for path in files):
+                    continue
+                stats = [inventory.stat(path) for path in files]
+                if None in stats or max(st.st_mtime for st in stats) > prune_cutoff:
+                    continue
+                size = sum(st.st_size for st in stats)
+                pruned += 1
+                bytes_pruned += size
+                if dry_run:
+                    print(f"Would prune the archive of {session_id} ({size / (1024 * 1024):.1f} MB) "
+                          f"in {rollups[session_id].get('project_path', '')}")
+                else:
+                    prune.append(files)
+
+        if dry_run or not (done or prune):
+            continue
+        # The rollups go to disk before any transcript is removed
+        try:
+            write_shard(project_dir / ROLLUP_FILE, sorted(rollups.values(), key=lambda session: session["session_id"]),
+                        [socket.gethostname()])
+        except OSError as e:
+            print(f"Error writing {project_dir / ROLLUP_FILE}: {e}")
+            ok = False
+            continue
+        for files in done + prune:
+            for path in files:
+                try:
+                    path.unlink()
+                except OSError as e:
+                    print(f"Error removing {path}: {e}")
+                    ok = False
+        for files in prune:
+            for directory in (files[0].parent / session_file_id(files[0]) / "subagents",
+                              files[0].parent / session_file_id(files[0])):
+                try:
+                    directory.rmdir()
+                except OSError:
+                    pass  # missing, or holds more than transcripts
+
+    megabytes = 1024 * 1024
+    if dry_run:
+        print(f"Would archive {archived} sessions ({bytes_before / megabytes:.1f} MB) "
+              f"and prune {pruned} archives ({bytes_pruned / megabytes:.1f} MB)")
+    else:
+        print(f"Archived {archived} sessions: {bytes_before / megabytes:.1f} MB -> {bytes_after / megabytes:.1f} MB; "
+              f"pruned {pruned} archives ({bytes_pruned / megabytes:.1f} MB)")
+    return ok
@@ -0,0 +1,254 @@
+"""
+Prompt cache efficiency (--cache-efficiency) for analyze_claude_sessions.py.
+
+CacheEfficiencyAnalyzer follows each session's turns in order to report
+cache hit ratios per model, session and day, and to find the turns that
+wrote most of the context back into the cache (cache busts), with what
+re-writing it cost and whether the cache entry had expired first.
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies)
+"""
+
+import heapq
+from operator import add
+from pathlib import Path
+from typing import Dict, List
+
+from claude_session_pricing import price_table
+from claude_session_scan import UsageRecord, format_number, hour_key, parse_timestamp
+
+# --cache-efficiency: a turn is a cache bust when, after at least CACHE_BUST_MIN_READ_RUN turns in a
+# row that read from the prompt cache, it writes CACHE_BUST_MIN_WRITE tokens or more and at least
+# CACHE_BUST_FRACTION of the previous turn's context (a turn whose whole context shrank that much
+# was compacted instead). A gap longer than CACHE_TTL_SECONDS between the turns means the cache
+# entry expired. The report lists the CACHE_BUST_TOP costliest busts and sessions, and the
+# CACHE_REPORT_DAYS most recent days.
+CACHE_BUST_MIN_READ_RUN = 2
+CACHE_BUST_MIN_WRITE = 10_000
+CACHE_BUST_FRACTION = 0.5
+CACHE_TTL_SECONDS = 300
+CACHE_BUST_TOP = 10
+CACHE_REPORT_DAYS = 14
+
+
+class CacheEfficiencyAnalyzer:
+    """Prompt cache hit ratios per session, model and day, and the turns that busted the cache.
+
+    Turns are followed in file order, so each file (main session or
+    subagent) is its own conversation with its own cached prefix. A bust
+    re-writes a prefix that earlier turns were reading (see
+    CACHE_BUST_MIN_READ_RUN); the dollars lost are the re-written tokens
+    (up to the previous turn's context) priced at the cache write rate
+    instead of the cache read rate a perfectly cached turn would have paid.
+    Each bust is put down to a model switch, an idle gap past the cache TTL,
+    or otherwise a changed prefix (edited system prompt, tools or history).
+    Acts as a collector for parse_session_files().
+
+    Group counters are [turns, input, cache_creation, cache_read, busts,
+    tokens_rewritten, lost_cost].
+    """
+
+    CAUSES = ["model switch", "idle past TTL", "prefix changed"]
+
+    def __init__(self):
+        self.by_session: Dict[str, List] = {}
+        self.by_model: Dict[str, List] = {}
+        self.by_day: Dict[str, List] = {}
+        self.by_cause: Dict[str, List] = {cause: [0, 0, 0.0] for cause in self.CAUSES}
+        self.projects: Dict[str, str] = {}
+        self.compactions = 0
+        self.busts: List[Dict] = []
+        # Previous turn of the file being fed: (model, timestamp, context), and its run of cache reads
+        self._source = None
+        self._previous = None
+        self._read_run = 0
+
+    @staticmethod
+    def _count(groups: Dict[str, List], key: str, record: UsageRecord):
+        counters = groups.get(key)
+        if counters is None:
+            counters = groups[key] = [0, 0, 0, 0, 0, 0, 0.0]
+        counters[0] += 1
+        counters[1] += record.input_tokens
+        counters[2] += record.cache_creation_tokens
+        counters[3] += record.cache_read_tokens
+
+    def add(self, record: UsageRecord):
+        if record.source != self._source:
+            self._source = record.source
+            self._previous = None
+            self._read_run = 0
+        session_id = record.source.session_id
+        day = hour_key(record.timestamp)[:10] or "Unknown"
+        self.projects[session_id] = record.source.project_path
+        self._count(self.by_session, session_id, record)
+        self._count(self.by_model, record.model, record)
+        self._count(self.by_day, day, record)
+
+        context = record.input_tokens + record.cache_creation_tokens + record.cache_read_tokens
+        timestamp = parse_timestamp(record.timestamp)
+        previous = self._previous
+        self._previous = (record.model, timestamp, context)
+        written = record.cache_creation_tokens
+        # A compacted conversation writes its (much shorter) new prefix whatever its size
+        compacted = previous is not None and context < CACHE_BUST_FRACTION * previous[2]
+        if previous is None or self._read_run < CACHE_BUST_MIN_READ_RUN or written < CACHE_BUST_MIN_WRITE \
+                or (written < CACHE_BUST_FRACTION * previous[2] and not compacted):
+            if record.cache_read_tokens and record.cache_read_tokens >= written:
+                self._read_run += 1
+            else:
+                self._read_run = 0
+            return
+        self._read_run = 0
+        if compacted:
+            self.compactions += 1
+            return
+
+        gap = None
+        if timestamp is not None and previous[1] is not None:
+            try:
+                gap = (timestamp - previous[1]).total_seconds()
+            except TypeError:  # naive and aware timestamps
+                gap = None
+        if record.model != previous[0]:
+            cause = "model switch"
+        elif gap is not None and gap > CACHE_TTL_SECONDS:
+            cause = "idle past TTL"
+        else:
+            cause = "prefix changed"
+        table = price_table()
+        prices = table.prices(table.price_key(record.model, record.timestamp))
+        rewritten = min(written, previous[2])
+        lost = rewritten * (prices[2] - prices[3])
+
+        for counters in (self.by_session[session_id], self.by_model[record.model], self.by_day[day]):
+            counters[4] += 1
+            counters[5] += rewritten
+            counters[6] += lost
+        totals = self.by_cause[cause]
+        totals[0] += 1
+        totals[1] += rewritten
+        totals[2] += lost
+        self.busts.append({
+            "session_id": session_id,
+            "agent_id": record.source.agent_id,
+            "project_path": record.source.project_path,
+            "timestamp": record.timestamp,
+            "model": record.model,
+            "cause": cause,
+            "idle_seconds": round(gap) if gap is not None else None,
+            "previous_context": previous[2],
+            "cache_creation_tokens": written,
+            "tokens_rewritten": rewritten,
+            "lost_cost": lost,
+        })
+        if len(self.busts) > 2 * CACHE_BUST_TOP:
+            self.busts = self._top_busts(self.busts)
+
+    @staticmethod
+    def _top_busts(busts: List[Dict]) -> List[Dict]:
+        return heapq.nlargest(CACHE_BUST_TOP, busts, key=lambda bust: (
+            bust["lost_cost"], bust["timestamp"] or "", bust["session_id"] or "", bust["agent_id"] or ""))
+
+    def spawn(self) -> "CacheEfficiencyAnalyzer":
+        return CacheEfficiencyAnalyzer()
+
+    def merge(self, other: "CacheEfficiencyAnalyzer"):
+        for name in ("by_session", "by_model", "by_day"):
+            ours = getattr(self, name)
+            for key, counters in getattr(other, name).items():
+                mine = ours.get(key)
+                if mine is None:
+                    ours[key] = counters
+                else:
+                    mine[:] = map(add, mine, counters)
+        for cause, totals in other.by_cause.items():
+            self.by_cause[cause][:] = map(add, self.by_cause[cause], totals)
+        self.projects.update(other.projects)
+        self.compactions += other.compactions
+        self.busts = self._top_busts(self.busts + other.busts)
+
+    @staticmethod
+    def _group_json(counters: List) -> Dict:
+        turns, input_tokens, cache_creation, cache_read, busts, rewritten, lost = counters
+        prompt = input_tokens + cache_creation + cache_read
+        return {
+            "turns": turns,
+            "input_tokens": input_tokens,
+            "cache_creation_tokens": cache_creation,
+            "cache_read_tokens": cache_read,
+            "hit_ratio": cache_read / prompt if prompt else 0.0,
+            "busts": busts,
+            "tokens_rewritten": rewritten,
+            "lost_cost": lost,
+        }
+
+    def summary(self) -> Dict:
+        """Export shape: overall and per-cause totals, per-model/day/session groups and the costliest busts."""
+        overall = [0] * 6 + [0.0]
+        for counters in self.by_model.values():
+            overall[:] = map(add, overall, counters)
+        by_session = {}
+        for session_id, counters in self.by_session.items():
+            by_session[session_id] = dict(self._group_json(counters), project_path=self.projects.get(session_id))
+        return {
+            "overall": dict(self._group_json(overall), compactions=self.compactions),
+            "by_cause": {cause: {"busts": busts, "tokens_rewritten": rewritten, "lost_cost": lost}
+                         for cause, (busts, rewritten, lost) in self.by_cause.items()},
+            "by_model": {model: self._group_json(counters) for model, counters in self.by_model.items()},
+            "by_day": {day: self._group_json(self.by_day[day]) for day in sorted(self.by_day, reverse=True)},
+            "by_session": by_session,
+            "top_busts": self._top_busts(self.busts),
+        }
+
+
+def render_cache_efficiency(lines: List[str], summary: Dict):
+    """Append the prompt cache efficiency section (CacheEfficiencyAnalyzer.summary()) to lines."""
+    def row(label: str, group: Dict) -> str:
+        return (f"  {label:<28} {group['hit_ratio'] * 100:>8.1f}%  {format_number(group['cache_read_tokens']):<12} "
+                f"{format_number(group['cache_creation_tokens']):<12} {group['busts']:>6}  ${group['lost_cost']:.4f}")
+
+    header = f"{'Hit ratio':>9}  {'Cache Read':<12} {'Cache Write':<12} {'Busts':>6}  Lost"
+    overall = summary["overall"]
+    lines.append(f"{'PROMPT CACHE EFFICIENCY':<30} {header}")
+    lines.append("-" * 120)
+    lines.append(row("All turns", overall))
+    lines.append(f"  Busts are turns re-writing a cached prefix after {CACHE_BUST_MIN_READ_RUN}+ cache reads; "
+                 f"lost = re-written tokens at the write rate instead of the read rate "
+                 f"({overall['compactions']} compactions not counted)")
+    for cause, totals in summary["by_cause"].items():
+        if totals["busts"]:
+            lines.append(f"    {cause + ':':<26} {totals['busts']:>6} busts  "
+                         f"{format_number(totals['tokens_rewritten']):>8} tokens re-written  ${totals['lost_cost']:.4f}")
+
+    lines.append(f"\n  {'By model':<28} {header}")
+    by_model = summary["by_model"]
+    for model in sorted(by_model, key=lambda m: by_model[m]["turns"], reverse=True):
+        lines.append(row(model, by_model[model]))
+
+    days = list(summary["by_day"].items())
+    lines.append(f"\n  {'By day' + (f' (last {CACHE_REPORT_DAYS})' if len(days) > CACHE_REPORT_DAYS else ''):<28} {header}")
+    for day, group in days[:CACHE_REPORT_DAYS]:
+        lines.append(row(day, group))
+
+    by_session = summary["by_session"]
+    worst = heapq.nlargest(CACHE_BUST_TOP, (s for s in by_session if by_session[s]["busts"]),
+                           key=lambda s: by_session[s]["lost_cost"])
+    if worst:
+        lines.append(f"\n  {'Sessions losing the most':<28} {header}")
+        for session_id in worst:
+            lines.append(row(f"{session_id[:8]}... {Path(by_session[session_id]['project_path'] or '').name}"[:28],
+                             by_session[session_id]))
+
+    if summary["top_busts"]:
+        lines.append("\n  Costliest busts:")
+        for bust in summary["top_busts"]:
+            timestamp = parse_timestamp(bust["timestamp"])
+            when = timestamp.strftime("%Y-%m-%d %H:%M") if timestamp else "Unknown"
+            idle = f" ({bust['idle_seconds'] // 60}m)" if bust["cause"] == "idle past TTL" else ""
+            lines.append(f"    {when}  {bust['session_id'][:8]}{' ' + bust['agent_id'] if bust['agent_id'] else ''}  "
+                         f"{bust['model']}  {bust['cause']}{idle}: "
+                         f"{format_number(bust['tokens_rewritten'])} of {format_number(bust['previous_context'])} "
+                         f"tokens re-written  ${bust['lost_cost']:.4f}")
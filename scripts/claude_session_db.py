@@ -0,0 +1,248 @@
+"""
+SQLite store of API turns (the ingest and query commands) for analyze_claude_sessions.py.
+
+ingest_sessions() loads one row per counted turn into a database next to
+the parse cache, reading only the bytes appended to each file since the
+last ingest; query_sessions() answers grouped totals, or any SELECT, from
+its indexed tables without touching a transcript.
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies)
+"""
+
+import os
+import sqlite3
+import time
+from datetime import timezone
+from pathlib import Path
+from typing import Dict, Optional
+
+from claude_session_inventory import plan_sessions
+from claude_session_pricing import calculate_cost, normalize_model_name
+from claude_session_scan import (RecordSource, UsageCounters, default_cache_file, file_fingerprint, format_number,
+                                 is_archived, parse_timestamp, scan_session_file, session_file_id)
+
+# SQLite schema for the ingest/query commands; turns carry denormalized
+# project/branch columns so each grouping is a single indexed scan
+DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    project_path TEXT,
+    git_branch TEXT,
+    first_prompt TEXT,
+    summary TEXT,
+    message_count INTEGER,
+    created TEXT,
+    modified TEXT
+);
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    session_id TEXT,
+    agent_id TEXT,
+    inode INTEGER,
+    size INTEGER,
+    mtime_ns INTEGER,
+    offset INTEGER,
+    fingerprint TEXT
+);
+CREATE TABLE IF NOT EXISTS turns (
+    file_id INTEGER NOT NULL REFERENCES files(id),
+    session_id TEXT,
+    agent_id TEXT,
+    project_path TEXT,
+    git_branch TEXT,
+    model TEXT,
+    timestamp TEXT,
+    day TEXT,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    cache_creation_tokens INTEGER,
+    cache_read_tokens INTEGER,
+    cost REAL
+);
+CREATE INDEX IF NOT EXISTS turns_day ON turns(day);
+CREATE INDEX IF NOT EXISTS turns_project ON turns(project_path);
+CREATE INDEX IF NOT EXISTS turns_branch ON turns(git_branch);
+CREATE INDEX IF NOT EXISTS turns_model ON turns(model);
+CREATE INDEX IF NOT EXISTS turns_session ON turns(session_id);
+CREATE INDEX IF NOT EXISTS turns_file ON turns(file_id);
+CREATE INDEX IF NOT EXISTS files_source ON files(session_id, agent_id);
+"""
+# query command groupings and the turns column each one maps to
+DB_GROUP_COLUMNS = {
+    "day": "day",
+    "project": "project_path",
+    "branch": "git_branch",
+    "model": "model",
+    "session": "session_id",
+}
+DB_ORDER_BY = ["cost", "turns", "input", "output", "cache_read", "cache_write"]
+
+
+def default_db_file() -> Path:
+    """Location of the SQLite database used by the ingest and query commands."""
+    return default_cache_file().with_name("sessions.db")
+
+
+def open_session_db(db_file: Path) -> sqlite3.Connection:
+    """Open (creating if needed) the sessions database and make sure the schema exists."""
+    db_file.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_file))
+    conn.executescript(DB_SCHEMA)
+    return conn
+
+
+def _ingest_file(conn: sqlite3.Connection, session_path: Path, source: RecordSource) -> Optional[int]:
+    """Load the usage records of one file that are not in the database yet.
+
+    Files are tracked by path with the same size/mtime/inode/offset/fingerprint
+    bookkeeping as the parse cache: unchanged files are skipped, grown files
+    are read from the stored offset, and rewritten ones are re-ingested from
+    scratch. A file of the same session and agent whose path is gone (a
+    transcript replaced by its archive) is taken over under the new path and
+    re-ingested, so its turns are not loaded twice. Returns the number of
+    turns added, or None if the file was unchanged.
+    """
+    try:
+        st = session_path.stat()
+    except OSError as e:
+        print(f"Error reading {session_path}: {e}")
+        return None
+
+    key = str(session_path.absolute())
+    select = "SELECT id, inode, size, mtime_ns, offset, fingerprint FROM files WHERE path = ?"
+    row = conn.execute(select, (key,)).fetchone()
+    if row is None:
+        for file_id, path in conn.execute("SELECT id, path FROM files WHERE session_id IS ? AND agent_id IS ?",
+                                          (source.session_id, source.agent_id)).fetchall():
+            if not os.path.exists(path):
+                conn.execute("UPDATE files SET path = ? WHERE id = ?", (key, file_id))
+                row = conn.execute(select, (key,)).fetchone()
+                break
+    start_offset = 0
+    if row:
+        file_id, inode, size, mtime_ns, offset, fingerprint = row
+        if inode == st.st_ino and size == st.st_size and mtime_ns == st.st_mtime_ns:
+            return None
+        if not (inode == st.st_ino and offset <= st.st_size and not is_archived(session_path)
+                and file_fingerprint(session_path, offset) == fingerprint):
+            conn.execute("DELETE FROM turns WHERE file_id = ?", (file_id,))
+        else:
+            start_offset = offset
+    else:
+        file_id = conn.execute("INSERT INTO files (path, session_id, agent_id) VALUES (?, ?, ?)",
+                               (key, source.session_id, source.agent_id)).lastrowid
+
+    rows = []
+
+    def on_usage(msg: Dict, model: str, usage: Dict):
+        timestamp = parse_timestamp(msg.get("timestamp"))
+        rows.append((
+            file_id, source.session_id, source.agent_id, source.project_path, source.git_branch,
+            normalize_model_name(model), msg.get("timestamp"),
+            timestamp.astimezone(timezone.utc).strftime("%Y-%m-%d") if timestamp else None,
+            usage.get("input_tokens", 0), usage.get("output_tokens", 0),
+            usage.get("cache_creation_input_tokens", 0), usage.get("cache_read_input_tokens", 0),
+            calculate_cost(model, usage, msg.get("timestamp")),
+        ))
+
+    offset = scan_session_file(session_path, UsageCounters(), start_offset, on_usage=on_usage)
+    conn.executemany(
+        "INSERT INTO turns (file_id, session_id, agent_id, project_path, git_branch, model, timestamp, day,"
+        " input_tokens, output_tokens, cache_creation_tokens, cache_read_tokens, cost)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.execute("UPDATE files SET inode = ?, size = ?, mtime_ns = ?, offset = ?, fingerprint = ? WHERE id = ?",
+                 (st.st_ino, st.st_size, st.st_mtime_ns, offset, file_fingerprint(session_path, offset), file_id))
+    return len(rows)
+
+
+def ingest_sessions(db_file: Path):
+    """Incrementally load sessions, subagents and per-turn usage into SQLite."""
+    projects_dir = Path.home() / ".claude" / "projects"
+    if not projects_dir.exists():
+        print(f"Error: Claude projects directory not found at {projects_dir}")
+        return
+
+    started = time.perf_counter()
+    conn = open_session_db(db_file)
+    files_read = files_unchanged = turns_added = 0
+
+    with conn:
+        for entry, original_path, session_file, subagent_files in plan_sessions(projects_dir):
+            source = RecordSource(entry.get("sessionId"), original_path, entry.get("gitBranch", ""), None)
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, project_path, git_branch, first_prompt, summary,"
+                " message_count, created, modified) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (source.session_id, original_path, source.git_branch, entry.get("firstPrompt", "")[:100],
+                 entry.get("summary", ""), entry.get("messageCount", 0), entry.get("created"), entry.get("modified")),
+            )
+            files = [(session_file, source)]
+            files += [(subagent_file, source._replace(agent_id=session_file_id(subagent_file)))
+                      for subagent_file in subagent_files]
+            for path, file_source in files:
+                added = _ingest_file(conn, path, file_source)
+                if added is None:
+                    files_unchanged += 1
+                else:
+                    files_read += 1
+                    turns_added += added
+
+    total_turns = conn.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+    conn.close()
+    print(f"Ingested {turns_added} new turns from {files_read} files ({files_unchanged} unchanged) "
+          f"in {time.perf_counter() - started:.2f}s")
+    print(f"Database {db_file} now holds {total_turns} turns")
+
+
+def query_sessions(db_file: Path, group: str, order_by: str = "cost", days: Optional[int] = None,
+                   limit: int = 20, sql: Optional[str] = None):
+    """Answer a grouped usage question (or a raw SQL query) straight from the database."""
+    if not db_file.exists():
+        print(f"Error: database not found at {db_file} (run the ingest command first)")
+        return
+
+    conn = sqlite3.connect(str(db_file))
+    started = time.perf_counter()
+    try:
+        if sql:
+            cursor = conn.execute(sql)
+            rows = cursor.fetchall()
+            headers = [column[0] for column in cursor.description or []]
+        else:
+            column = DB_GROUP_COLUMNS[group]
+            where, params = "", []
+            if days is not None:
+                where = "WHERE day >= date('now', ?)"
+                params.append(f"-{days} days")
+            rows = conn.execute(
+                f"SELECT {column} AS grp, COUNT(*) AS turns, SUM(input_tokens) AS input,"
+                f" SUM(output_tokens) AS output, SUM(cache_read_tokens) AS cache_read,"
+                f" SUM(cache_creation_tokens) AS cache_write, SUM(cost) AS cost"
+                f" FROM turns {where} GROUP BY grp ORDER BY {order_by} DESC LIMIT ?",
+                params + [limit],
+            ).fetchall()
+            headers = None
+    except sqlite3.Error as e:
+        print(f"Error: {e}")
+        return
+    finally:
+        conn.close()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    if headers is not None:
+        print(" | ".join(headers))
+        for row in rows:
+            print(" | ".join(str(value) for value in row))
+    else:
+        title = f"{group.upper()} by {order_by}" + (f" (last {days} days)" if days is not None else "")
+        print(f"{title:<40} {'Turns':<10} {'Input':<12} {'Output':<12} {'Cache Read':<12} {'Cache Write':<12} {'Cost':<12}")
+        print("-" * 120)
+        for grp, turns, input_tok, output_tok, cache_read, cache_write, cost in rows:
+            label = str(grp) if grp not in (None, "") else "(none)"
+            print(f"{label[:40]:<40} {turns:<10} {format_number(input_tok):<12} {format_number(output_tok):<12} "
+                  f"{format_number(cache_read):<12} {format_number(cache_write):<12} ${cost:.4f}")
+    print(f"\n{len(rows)} rows in {elapsed_ms:.1f} ms")
@@ -0,0 +1,92 @@
+"""
+Analysis export writer for analyze_claude_sessions.py.
+
+write_export() streams the export one session (or bucket) at a time as
+indented JSON, compact JSON or NDJSON, optionally gzip-compressed, and
+renames it into place once it is complete.
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies)
+"""
+
+import gzip
+import json
+import os
+from itertools import compress
+from pathlib import Path
+from typing import Dict, Iterator
+
+# Analysis export layouts: indented JSON (the default), single-line JSON, and NDJSON with
+# the top-level fields on the first line and one session (or bucket) per following line
+EXPORT_FORMATS = ["json", "compact", "ndjson"]
+EXPORT_GZIP_LEVEL = 6
+
+
+def default_export_file(export_format: str = "json", compress: bool = False) -> Path:
+    """Export location in the current directory for the given format."""
+    suffix = ".ndjson" if export_format == "ndjson" else ".json"
+    return Path.cwd() / ("claude_sessions_analysis" + suffix + (".gz" if compress else ""))
+
+
+def _export_chunks(header: Dict, items_key: str, items, export_format: str) -> Iterator[str]:
+    """Encode the export piece by piece: the top-level fields, then one item at a time."""
+    pairs = items.items() if isinstance(items, dict) else None
+
+    if export_format == "ndjson":
+        yield json.dumps(header, default=str) + "\n"
+        if pairs is not None:
+            label = items_key[:-1]  # "buckets" -> {"bucket": key, ...}
+            for key, value in pairs:
+                yield json.dumps({label: key, **value}, default=str) + "\n"
+        else:
+            for value in items:
+                yield json.dumps(value, default=str) + "\n"
+        return
+
+    # Items are spliced in after the header's last field, so items_key stays last
+    if export_format == "json":
+        yield json.dumps(header, indent=2, default=str)[:-2] + f",\n  {json.dumps(items_key)}: "
+        open_items, separator, close_items, key_separator = "\n    ", ",\n    ", "\n  ", ": "
+        encode = lambda obj: json.dumps(obj, indent=2, default=str).replace("\n", "\n    ")
+    else:
+        yield json.dumps(header, separators=(",", ":"), default=str)[:-1] + f",{json.dumps(items_key)}:"
+        open_items, separator, close_items, key_separator = "", ",", "", ":"
+        encode = lambda obj: json.dumps(obj, separators=(",", ":"), default=str)
+
+    brackets = "{}" if pairs is not None else "[]"
+    first = True
+    for item in pairs if pairs is not None else items:
+        chunk = json.dumps(str(item[0])) + key_separator + encode(item[1]) if pairs is not None else encode(item)
+        yield (brackets[0] + open_items if first else separator) + chunk
+        first = False
+    yield (brackets if first else close_items + brackets[1]) + ("\n}" if export_format == "json" else "}")
+
+
+def write_export(output_file: Path, header: Dict, items_key: str, items, export_format: str = "json",
+                 compress: bool = False):
+    """Write the analysis export without building the whole document in memory.
+
+    header holds the top-level fields and items (a list of sessions, or a
+    dict of buckets) goes under items_key; only one item is encoded at a
+    time. "json" is byte-identical to json.dump(..., indent=2); "compact"
+    and "ndjson" use the C encoder and are several times faster. The file is
+    written under a temporary name next to output_file (gzip-compressed
+    when compress is set) and renamed into place once complete, so readers
+    never see a partial export. Raises OSError if it cannot be written.
+    """
+    tmp_file = output_file.with_name(output_file.name + ".tmp")
+    try:
+        if compress:
+            f = gzip.open(tmp_file, "wt", compresslevel=EXPORT_GZIP_LEVEL)
+        else:
+            f = open(tmp_file, "w")
+        with f:
+            f.writelines(_export_chunks(header, items_key, items, export_format))
+        os.replace(tmp_file, output_file)
+    except OSError:
+        try:
+            os.unlink(tmp_file)
+        except OSError:
+            pass
+        raise
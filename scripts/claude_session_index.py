@@ -0,0 +1,321 @@
+"""
+In-memory usage index behind the serve command of analyze_claude_sessions.py.
+
+UsageIndex keeps usage counters by day, project, branch, model and
+session, so any grouping, filter and page the dashboard asks for is
+answered from memory; LiveUsageIndex keeps it current by reading only the
+bytes appended to each file since the last refresh. serve_dashboard()
+builds one and hands it to the server in claude_usage_dashboard.py.
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies)
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import claude_usage_dashboard
+from claude_session_inventory import plan_sessions
+from claude_session_pricing import price_table
+from claude_session_scan import (RecordSource, UsageCounters, UsageRecord, hour_key, hour_timestamp, is_archived,
+                                 make_usage_handler, scan_session_file, session_file_id)
+from claude_session_shards import ROLLUP_FILE
+from claude_session_sketch import QuantileSketch
+
+# serve command: default address, how often session files are checked for appended turns and
+# the counters kept per index cell (the query metrics plus the peak context)
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8765
+SERVE_INTERVAL = 2.0
+INDEX_METRICS = ("turns", "input", "output", "cache_read", "cache_write", "cost", "peak_context")
+
+
+def _fold(target: List, counters: List):
+    """Add INDEX_METRICS counters into target (the peak context is a maximum)."""
+    target[0] += counters[0]
+    target[1] += counters[1]
+    target[2] += counters[2]
+    target[3] += counters[3]
+    target[4] += counters[4]
+    target[5] += counters[5]
+    if counters[6] > target[6]:
+        target[6] = counters[6]
+
+
+class UsageIndex:
+    """In-memory usage totals for the serve command, indexed by day, project, branch, model and session.
+
+    Cells are keyed by (day, project, branch, model, session_id) and hold
+    counters in INDEX_METRICS order; the day is the UTC day of each turn.
+    totals[dimension][value] keeps each dimension's groups (counters plus
+    the set of sessions) ready for unfiltered queries, and
+    postings[dimension][value] the cells of each value, so a filtered query
+    only visits the matching cells. Acts as a collector for
+    parse_session_files(); session metadata comes from the index entries.
+    """
+
+    DIMENSIONS = ("day", "project", "branch", "model", "session")
+    METRICS = INDEX_METRICS
+
+    def __init__(self):
+        self.cells: Dict[Tuple[str, ...], List] = {}
+        self.totals: Dict[str, Dict[str, List]] = {dimension: {} for dimension in self.DIMENSIONS}
+        self.postings: Dict[str, Dict[str, set]] = {dimension: {} for dimension in self.DIMENSIONS}
+        self.sessions: Dict[str, Dict] = {}
+
+    def add_counts(self, cell: Tuple[str, ...], counts: List):
+        """Fold counters (INDEX_METRICS order) into a cell and every total it belongs to."""
+        counters = self.cells.get(cell)
+        if counters is None:
+            counters = self.cells[cell] = [0, 0, 0, 0, 0, 0.0, 0]
+            for dimension, value in zip(self.DIMENSIONS, cell):
+                self.postings[dimension].setdefault(value, set()).add(cell)
+        _fold(counters, counts)
+        for dimension, value in zip(self.DIMENSIONS, cell):
+            total = self.totals[dimension].get(value)
+            if total is None:
+                total = self.totals[dimension][value] = [0, 0, 0, 0, 0, 0.0, 0, set()]
+            _fold(total, counts)
+            total[7].add(cell[4])
+
+    def add(self, record: UsageRecord):
+        table = price_table()
+        cost = table.cost(table.price_key(record.model, record.timestamp), (
+            record.input_tokens, record.output_tokens, record.cache_creation_tokens, record.cache_read_tokens))
+        context = record.input_tokens + record.cache_creation_tokens + record.cache_read_tokens
+        cell = (hour_key(record.timestamp)[:10] or "Unknown", record.source.project_path,
+                record.source.git_branch, record.model, record.source.session_id)
+        self.add_counts(cell, [1, record.input_tokens, record.output_tokens, record.cache_read_tokens,
+                               record.cache_creation_tokens, cost, context])
+
+    def add_shard_session(self, session: Dict, git_branch: str):
+        """Count a shard or rollup session record (its turns per model come from the context sketches)."""
+        table = price_table()
+        for hours in [session["hours"], *session["subagents"].values()]:
+            for hour, counters in hours.items():
+                timestamp = hour_timestamp(hour)
+                for model, tokens in counters[4].items():
+                    sketch = QuantileSketch.from_json(counters[5][model])
+                    cell = (hour[:10] or "Unknown", session["project_path"], git_branch, model,
+                            session["session_id"])
+                    self.add_counts(cell, [len(sketch), tokens[0], tokens[1], tokens[3], tokens[2],
+                                           table.cost(table.price_key(model, timestamp), tokens),
+                                           sketch.max if len(sketch) else 0])
+
+    def spawn(self) -> "UsageIndex":
+        return UsageIndex()
+
+    def merge(self, other: "UsageIndex"):
+        for cell, counts in other.cells.items():
+            self.add_counts(cell, counts)
+        self.sessions.update(other.sessions)
+
+    @staticmethod
+    def _row(key: str, counters: List, sessions: int) -> Dict:
+        row = dict(zip(INDEX_METRICS, counters))
+        row["key"] = key
+        row["sessions"] = sessions
+        return row
+
+    def query(self, by: str, filters: Optional[Dict[str, str]] = None, since: Optional[str] = None,
+              until: Optional[str] = None, sort: Optional[str] = None, descending: bool = True,
+              limit: int = 50, offset: int = 0) -> Dict:
+        """Group the counted turns by one dimension, keeping those matching every filter.
+
+        filters maps dimensions other than day to the value they must have;
+        since and until bound the day (inclusive, YYYY-MM-DD). Rows are
+        ordered by an INDEX_METRICS name or "key" (the default for days,
+        cost otherwise) and paged with limit and offset.
+        """
+        filters = {dimension: value for dimension, value in (filters or {}).items() if value is not None}
+        if not filters and not since and not until:
+            groups = self.totals[by]
+            totals = [0, 0, 0, 0, 0, 0.0, 0]
+            for group in self.totals["day"].values():
+                _fold(totals, group)
+            session_count = len(self.totals["session"])
+        else:
+            # Start from the smallest posting list (or the days in range) and check the rest per cell
+            candidates = None
+            if since or until:
+                candidates = [cell for day, cells in self.postings["day"].items()
+                              if not (since and day < since) and not (until and day > until) for cell in cells]
+            for dimension, value in filters.items():
+                cells = self.postings[dimension].get(value, ())
+                if candidates is None or len(cells) < len(candidates):
+                    candidates = cells
+            checks = [(self.DIMENSIONS.index(dimension), value) for dimension, value in filters.items()]
+            position = self.DIMENSIONS.index(by)
+            groups = {}
+            for cell in candidates:
+                if (since and cell[0] < since) or (until and cell[0] > until):
+                    continue
+                for idx, value in checks:
+                    if cell[idx] != value:
+                        break
+                else:
+                    counters = self.cells[cell]
+                    group = groups.get(cell[position])
+                    if group is None:
+                        group = groups[cell[position]] = [0, 0, 0, 0, 0, 0.0, 0, set()]
+                    _fold(group, counters)
+                    group[7].add(cell[4])
+            totals = [0, 0, 0, 0, 0, 0.0, 0]
+            for group in groups.values():
+                _fold(totals, group)
+            session_count = len(groups) if by == "session" else len(set().union(*(group[7] for group in groups.values())))
+
+        sort = sort or ("key" if by == "day" else "cost")
+        if sort == "key":
+            keys = sorted(groups, reverse=descending)
+        else:
+            column = INDEX_METRICS.index(sort)
+            keys = sorted(groups, key=lambda key: groups[key][column], reverse=descending)
+        rows = []
+        for key in keys[offset:offset + limit]:
+            row = self._row(key, groups[key], len(groups[key][7]))
+            if by == "session":
+                row.update(self.sessions.get(key, {}))
+            rows.append(row)
+        return {"by": by, "sort": sort, "descending": descending, "offset": offset, "limit": limit,
+                "total_rows": len(groups), "totals": self._row("total", totals, session_count), "rows": rows}
+
+    def facets(self) -> Dict[str, List[str]]:
+        """Known values of every dimension but session, for the page's filters."""
+        return {dimension: sorted(self.totals[dimension]) for dimension in ("day", "project", "branch", "model")}
+
+
+class LiveUsageIndex:
+    """A UsageIndex kept current with the session files, for the serve command.
+
+    Files are read from the offset where the previous read stopped, so a
+    refresh costs time proportional to the bytes appended; sessions are
+    only planned again when a session index, a rollup file or the listing
+    of a project directory (a new transcript) changed. Archived
+    sessions are counted from their rollups once. A file that shrank was
+    rewritten, and one that was read and then disappeared was archived or
+    pruned; either rebuilds the whole index. Queries and refreshes share
+    lock; appended turns are scanned into a spawned index outside it.
+    """
+
+    def __init__(self, projects_dir: Path, use_rollups: bool = True):
+        self.projects_dir = projects_dir
+        self.use_rollups = use_rollups
+        self.lock = threading.Lock()
+        self.index = UsageIndex()
+        self.offsets: Dict[Path, int] = {}
+        self.sources: Dict[Path, RecordSource] = {}
+        self.rolled_up = set()
+        self.index_mtimes: Dict[str, int] = {}
+        self.refreshed_at: Optional[str] = None
+        self.refresh_seconds = 0.0
+
+    def _index_mtimes(self) -> Dict[str, int]:
+        mtimes = {}
+        for project in os.scandir(self.projects_dir):
+            for path in (project.path, os.path.join(project.path, "sessions-index.json"),
+                         os.path.join(project.path, ROLLUP_FILE)):
+                try:
+                    mtimes[path] = os.stat(path).st_mtime_ns
+                except OSError:
+                    pass
+        return mtimes
+
+    def _plan(self, part: UsageIndex):
+        """Register the files and session metadata of every planned session."""
+        rollups: Dict[str, Dict] = {}
+        for entry, original_path, session_file, subagent_files in plan_sessions(self.projects_dir, rollups=rollups):
+            session_id = entry.get("sessionId")
+            part.sessions[session_id] = {
+                "project": original_path,
+                "branch": entry.get("gitBranch", ""),
+                "first_prompt": entry.get("firstPrompt", "")[:100],
+                "summary": entry.get("summary", ""),
+                "created": entry.get("created"),
+                "modified": entry.get("modified"),
+            }
+            rollup = rollups.get(session_id)
+            if rollup is not None and (session_file is None or (self.use_rollups and is_archived(session_file))):
+                if session_id not in self.rolled_up:
+                    self.rolled_up.add(session_id)
+                    part.add_shard_session(rollup, entry.get("gitBranch", ""))
+                continue
+            source = RecordSource(session_id, original_path, entry.get("gitBranch", ""), None)
+            for path in [session_file] + subagent_files:
+                if path not in self.offsets:
+                    self.offsets[path] = 0
+                    self.sources[path] = source if path == session_file else source._replace(
+                        agent_id=session_file_id(path))
+
+    def refresh(self, rebuild: bool = False) -> bool:
+        """Pick up appended turns and new sessions; returns True if the index changed.
+
+        rebuild reads everything again into a new index that then replaces
+        the current one.
+        """
+        started = time.perf_counter()
+        if rebuild:
+            self.offsets, self.sources, self.rolled_up, self.index_mtimes = {}, {}, set(), {}
+        part = UsageIndex()
+        mtimes = self._index_mtimes()
+        if mtimes != self.index_mtimes:
+            self.index_mtimes = mtimes
+            self._plan(part)
+        changed = bool(part.cells) or bool(part.sessions)
+        for path, offset in list(self.offsets.items()):
+            try:
+                size = path.stat().st_size
+            except OSError:
+                if offset:
+                    # Archived or pruned: its turns are now in the archive or the rollup
+                    return self.refresh(rebuild=True)
+                continue
+            if size == offset or (offset and is_archived(path)):
+                continue
+            if size < offset:
+                # Rewritten in place: counters cannot be taken back, so start over
+                return self.refresh(rebuild=True)
+            self.offsets[path] = scan_session_file(path, UsageCounters(), offset,
+                                                   on_usage=make_usage_handler([part], self.sources[path]))
+            changed = True
+        if rebuild or not (self.index.cells or self.index.sessions):
+            with self.lock:
+                self.index = part
+        elif changed:
+            with self.lock:
+                self.index.merge(part)
+        self.refresh_seconds = time.perf_counter() - started
+        self.refreshed_at = datetime.now().isoformat(timespec="seconds")
+        return changed
+
+    def status(self) -> Dict:
+        return {"files": len(self.offsets), "rolled_up_sessions": len(self.rolled_up),
+                "sessions": len(self.index.sessions), "cells": len(self.index.cells),
+                "refreshed_at": self.refreshed_at, "refresh_seconds": round(self.refresh_seconds, 4)}
+
+
+def serve_dashboard(host: str = SERVE_HOST, port: int = SERVE_PORT, interval: float = SERVE_INTERVAL,
+                    use_rollups: bool = True):
+    """Serve the usage dashboard and its JSON API until interrupted.
+
+    Sessions are loaded once into a LiveUsageIndex, which a background
+    thread refreshes every interval seconds; every request is answered from
+    the index without touching the session files. The page and the HTTP
+    server live in claude_usage_dashboard.py.
+    """
+    projects_dir = Path.home() / ".claude" / "projects"
+    if not projects_dir.exists():
+        print(f"Error: Claude projects directory not found at {projects_dir}")
+        return
+
+    live = LiveUsageIndex(projects_dir, use_rollups)
+    live.refresh()
+    status = live.status()
+    print(f"Indexed {status['sessions']} sessions from {status['files']} files "
+          f"({status['rolled_up_sessions']} from rollups) in {status['refresh_seconds']:.2f}s")
+    claude_usage_dashboard.serve(live, host, port, interval)
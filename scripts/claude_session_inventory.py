@@ -0,0 +1,260 @@
+"""
+Session inventory for analyze_claude_sessions.py.
+
+SessionInventory walks ~/.claude/projects once with os.scandir, collecting
+every transcript, subagent transcript and archive with its stat.
+plan_sessions() matches them against sessions-index.json (and the rollups
+of archived sessions) to decide which files a report opens, inferring an
+index entry for transcripts the index does not list yet.
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies)
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from claude_session_scan import (ARCHIVE_SUFFIXES, is_in_date_range, open_session_file, session_file_id,
+                                 session_overlaps_range)
+from claude_session_shards import load_rollups
+
+# Transcripts missing from sessions-index.json are costed too; their index entry is inferred from
+# at most this many bytes at the head of the file
+ORPHAN_HEAD_BYTES = 64 * 1024
+
+
+def _is_transcript(name: str) -> bool:
+    """Whether a file name is a live (.jsonl) or archived transcript."""
+    return name.endswith(".jsonl") or (name.endswith(ARCHIVE_SUFFIXES) and name.rpartition(".")[0].endswith(".jsonl"))
+
+
+def _transcript_rank(name: str) -> int:
+    """0 for a live transcript, then the archive suffixes in ARCHIVE_SUFFIXES order."""
+    return 0 if name.endswith(".jsonl") else 1 + ARCHIVE_SUFFIXES.index("." + name.rpartition(".")[2])
+
+
+class SessionInventory:
+    """Every project's transcripts, found in one os.scandir() walk of the projects tree.
+
+    projects maps each project directory to its session transcripts by
+    session id (the live .jsonl if there is one, else its archive), and
+    subagents maps (project directory, session id) to the session's agent
+    transcripts in agent id order. The directory entries of the walk are
+    kept, so stat() costs at most one system call per file, whoever asks
+    first (planning, the parse cache or the process pool's size ordering).
+    """
+
+    def __init__(self, projects_dir: Path):
+        self.projects_dir = projects_dir
+        self.projects: Dict[Path, Dict[str, Path]] = {}
+        self.subagents: Dict[Tuple[Path, str], List[Path]] = {}
+        self._entries: Dict[Path, os.DirEntry] = {}
+        self._rollups: Dict[Path, Dict[str, Dict]] = {}
+        try:
+            with os.scandir(projects_dir) as projects:
+                project_dirs = [Path(entry.path) for entry in projects if entry.is_dir()]
+        except OSError as e:
+            print(f"Error reading {projects_dir}: {e}")
+            project_dirs = []
+        for project_dir in project_dirs:
+            self._scan_project(project_dir)
+
+    @staticmethod
+    def _pick(found: Dict[str, os.DirEntry], entry: os.DirEntry):
+        """Keep entry under its file id unless a preferred transcript is there: live, then .gz, then .zst."""
+        name = entry.name
+        file_id = name[:name.rindex(".jsonl")]
+        current = found.get(file_id)
+        if current is None or _transcript_rank(entry.name) < _transcript_rank(current.name):
+            found[file_id] = entry
+
+    def _scan_project(self, project_dir: Path):
+        sessions: Dict[str, os.DirEntry] = {}
+        session_dirs = []
+        try:
+            with os.scandir(project_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        session_dirs.append(entry.name)
+                    elif _is_transcript(entry.name):
+                        self._pick(sessions, entry)
+        except OSError as e:
+            print(f"Error reading {project_dir}: {e}")
+        self.projects[project_dir] = {}
+        for session_id in sorted(sessions):
+            path = project_dir / sessions[session_id].name
+            self.projects[project_dir][session_id] = path
+            self._entries[path] = sessions[session_id]
+
+        for session_id in session_dirs:
+            agents: Dict[str, os.DirEntry] = {}
+            subagents_dir = os.path.join(project_dir, session_id, "subagents")
+            try:
+                with os.scandir(subagents_dir) as entries:
+                    for entry in entries:
+                        if entry.name.startswith("agent-") and _is_transcript(entry.name):
+                            self._pick(agents, entry)
+            except OSError:
+                continue  # no subagents
+            if agents:
+                paths = []
+                subagents_path = Path(subagents_dir)
+                for agent_id in sorted(agents, key=lambda agent_id: agent_id + ".jsonl"):
+                    path = subagents_path / agents[agent_id].name
+                    self._entries[path] = agents[agent_id]
+                    paths.append(path)
+                self.subagents[(project_dir, session_id)] = paths
+
+    def rollups(self, project_dir: Path) -> Dict[str, Dict]:
+        """The rollup records of a project's archived sessions (see load_rollups()), read once."""
+        rollups = self._rollups.get(project_dir)
+        if rollups is None:
+            rollups = self._rollups[project_dir] = load_rollups(project_dir)
+        return rollups
+
+    def session_file(self, project_dir: Path, session_id: str) -> Optional[Path]:
+        """The transcript of a session: the live .jsonl file if there is one, else its archive."""
+        return self.projects.get(project_dir, {}).get(session_id)
+
+    def subagent_files(self, project_dir: Path, session_id: str) -> List[Path]:
+        """Subagent transcripts of a session, live or archived (the live file wins), in agent id order."""
+        return self.subagents.get((project_dir, session_id), [])
+
+    def stat(self, path: Path) -> Optional[os.stat_result]:
+        """stat() of an inventoried file (cached by its directory entry), or None if it is gone."""
+        entry = self._entries.get(path)
+        try:
+            return entry.stat() if entry is not None else path.stat()
+        except OSError:
+            return None
+
+
+def infer_index_entry(session_path: Path, st: Optional[os.stat_result]) -> Tuple[Dict, Optional[str]]:
+    """A sessions-index.json entry for an orphaned transcript, and the working directory it ran in.
+
+    created, gitBranch, firstPrompt and summary come from the records in
+    the first ORPHAN_HEAD_BYTES of the file and modified from its mtime
+    (which also stands in for created when no record there has a
+    timestamp); messageCount is unknown (0). The entry is marked "orphan".
+    """
+    entry = {"sessionId": session_file_id(session_path), "firstPrompt": "", "summary": "", "messageCount": 0,
+             "created": None, "modified": None, "gitBranch": "", "orphan": True}
+    if st is not None:
+        modified = datetime.fromtimestamp(st.st_mtime, timezone.utc)
+        entry["modified"] = modified.strftime("%Y-%m-%dT%H:%M:%S.") + f"{modified.microsecond // 1000:03d}Z"
+    cwd = None
+    read = 0
+    try:
+        with open_session_file(session_path) as f:
+            for line in f:
+                read += len(line)
+                if read > ORPHAN_HEAD_BYTES:
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(record, dict):
+                    continue
+                if record.get("type") == "summary" and not entry["summary"]:
+                    entry["summary"] = record.get("summary") or ""
+                entry["created"] = entry["created"] or record.get("timestamp")
+                entry["gitBranch"] = entry["gitBranch"] or record.get("gitBranch") or ""
+                cwd = cwd or record.get("cwd")
+                message = record.get("message")
+                if not entry["firstPrompt"] and record.get("type") == "user" and not record.get("isMeta") \
+                        and isinstance(message, dict):
+                    content = message.get("content")
+                    if isinstance(content, list):
+                        content = next((block.get("text") for block in content
+                                        if isinstance(block, dict) and block.get("type") == "text"), None)
+                    if isinstance(content, str):
+                        entry["firstPrompt"] = content[:200]
+                if entry["created"] and entry["firstPrompt"] and entry["gitBranch"] and cwd:
+                    break
+    except OSError as e:
+        print(f"Error reading {session_path}: {e}")
+    entry["created"] = entry["created"] or entry["modified"]
+    return entry, cwd
+
+
+def plan_sessions(projects_dir: Path, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                  filter_turns: bool = False, rollups: Optional[Dict[str, Dict]] = None,
+                  inventory: Optional[SessionInventory] = None) -> List[Tuple[Dict, str, Optional[Path], List[Path]]]:
+    """Decide which session files need opening, using sessions-index.json and one walk of the tree.
+
+    Returns (index entry, project path, session file, subagent files) tuples.
+    The date filter is applied to the index entries here, before any
+    transcript is read: by creation date, or, with filter_turns, by whether
+    the session's created..modified span overlaps the range at all.
+    Session files may be archives (see the archive command). Files come
+    from inventory (a fresh SessionInventory if none is given).
+
+    Transcripts the index does not list (it lags behind live sessions) are
+    planned too, with an entry inferred by infer_index_entry() and marked
+    "orphan"; in a project without any index, the project path is the
+    working directory recorded in its first transcript.
+
+    When a rollups dict is given, it is filled with the rollup record (read
+    through inventory.rollups()) of every planned session that has one, and
+    sessions known only from their rollup (archive pruned, or dropped from
+    the index) are planned too, with no session file.
+    """
+    if inventory is None:
+        inventory = SessionInventory(projects_dir)
+    planned = []
+
+    for project_dir, session_files in inventory.projects.items():
+        index_file = project_dir / "sessions-index.json"
+        index_data = {}
+        try:
+            with open(index_file, 'r') as f:
+                index_data = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error reading {index_file}: {e}")
+            continue
+
+        entries = index_data.get("entries", [])
+        original_path = index_data.get("originalPath")
+        project_rollups = inventory.rollups(project_dir) if rollups is not None else {}
+        known = {entry.get("sessionId") for entry in entries}
+        if project_rollups:
+            entries = entries + [dict(rollup["entry"], sessionId=session_id)
+                                 for session_id, rollup in project_rollups.items() if session_id not in known]
+            known.update(project_rollups)
+        for session_id, session_file in session_files.items():
+            if session_id not in known:
+                entry, cwd = infer_index_entry(session_file, inventory.stat(session_file))
+                original_path = original_path or cwd
+                entries.append(entry)
+        original_path = original_path or "Unknown"
+
+        # Collect each in-range session file and its subagent files
+        for entry in entries:
+            if filter_turns:
+                if not session_overlaps_range(entry, start_date, end_date):
+                    continue
+            elif not is_in_date_range(entry.get("created"), start_date, end_date):
+                continue
+
+            session_id = entry.get("sessionId")
+            session_file = inventory.session_file(project_dir, session_id)
+            rollup = project_rollups.get(session_id)
+
+            if session_file is None:
+                if rollup is not None:
+                    rollups[session_id] = rollup
+                    planned.append((entry, original_path, None, []))
+                continue
+            if rollup is not None:
+                rollups[session_id] = rollup
+
+            planned.append((entry, original_path, session_file, inventory.subagent_files(project_dir, session_id)))
+
+    return planned
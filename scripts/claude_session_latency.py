@@ -0,0 +1,225 @@
+"""
+Response latency and output throughput (--latency) for analyze_claude_sessions.py.
+
+LatencyAnalyzer pairs each response with the record sent before it and
+keeps quantile sketches of the latency and output tokens per second of
+those turns per model, project, day and context size.
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies)
+"""
+
+from bisect import bisect_right
+from operator import add
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from claude_session_scan import RecordSource, UsageRecord, hour_key, parse_timestamp
+from claude_session_sketch import QuantileSketch
+
+# --latency: a turn's latency runs from the last record written before it (the prompt or tool
+# results sent) to the response record, and its throughput is output tokens over that time. Gaps
+# over LATENCY_MAX_SECONDS are interrupted or resumed sessions rather than responses and are left
+# out. Turns are also grouped by context size at LATENCY_CONTEXT_BANDS; the report lists the
+# LATENCY_REPORT_ROWS busiest projects and most recent days.
+LATENCY_PERCENTILES = (50, 95, 99)
+LATENCY_MAX_SECONDS = 600
+LATENCY_CONTEXT_BANDS = (10_000, 50_000, 100_000, 150_000, 200_000)
+LATENCY_REPORT_ROWS = 14
+
+
+class LatencyAnalyzer:
+    """Response latency and output throughput per model, day, project and context size (--latency).
+
+    Records are followed in file order: each usage record is paired with
+    the last record written before it, the prompt or tool results that
+    went out with the request. Only the timestamp of that record is kept,
+    so memory does not grow with the files. Latency is measured up to the
+    response record, so it covers generation as well as time to first
+    token, and throughput is output tokens over that time. A response
+    split over several records is timed once, from its first record; later
+    ones, and turns with nothing before them in the file, are counted as
+    unpaired. Acts as a collector for parse_session_files().
+
+    Group counters are [turns, seconds, output_tokens, QuantileSketch of
+    latency in ms, QuantileSketch of output tokens per second]. How latency
+    scales with context is fitted over all turns by least squares
+    (latency ~ context + output tokens) from running sums, so it merges too.
+    """
+
+    BANDS = ([f"<{LATENCY_CONTEXT_BANDS[0] // 1000}k"]
+             + [f"{low // 1000}k-{high // 1000}k" for low, high in zip(LATENCY_CONTEXT_BANDS, LATENCY_CONTEXT_BANDS[1:])]
+             + [f"{LATENCY_CONTEXT_BANDS[-1] // 1000}k+"])
+
+    def __init__(self):
+        self.by_model: Dict[str, List] = {}
+        self.by_day: Dict[str, List] = {}
+        self.by_project: Dict[str, List] = {}
+        self.by_context: Dict[str, List] = {}
+        # Sums for the fit: n, context, output, latency and their products (cc, co, oo, cy, oy)
+        self.moments = [0.0] * 9
+        self.unpaired = 0
+        self.outliers = 0
+        # File being fed: timestamp of the last request record, and the one taken by the pending response
+        self._source = None
+        self._request = None
+        self._pending = None
+
+    def add_content(self, source: RecordSource, msg: Dict):
+        if source != self._source:
+            self._source = source
+            self._request = self._pending = None
+        timestamp = msg.get("timestamp")
+        if not timestamp:
+            return
+        message = msg.get("message")
+        if isinstance(message, dict) and message.get("role") == "assistant":
+            self._pending, self._request = self._request, None
+        else:
+            self._request = timestamp
+
+    @staticmethod
+    def _count(groups: Dict[str, List], key: str, seconds: float, output_tokens: int, throughput: float):
+        counters = groups.get(key)
+        if counters is None:
+            counters = groups[key] = [0, 0.0, 0, QuantileSketch(), QuantileSketch()]
+        counters[0] += 1
+        counters[1] += seconds
+        counters[2] += output_tokens
+        counters[3].add(round(seconds * 1000))
+        counters[4].add(round(throughput))
+
+    def add(self, record: UsageRecord):
+        request, self._pending = self._pending, None
+        if record.source != self._source or request is None:
+            self.unpaired += 1
+            return
+        start, end = parse_timestamp(request), parse_timestamp(record.timestamp)
+        try:
+            seconds = (end - start).total_seconds()
+        except TypeError:  # missing, or naive and aware timestamps
+            self.unpaired += 1
+            return
+        if not 0 < seconds <= LATENCY_MAX_SECONDS:
+            self.outliers += 1
+            return
+        context = record.input_tokens + record.cache_creation_tokens + record.cache_read_tokens
+        output_tokens = record.output_tokens
+        throughput = output_tokens / seconds
+        self._count(self.by_model, record.model, seconds, output_tokens, throughput)
+        self._count(self.by_day, hour_key(record.timestamp)[:10] or "Unknown", seconds, output_tokens, throughput)
+        self._count(self.by_project, record.source.project_path or "Unknown", seconds, output_tokens, throughput)
+        self._count(self.by_context, self.BANDS[bisect_right(LATENCY_CONTEXT_BANDS, context)], seconds,
+                    output_tokens, throughput)
+        self.moments[:] = map(add, self.moments, (1, context, output_tokens, seconds, context * context,
+                                                  context * output_tokens, output_tokens * output_tokens,
+                                                  context * seconds, output_tokens * seconds))
+
+    def spawn(self) -> "LatencyAnalyzer":
+        return LatencyAnalyzer()
+
+    def merge(self, other: "LatencyAnalyzer"):
+        for name in ("by_model", "by_day", "by_project", "by_context"):
+            ours = getattr(self, name)
+            for key, counters in getattr(other, name).items():
+                mine = ours.get(key)
+                if mine is None:
+                    ours[key] = counters
+                    continue
+                mine[:3] = map(add, mine[:3], counters[:3])
+                mine[3].merge(counters[3])
+                mine[4].merge(counters[4])
+        self.moments[:] = map(add, self.moments, other.moments)
+        self.unpaired += other.unpaired
+        self.outliers += other.outliers
+
+    @staticmethod
+    def _group_json(counters: List) -> Dict:
+        turns, seconds, output_tokens, latency, throughput = counters
+        qs = [p / 100 for p in LATENCY_PERCENTILES]
+        return {
+            "turns": turns,
+            "latency_seconds": {f"p{p}": ms / 1000 for p, ms in zip(LATENCY_PERCENTILES, latency.quantiles(qs))},
+            "output_tokens_per_second": dict(zip((f"p{p}" for p in LATENCY_PERCENTILES), throughput.quantiles(qs))),
+            "mean_latency_seconds": seconds / turns if turns else 0.0,
+            "mean_output_tokens_per_second": output_tokens / seconds if seconds else 0.0,
+        }
+
+    def _fit(self) -> Optional[Dict]:
+        """Least squares latency = base + a * context + b * output over all turns, None if underdetermined."""
+        n, c, o, y, cc, co, oo, cy, oy = self.moments
+        rows = [[n, c, o, y], [c, cc, co, cy], [o, co, oo, oy]]
+        for col in range(3):  # Gaussian elimination with partial pivoting
+            pivot = max(range(col, 3), key=lambda row: abs(rows[row][col]))
+            if abs(rows[pivot][col]) < 1e-9:
+                return None
+            rows[col], rows[pivot] = rows[pivot], rows[col]
+            for row in range(3):
+                if row != col:
+                    factor = rows[row][col] / rows[col][col]
+                    rows[row] = [a - factor * b for a, b in zip(rows[row], rows[col])]
+        base, per_context, per_output = (rows[i][3] / rows[i][i] for i in range(3))
+        return {
+            "turns": int(n),
+            "base_seconds": base,
+            "seconds_per_10k_context": per_context * 10_000,
+            "seconds_per_1k_output": per_output * 1000,
+        }
+
+    def summary(self) -> Dict:
+        """Export shape: overall and per-model/context/project/day groups, and the context fit."""
+        overall = [0, 0.0, 0, QuantileSketch(), QuantileSketch()]
+        for counters in self.by_model.values():
+            overall[:3] = map(add, overall[:3], counters[:3])
+            overall[3].merge(counters[3])
+            overall[4].merge(counters[4])
+        by_project = self.by_project
+        return {
+            "overall": dict(self._group_json(overall), unpaired_turns=self.unpaired, outliers=self.outliers),
+            "by_model": {model: self._group_json(counters) for model, counters in self.by_model.items()},
+            "by_context": {band: self._group_json(self.by_context[band]) for band in self.BANDS
+                           if band in self.by_context},
+            "by_project": {project: self._group_json(by_project[project])
+                           for project in sorted(by_project, key=lambda p: by_project[p][0], reverse=True)},
+            "by_day": {day: self._group_json(self.by_day[day]) for day in sorted(self.by_day, reverse=True)},
+            "context_scaling": self._fit(),
+        }
+
+
+def render_latency(lines: List[str], summary: Dict):
+    """Append the response latency and throughput section (LatencyAnalyzer.summary()) to lines."""
+    def row(label: str, group: Dict) -> str:
+        latency = "  ".join(f"{seconds:>6.1f}" for seconds in group["latency_seconds"].values())
+        throughput = "  ".join(f"{rate:>6}" for rate in group["output_tokens_per_second"].values())
+        return (f"  {label[:28]:<28} {group['turns']:>7}  {latency}  {throughput}  "
+                f"{group['mean_output_tokens_per_second']:>8.1f}")
+
+    percentiles = "  ".join(f"{f'p{p}':>6}" for p in LATENCY_PERCENTILES)
+    header = f"{'Turns':>7}  {percentiles}  {percentiles}  {'Mean':>8}"
+    overall = summary["overall"]
+    lines.append(f"{'RESPONSE LATENCY AND THROUGHPUT':<30} {'':>7}  {'Latency (s)':^22}  {'Output tokens/s':^22}")
+    lines.append(f"{'':<30} {header}")
+    lines.append("-" * 120)
+    lines.append(row("All turns", overall))
+    lines.append(f"  Latency runs from the prompt or tool results sent to the response record "
+                 f"({overall['unpaired_turns']} turns unpaired, {overall['outliers']} gaps over "
+                 f"{LATENCY_MAX_SECONDS}s left out)")
+
+    sections = [("By model", sorted(summary["by_model"].items(), key=lambda item: item[1]["turns"], reverse=True)),
+                ("By context size", list(summary["by_context"].items()))]
+    for title, groups in (("By project", list(summary["by_project"].items())),
+                          ("By day", list(summary["by_day"].items()))):
+        if len(groups) > LATENCY_REPORT_ROWS:
+            title += f" ({'busiest' if title == 'By project' else 'last'} {LATENCY_REPORT_ROWS})"
+        sections.append((title, groups[:LATENCY_REPORT_ROWS]))
+    for title, groups in sections:
+        lines.append(f"\n  {title:<28} {header}")
+        for label, group in groups:
+            lines.append(row(Path(label).name or label if title.startswith("By project") else label, group))
+
+    fit = summary["context_scaling"]
+    if fit is not None:
+        lines.append(f"\n  Latency ~ {fit['base_seconds']:.2f}s {fit['seconds_per_10k_context']:+.3f}s per 10k "
+                     f"context tokens {fit['seconds_per_1k_output']:+.2f}s per 1k output tokens "
+                     f"(least squares over {fit['turns']} turns)")
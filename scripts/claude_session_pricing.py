@@ -0,0 +1,227 @@
+"""
+Token prices for analyze_claude_sessions.py.
+
+Canonical model names (normalize_model_name), the effective-dated
+PriceTable read from claude_pricing.json (or the built-in PRICING when it
+is missing), and the table every cost calculation uses, installed with
+set_price_table() and read with price_table().
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies)
+"""
+
+import hashlib
+import json
+import re
+from bisect import bisect_right
+from collections import defaultdict
+from functools import lru_cache
+from operator import mul
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Built-in Claude API pricing (as of January 2025), used when claude_pricing.json is missing
+# https://www.anthropic.com/api#pricing
+PRICING = {
+    "claude-opus-4-5": {
+        "input": 0.015 / 1000,      # $15 per MTok
+        "output": 0.075 / 1000,     # $75 per MTok
+        "cache_write": 0.01875 / 1000,  # $18.75 per MTok
+        "cache_read": 0.0015 / 1000,    # $1.50 per MTok
+    },
+    "claude-sonnet-4-5": {
+        "input": 0.003 / 1000,      # $3 per MTok
+        "output": 0.015 / 1000,     # $15 per MTok
+        "cache_write": 0.00375 / 1000,  # $3.75 per MTok
+        "cache_read": 0.0003 / 1000,    # $0.30 per MTok
+    },
+    "claude-sonnet-3-5": {
+        "input": 0.003 / 1000,      # $3 per MTok
+        "output": 0.015 / 1000,     # $15 per MTok
+        "cache_write": 0.00375 / 1000,  # $3.75 per MTok
+        "cache_read": 0.0003 / 1000,    # $0.30 per MTok
+    },
+    "claude-haiku-4-5": {
+        "input": 0.0008 / 1000,     # $0.80 per MTok
+        "output": 0.004 / 1000,     # $4 per MTok
+        "cache_write": 0.001 / 1000,    # $1 per MTok
+        "cache_read": 0.00008 / 1000,   # $0.08 per MTok
+    },
+    "claude-haiku-3-5": {
+        "input": 0.0008 / 1000,     # $0.80 per MTok
+        "output": 0.004 / 1000,     # $4 per MTok
+        "cache_write": 0.001 / 1000,    # $1 per MTok
+        "cache_read": 0.00008 / 1000,   # $0.08 per MTok
+    },
+}
+
+# Price file (--pricing, default claude_pricing.json next to this script)
+# format version, and the order of the per-token price and token vectors
+PRICE_FILE_VERSION = 1
+PRICE_FIELDS = ("input", "output", "cache_write", "cache_read")
+
+# Model name mapping (various formats to canonical)
+MODEL_MAP = {
+    "claude-opus-4-5": "claude-opus-4-5",
+    "claude-opus-4": "claude-opus-4-5",
+    "claude-opus": "claude-opus-4-5",
+    "claude-sonnet-4-5": "claude-sonnet-4-5",
+    "claude-sonnet-4": "claude-sonnet-4-5",
+    "claude-sonnet": "claude-sonnet-4-5",
+    "claude-sonnet-3-5": "claude-sonnet-3-5",
+    "claude-haiku-4-5": "claude-haiku-4-5",
+    "claude-haiku-3-5": "claude-haiku-3-5",
+    "claude-haiku": "claude-haiku-4-5",
+}
+
+
+@lru_cache(maxsize=None)
+def normalize_model_name(model: str) -> str:
+    """Normalize model name to canonical form (memoized per raw model string)."""
+    # Remove version suffixes like -20250929 or -20251101
+    base_model = re.sub(r'-20\d{6}$', '', model)
+    return MODEL_MAP.get(base_model, base_model)
+
+
+def default_price_file() -> Path:
+    """Price table shipped next to this script."""
+    return Path(__file__).resolve().with_name("claude_pricing.json")
+
+
+class PriceTable:
+    """Per-model prices with effective dates.
+
+    Each canonical model name maps to a list of (effective_date, prices)
+    periods, where effective_date is a UTC "YYYY-MM-DD" day and prices the
+    per-token vector in PRICE_FIELDS order. A turn is priced by the last period
+    in force on its day; turns before the first period use the first one and
+    turns without a timestamp the latest one. Unknown models are priced as
+    fallback_model and reported once per run.
+
+    Token counters are keyed by price_key(): the model name for its first
+    period and "model@date" for later ones, so cost is one dot product per key.
+    """
+
+    def __init__(self, models: Dict[str, List[Tuple[str, Tuple[float, ...]]]],
+                 fallback_model: str = "claude-sonnet-4-5"):
+        if fallback_model not in models:
+            raise ValueError(f"no prices for fallback model {fallback_model}")
+        self.models = {model: sorted(periods) for model, periods in models.items() if periods}
+        self.fallback_model = fallback_model
+        self._dates = {model: [date for date, _ in periods] for model, periods in self.models.items()}
+        self._warned = set()
+
+    @classmethod
+    def from_pricing(cls, pricing: Dict[str, Dict[str, float]]) -> "PriceTable":
+        """Single-period table from the built-in PRICING dict."""
+        return cls({model: [("", tuple(prices[name] for name in PRICE_FIELDS))] for model, prices in pricing.items()})
+
+    @classmethod
+    def load(cls, price_file: Path) -> "PriceTable":
+        """Read a price file; prices in it are in dollars per million tokens.
+
+        {"version": 1, "fallback_model": "...",
+         "models": {"claude-opus-4-5": [{"effective": "2025-01-01", "input": 15.0, "output": 75.0,
+                                         "cache_write": 18.75, "cache_read": 1.5}, ...]}}
+
+        Raises OSError if the file cannot be read and ValueError if it is malformed.
+        """
+        with open(price_file, 'r') as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or data.get("version") != PRICE_FILE_VERSION:
+            raise ValueError(f"unsupported price file version {data.get('version') if isinstance(data, dict) else None!r}")
+        try:
+            models = {
+                model: [(period.get("effective", ""), tuple(float(period[name]) / 1_000_000 for name in PRICE_FIELDS))
+                        for period in periods]
+                for model, periods in data["models"].items()
+            }
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"malformed price entry: {e!r}")
+        return cls(models, data.get("fallback_model", "claude-sonnet-4-5"))
+
+    def signature(self) -> str:
+        """Hash of the period boundaries; counters keyed under other boundaries cannot be reused."""
+        return hashlib.sha1(json.dumps([self.fallback_model, self._dates], sort_keys=True).encode()).hexdigest()
+
+    def effective_dates(self, model: str) -> List[str]:
+        return self._dates.get(model) or self._dates[self.fallback_model]
+
+    def price_key(self, model: str, timestamp: Optional[str]) -> str:
+        """Counter key for one turn of a canonical model at an ISO-8601 UTC timestamp."""
+        dates = self.effective_dates(model)
+        if len(dates) == 1:
+            return model
+        idx = bisect_right(dates, timestamp[:10]) - 1 if timestamp else len(dates) - 1
+        return model if idx <= 0 else f"{model}@{dates[idx]}"
+
+    def prices(self, price_key: str) -> Tuple[float, ...]:
+        model, _, effective = price_key.partition("@")
+        periods = self.models.get(model)
+        if periods is None:
+            # Skip synthetic model (internal Claude Code marker)
+            if model not in self._warned and model != "<synthetic>":
+                print(f"Warning: Unknown model {model}, using {self.fallback_model} pricing")
+            self._warned.add(model)
+            periods = self.models[self.fallback_model]
+        if not effective:
+            return periods[0][1]
+        idx = bisect_right(self._dates.get(model) or self._dates[self.fallback_model], effective) - 1
+        return periods[max(idx, 0)][1]
+
+    def cost(self, price_key: str, tokens) -> float:
+        """Dot product of a (input, output, cache_creation, cache_read) token vector and its prices."""
+        return sum(map(mul, tokens, self.prices(price_key)))
+
+
+_price_table: Optional[PriceTable] = None
+
+
+def set_price_table(table: PriceTable):
+    """Install the PriceTable used for all cost calculations (also the process pool initializer)."""
+    global _price_table
+    _price_table = table
+
+
+def price_table() -> PriceTable:
+    """The PriceTable in use: the bundled price file, or PRICING when it is missing."""
+    global _price_table
+    if _price_table is None:
+        try:
+            _price_table = PriceTable.load(default_price_file())
+        except OSError:
+            _price_table = PriceTable.from_pricing(PRICING)
+        except ValueError as e:
+            print(f"Warning: ignoring {default_price_file()}: {e}")
+            _price_table = PriceTable.from_pricing(PRICING)
+    return _price_table
+
+
+def calculate_cost(model: str, usage: Dict, timestamp: Optional[str] = None) -> float:
+    """Calculate cost for a given usage object, at the prices in force at timestamp."""
+    table = price_table()
+    return table.cost(table.price_key(normalize_model_name(model), timestamp), (
+        usage.get("input_tokens", 0),
+        usage.get("output_tokens", 0),
+        usage.get("cache_creation_input_tokens", 0),
+        usage.get("cache_read_input_tokens", 0),
+    ))
+
+
+def price_tokens(tokens_by_price: Dict[str, List[int]]) -> Tuple[Dict[str, Dict], Dict[str, float]]:
+    """Turn token counters keyed by price key into (tokens_by_model, cost_by_model)."""
+    table = price_table()
+    tokens_by_model = {}
+    cost_by_model = defaultdict(float)
+    for price_key, counts in tokens_by_price.items():
+        model = price_key.partition("@")[0]
+        tokens = tokens_by_model.get(model)
+        if tokens is None:
+            tokens = tokens_by_model[model] = {"input": 0, "output": 0, "cache_creation": 0, "cache_read": 0}
+        tokens["input"] += counts[0]
+        tokens["output"] += counts[1]
+        tokens["cache_creation"] += counts[2]
+        tokens["cache_read"] += counts[3]
+        cost_by_model[model] += table.cost(price_key, counts)
+    return tokens_by_model, dict(cost_by_model)
@@ -0,0 +1,377 @@
+"""
+Sampled usage estimates (--sample) for analyze_claude_sessions.py.
+
+estimate_sessions() draws a fraction of the sessions of each project, and
+of the chunks of large files, and scales what they hold up to totals with
+Student t confidence intervals; validate_sample() checks those intervals
+against the exact totals of the same sessions.
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies)
+"""
+
+import hashlib
+import heapq
+import json
+import math
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from claude_session_export import default_export_file, write_export
+from claude_session_inventory import SessionInventory, plan_sessions
+from claude_session_pricing import price_tokens
+from claude_session_scan import (USAGE_KEY, UsageCounters, add_usage, extract_usage, format_number, is_archived,
+                                 parse_session_file)
+from claude_session_shards import shard_session_usages
+
+# --sample: the fraction of sessions drawn in each project (at least SAMPLE_MIN_PER_STRATUM), and of
+# the SAMPLE_CHUNK_BYTES chunks read in files over SAMPLE_FILE_BYTES (at least SAMPLE_MIN_CHUNKS);
+# intervals are Student t intervals at the confidence of SAMPLE_Z standard normal errors (95%), with
+# the t quantiles of SAMPLE_T_QUANTILES (degrees of freedom -> two-sided 95% quantile, from the
+# standard tables; SAMPLE_Z is their limit).
+# Every SAMPLE_METRICS total is estimated for all models together and per model. With fewer than
+# SAMPLE_MIN_SESSIONS sessions drawn the intervals are flagged as unreliable.
+SAMPLE_FRACTION = 0.05
+SAMPLE_MIN_PER_STRATUM = 2
+SAMPLE_MIN_SESSIONS = 30
+SAMPLE_FILE_BYTES = 4 * 1024 * 1024
+SAMPLE_CHUNK_BYTES = 256 * 1024
+SAMPLE_MIN_CHUNKS = 4
+SAMPLE_Z = 1.96
+SAMPLE_T_QUANTILES = ((1, 12.706), (2, 4.303), (3, 3.182), (4, 2.776), (5, 2.571), (6, 2.447), (7, 2.365),
+                      (8, 2.306), (9, 2.262), (10, 2.228), (12, 2.179), (15, 2.131), (20, 2.086), (25, 2.060),
+                      (30, 2.042), (40, 2.021), (60, 2.000), (120, 1.980))
+SAMPLE_ALL_MODELS = "All models"
+SAMPLE_METRICS = ("cost", "turns", "input_tokens", "output_tokens", "cache_read_tokens", "cache_creation_tokens")
+
+
+def _sample_rank(key: str) -> float:
+    """Deterministic pseudo-random rank in [0, 1) of a session id or file chunk, for sampling."""
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8", "replace"), digest_size=8).digest(), "big") / 2 ** 64
+
+
+def scan_byte_range(session_path: Path, start: int, end: int) -> UsageCounters:
+    """Count the usage records of the lines of an uncompressed session file that start in [start, end).
+
+    Lines are assigned to the range they start in, so adjacent ranges split
+    a file without counting any line twice.
+    """
+    session_data = UsageCounters()
+    try:
+        with open(session_path, "rb") as f:
+            if start:
+                f.seek(start - 1)
+                f.readline()  # rest of the line running into the range, unless start is a line start
+            offset = f.tell()
+            while offset < end:
+                line = f.readline()
+                if not line:
+                    break
+                offset += len(line)
+                if USAGE_KEY not in line:
+                    continue
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    continue
+                usage, model = extract_usage(msg)
+                if usage and model:
+                    add_usage(session_data, model, usage, msg.get("timestamp"))
+    except OSError as e:
+        print(f"Error reading {session_path}: {e}")
+    return session_data
+
+
+def _sample_values(session_data: UsageCounters) -> Dict[Tuple[str, str], float]:
+    """The SAMPLE_METRICS of an aggregate, for all models ("All models") and per model."""
+    tokens_by_model, cost_by_model = price_tokens(session_data.by_price)
+    values = {(SAMPLE_ALL_MODELS, "cost"): sum(cost_by_model.values()),
+              (SAMPLE_ALL_MODELS, "turns"): session_data["turn_count"]}
+    for name in SAMPLE_METRICS[2:]:
+        values[(SAMPLE_ALL_MODELS, name)] = session_data[name]
+    for model, tokens in tokens_by_model.items():
+        values[(model, "cost")] = cost_by_model[model]
+        values[(model, "turns")] = len(session_data.context_by_model.get(model, ()))
+        values[(model, "input_tokens")] = tokens["input"]
+        values[(model, "output_tokens")] = tokens["output"]
+        values[(model, "cache_read_tokens")] = tokens["cache_read"]
+        values[(model, "cache_creation_tokens")] = tokens["cache_creation"]
+    return values
+
+
+def _add_values(target: Dict, values: Dict, scale: float = 1.0):
+    for key, value in values.items():
+        target[key] = target.get(key, 0.0) + value * scale
+
+
+def sample_file(session_path: Path, fraction: float, size: int) -> Tuple[Dict, Dict, int]:
+    """Estimate the SAMPLE_METRICS of one file, reading only a sample of its chunks when it is large.
+
+    Files up to SAMPLE_FILE_BYTES, and archives, are read whole. Larger files
+    are cut into SAMPLE_CHUNK_BYTES chunks, of which the fraction (at least
+    SAMPLE_MIN_CHUNKS) ranked first by _sample_rank() is read and scaled up.
+    Returns the estimates, their sampling variance (0 when read whole) and
+    the bytes read.
+    """
+    if size <= SAMPLE_FILE_BYTES or is_archived(session_path):
+        return _sample_values(parse_session_file(session_path)), {}, size
+    chunks = -(-size // SAMPLE_CHUNK_BYTES)
+    sampled = min(chunks, max(SAMPLE_MIN_CHUNKS, math.ceil(fraction * chunks)))
+    picked = heapq.nsmallest(sampled, range(chunks), key=lambda idx: _sample_rank(f"{session_path.name}:{idx}"))
+    sums: Dict = {}
+    squares: Dict = {}
+    for idx in picked:
+        values = _sample_values(scan_byte_range(session_path, idx * SAMPLE_CHUNK_BYTES, (idx + 1) * SAMPLE_CHUNK_BYTES))
+        _add_values(sums, values)
+        _add_values(squares, {key: value * value for key, value in values.items()})
+    estimates = {key: total * chunks / sampled for key, total in sums.items()}
+    variances = {}
+    if sampled < chunks:
+        for key, total in sums.items():
+            spread = (squares[key] - total * total / sampled) / (sampled - 1) if sampled > 1 else 0.0
+            variances[key] = chunks * chunks * (1 - sampled / chunks) * max(spread, 0.0) / sampled
+    return estimates, variances, min(size, sampled * SAMPLE_CHUNK_BYTES)
+
+
+def _t_quantile(dof: float) -> float:
+    """The two-sided 95% Student t quantile at dof degrees of freedom (SAMPLE_Z when infinite).
+
+    Interpolated linearly in 1 / dof between the rows of SAMPLE_T_QUANTILES,
+    which is exact at those rows, within 0.1% of the exact value from 5
+    degrees of freedom up and wider (so conservative) below; fewer than 1
+    are taken as 1.
+    """
+    dof = max(dof, 1.0)
+    inverse = 1 / dof
+    previous_dof, previous_t = SAMPLE_T_QUANTILES[0]
+    for table_dof, table_t in SAMPLE_T_QUANTILES[1:] + ((math.inf, SAMPLE_Z),):
+        if dof <= table_dof:
+            share = (1 / previous_dof - inverse) / (1 / previous_dof - 1 / table_dof)
+            return previous_t + (table_t - previous_t) * share
+        previous_dof, previous_t = table_dof, table_t
+    return SAMPLE_Z
+
+
+class SampleEstimate:
+    """Stratified two-stage estimates of the report totals from a sample of sessions (--sample).
+
+    Sessions are the first-stage units, stratified by project; within each
+    stratum the estimate of a total is the stratum size times the mean over
+    the sampled sessions, whose own values may come from a sample of their
+    file's chunks (the second stage, see sample_file()). Every metric is
+    estimated per model as well, as its own variable, so the model split is
+    stratified by project too; a model no sampled session used gets no
+    estimate at all. Only running sums are kept per stratum and key: [sum,
+    sum of squares, second-stage variance].
+    """
+
+    def __init__(self):
+        self.strata: Dict[str, List] = {}
+
+    def add_stratum(self, stratum: str, population: int, sampled: int):
+        self.strata[stratum] = [population, sampled, {}]
+
+    def add(self, stratum: str, values: Dict, variances: Dict):
+        sums = self.strata[stratum][2]
+        for key, value in values.items():
+            counters = sums.get(key)
+            if counters is None:
+                counters = sums[key] = [0.0, 0.0, 0.0]
+            counters[0] += value
+            counters[1] += value * value
+        for key, variance in variances.items():
+            sums.setdefault(key, [0.0, 0.0, 0.0])[2] += variance
+
+    def estimates(self) -> Dict[Tuple[str, str], Tuple[float, float]]:
+        """(estimate, half-width of its confidence interval) per (model, metric).
+
+        The interval is a Student t one, with the Satterthwaite degrees of
+        freedom of the strata's between-session variances (the chunk
+        variances are taken as exact), so that it widens when only a few
+        sessions carry the variance.
+        """
+        totals: Dict = {}
+        for population, sampled, sums in self.strata.values():
+            if not sampled:
+                continue
+            for key, (total, squares, within) in sums.items():
+                variance = population / sampled * within
+                between = 0.0
+                if 1 < sampled < population:
+                    spread = max((squares - total * total / sampled) / (sampled - 1), 0.0)
+                    between = population * population * (1 - sampled / population) * spread / sampled
+                estimate, var, dof_terms = totals.get(key, (0.0, 0.0, 0.0))
+                totals[key] = (estimate + population * total / sampled, var + variance + between,
+                               dof_terms + (between * between / (sampled - 1) if between else 0.0))
+        return {key: (estimate, _t_quantile(variance * variance / dof_terms if dof_terms else math.inf)
+                      * math.sqrt(variance))
+                for key, (estimate, variance, dof_terms) in totals.items()}
+
+
+def estimate_sessions(planned: List[Tuple[Dict, str, Optional[Path], List[Path]]], rollups: Dict[str, Dict],
+                      inventory: SessionInventory, fraction: float) -> Tuple[SampleEstimate, Dict]:
+    """Estimate the totals of planned sessions (see plan_sessions()) from a deterministic sample.
+
+    In each project the sessions ranked first by _sample_rank() of their id
+    are drawn, fraction of them but at least SAMPLE_MIN_PER_STRATUM; the
+    same fraction always draws the same sessions. Sampled sessions with a
+    rollup are counted from it exactly. Returns the estimate and the sample
+    sizes (sessions and bytes, sampled and in total).
+    """
+    strata: Dict[str, List] = {}
+    for planned_session in planned:
+        strata.setdefault(planned_session[1] or "Unknown", []).append(planned_session)
+
+    estimate = SampleEstimate()
+    info = {"fraction": fraction, "strata": len(strata), "sessions": len(planned), "sessions_sampled": 0,
+            "bytes": 0, "bytes_read": 0}
+    for stratum, sessions in strata.items():
+        count = min(len(sessions), max(SAMPLE_MIN_PER_STRATUM, math.ceil(fraction * len(sessions))))
+        drawn = heapq.nsmallest(count, sessions, key=lambda session: _sample_rank(session[0].get("sessionId") or ""))
+        estimate.add_stratum(stratum, len(sessions), count)
+        info["sessions_sampled"] += count
+        for entry, _, session_file, subagent_files in sessions:
+            for path in ([session_file] if session_file is not None else []) + subagent_files:
+                st = inventory.stat(path)
+                info["bytes"] += st.st_size if st is not None else 0
+        for entry, _, session_file, subagent_files in drawn:
+            rollup = rollups.get(entry.get("sessionId"))
+            if rollup is not None and (session_file is None or is_archived(session_file)):
+                usage_data, subagent_usages = shard_session_usages(rollup)
+                for _, subagent_usage in subagent_usages:
+                    usage_data += subagent_usage
+                estimate.add(stratum, _sample_values(usage_data), {})
+                continue
+            values: Dict = {}
+            variances: Dict = {}
+            for path in [session_file] + subagent_files:
+                st = inventory.stat(path)
+                file_values, file_variances, read = sample_file(path, fraction, st.st_size if st is not None else 0)
+                _add_values(values, file_values)
+                _add_values(variances, file_variances)
+                info["bytes_read"] += read
+            estimate.add(stratum, values, variances)
+    return estimate, info
+
+
+def _format_metric(metric: str, value: float) -> str:
+    if metric == "cost":
+        return f"${value:.2f}"
+    return format_number(round(value))
+
+
+def report_sample(estimate: SampleEstimate, info: Dict, elapsed: float, output_file: Optional[Path] = None,
+                  export_format: str = "json", export_gzip: bool = False):
+    """Print the sampled estimates with their confidence intervals and write them as the export."""
+    estimates = estimate.estimates()
+    megabytes = info["bytes_read"] / (1024 * 1024)
+    print("=" * 120)
+    print("CLAUDE CODE SESSION ANALYSIS (SAMPLED ESTIMATE)")
+    print("=" * 120)
+    print(f"\nSampled {info['sessions_sampled']} of {info['sessions']} sessions in {info['strata']} projects "
+          f"(fraction {info['fraction']:g}), read {megabytes:.1f} of {info['bytes'] / (1024 * 1024):.1f} MB "
+          f"in {elapsed:.2f}s")
+    if info["sessions_sampled"] < SAMPLE_MIN_SESSIONS:
+        print(f"Warning: fewer than {SAMPLE_MIN_SESSIONS} sessions sampled, the intervals are unreliable; "
+              f"raise --sample")
+    confidence = f"{round(100 * (math.erf(SAMPLE_Z / math.sqrt(2))))}% interval"
+    print(f"\n{'ESTIMATED TOTALS':<30} {'Estimate':>14}  {confidence:^29}  {'±':>7}")
+    print("-" * 120)
+    for metric in SAMPLE_METRICS:
+        value, half = estimates.get((SAMPLE_ALL_MODELS, metric), (0.0, 0.0))
+        print(f"  {metric.replace('_', ' ').capitalize():<28} {_format_metric(metric, value):>14}  "
+              f"{_format_metric(metric, max(value - half, 0.0)):>13} - {_format_metric(metric, value + half):<13}  "
+              f"{100 * half / value if value else 0.0:>6.1f}%")
+    models = sorted({model for model, _ in estimates if model != SAMPLE_ALL_MODELS},
+                    key=lambda model: estimates[(model, "cost")][0], reverse=True)
+    if models:
+        print(f"\n  {'Cost by model':<28} {'Estimate':>14}  {confidence:^29}  {'±':>7}")
+        for model in models:
+            value, half = estimates[(model, "cost")]
+            print(f"  {model:<28} {_format_metric('cost', value):>14}  {_format_metric('cost', max(value - half, 0.0)):>13}"
+                  f" - {_format_metric('cost', value + half):<13}  {100 * half / value if value else 0.0:>6.1f}%")
+        print("  Models no sampled session used are not estimated.")
+
+    def group(model: str) -> Dict:
+        return {metric: {"estimate": estimates[(model, metric)][0], "margin": estimates[(model, metric)][1]}
+                for metric in SAMPLE_METRICS if (model, metric) in estimates}
+
+    output_file = output_file or default_export_file(export_format, export_gzip)
+    export_data = {
+        "generated_at": datetime.now().isoformat(),
+        "sample": dict(info, z=SAMPLE_Z),
+        "totals": group(SAMPLE_ALL_MODELS),
+    }
+    try:
+        write_export(output_file, export_data, "by_model", {model: group(model) for model in models}, export_format,
+                     export_gzip)
+        print(f"\nEstimate exported to: {output_file.absolute()}")
+    except OSError as e:
+        print(f"\nError writing {output_file}: {e}")
+
+
+def validate_sample(fraction: float = SAMPLE_FRACTION) -> bool:
+    """Compare the --sample estimates against the exact totals on the same sessions.
+
+    Prints each estimate next to the exact value, its error and whether its
+    confidence interval covers the exact value, and the time each path took.
+    Returns False when the projects directory is missing.
+    """
+    projects_dir = Path.home() / ".claude" / "projects"
+    if not projects_dir.exists():
+        print(f"Error: Claude projects directory not found at {projects_dir}")
+        return False
+    rollups: Dict[str, Dict] = {}
+    inventory = SessionInventory(projects_dir)
+    planned = plan_sessions(projects_dir, rollups=rollups, inventory=inventory)
+
+    started = time.perf_counter()
+    estimate, info = estimate_sessions(planned, rollups, inventory, fraction)
+    estimates = estimate.estimates()
+    sample_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    exact: Dict = {}
+    for entry, _, session_file, subagent_files in planned:
+        rollup = rollups.get(entry.get("sessionId"))
+        if rollup is not None and (session_file is None or is_archived(session_file)):
+            usage_data, subagent_usages = shard_session_usages(rollup)
+            for _, subagent_usage in subagent_usages:
+                usage_data += subagent_usage
+        else:
+            usage_data = parse_session_file(session_file)
+            for subagent_file in subagent_files:
+                usage_data += parse_session_file(subagent_file)
+        _add_values(exact, _sample_values(usage_data))
+    exact_elapsed = time.perf_counter() - started
+
+    print(f"Sampled {info['sessions_sampled']} of {info['sessions']} sessions (fraction {fraction:g}), "
+          f"read {info['bytes_read'] / (1024 * 1024):.1f} of {info['bytes'] / (1024 * 1024):.1f} MB")
+    print(f"  sampled: {sample_elapsed:.2f}s   exact: {exact_elapsed:.2f}s")
+    if info["sessions_sampled"] < SAMPLE_MIN_SESSIONS:
+        print(f"Warning: fewer than {SAMPLE_MIN_SESSIONS} sessions sampled, the intervals are unreliable")
+    print(f"\n{'Estimate':<40} {'Exact':>14} {'Sampled':>14} {'Error':>8} {'±':>8}  Covered")
+    print("-" * 100)
+    covered = unestimated = 0
+    keys = [key for key in sorted(exact, key=lambda key: (key[0] != SAMPLE_ALL_MODELS, key[0],
+                                                          SAMPLE_METRICS.index(key[1])))]
+    for model, metric in keys:
+        true_value = exact[(model, metric)]
+        if (model, metric) not in estimates:
+            unestimated += 1
+            print(f"  {(model + ' ' + metric)[:38]:<38} {_format_metric(metric, true_value):>14} "
+                  f"{'-':>14} {'':>8} {'':>8}  not sampled")
+            continue
+        value, half = estimates[(model, metric)]
+        inside = abs(value - true_value) <= half + 1e-9 * max(abs(true_value), 1.0)
+        covered += inside
+        error = 100 * (value - true_value) / true_value if true_value else 0.0
+        margin = 100 * half / value if value else 0.0
+        print(f"  {(model + ' ' + metric)[:38]:<38} {_format_metric(metric, true_value):>14} "
+              f"{_format_metric(metric, value):>14} {error:>+7.1f}% {margin:>7.1f}%  {'yes' if inside else 'NO'}")
+    print(f"\n{covered} of {len(keys) - unestimated} intervals cover the exact value"
+          + (f"; {unestimated} totals of models no sampled session used were not estimated" if unestimated else ""))
+    return True
@@ -0,0 +1,982 @@
+"""
+Session file scanning and the parse cache for analyze_claude_sessions.py.
+
+Reads Claude Code JSONL transcripts (plain or archived) in constant memory
+into UsageCounters, hands each counted turn to collectors as a UsageRecord,
+and keeps per-file aggregates in a persistent parse cache so a later run
+only decodes the bytes appended since; parse_session_files() runs a whole
+set of files through it, serially or in a process pool. Also holds the
+hour-keyed ShardCollector those cache entries are kept in, and the
+timestamp, date range and number helpers the reports share.
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies; the optional zstandard
+      module reads .zst archives)
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from operator import add
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from claude_session_pricing import PRICE_FIELDS, normalize_model_name, price_table, price_tokens, set_price_table
+from claude_session_sketch import QuantileSketch, merge_sketches
+
+try:
+    import zstandard
+except ImportError:  # optional: only needed for .zst archives
+    zstandard = None
+
+# Suffixes of transcripts compressed by the archive command
+ARCHIVE_SUFFIXES = (".gz", ".zst")
+
+# Persistent parse cache format version; bump when UsageCounters.to_json() changes shape
+CACHE_VERSION = 4
+# Bytes hashed at the head of a file and before the cached offset to detect rewrites
+FINGERPRINT_BYTES = 4096
+
+# Context window the reports and the waybar module measure against
+CONTEXT_WINDOW = 200_000
+
+# Records without this byte sequence cannot carry usage and are never decoded
+USAGE_KEY = b'"usage"'
+# Records without usage that are still decoded when a content handler wants tool results
+TOOL_RESULT_KEY = b'"tool_result"'
+# Raw-byte timestamp lookup used to bisect session files by time
+TIMESTAMP_RE = re.compile(rb'"timestamp"\s*:\s*"([^"]+)"')
+# Stop bisecting once the window is this small, and give up on a probe after this many lines
+BISECT_MIN_BYTES = 64 * 1024
+BISECT_PROBE_LINES = 50
+
+# (start, end) datetimes a usage record's own timestamp must fall within; either may be None
+TimeRange = Tuple[Optional[datetime], Optional[datetime]]
+# Callback receiving (msg, model, usage) for every counted usage record
+UsageHandler = Callable[[Dict, str, Dict], None]
+# Callback receiving every decoded record with content blocks, before its usage is counted
+ContentHandler = Callable[[Dict], None]
+
+# Where a usage record came from; agent_id is None for the main session file
+RecordSource = namedtuple("RecordSource", ["session_id", "project_path", "git_branch", "agent_id"])
+# Source of the records a parse cache entry keeps hour counters of (see parse_session_file_hours)
+_FILE_SOURCE = RecordSource(None, None, None, None)
+# One counted API turn, as handed to collectors (see make_usage_handler)
+UsageRecord = namedtuple("UsageRecord", [
+    "source", "timestamp", "model",
+    "input_tokens", "output_tokens", "cache_creation_tokens", "cache_read_tokens",
+])
+
+
+class UsageCounters:
+    """Token and context counters of one session file, session or time bucket.
+
+    totals holds FIELDS in one flat array: token and turn counts, plus the
+    largest single-turn context (MAX_FIELD, merged with max instead of +).
+    Tokens are also counted per PriceTable.price_key() as arrays in
+    PRICE_FIELDS order, so pricing happens once per aggregate (see
+    usage()), and context_by_model holds a QuantileSketch of per-turn
+    context sizes for each canonical model.
+
+    Merging (+=) is one elementwise add per array. Instances hold no
+    factories or closures, so they pickle as their arrays, and to_json()
+    / from_json() round-trip them for the parse cache.
+    """
+
+    FIELDS = ("input_tokens", "output_tokens", "cache_creation_tokens", "cache_read_tokens",
+              "max_context_per_turn", "total_context_all_turns", "turn_count", "turns_over_200k")
+    MAX_FIELD = FIELDS.index("max_context_per_turn")
+    _INDEX = {name: idx for idx, name in enumerate(FIELDS)}
+
+    __slots__ = ("totals", "by_price", "context_by_model")
+
+    def __init__(self):
+        self.totals = array("q", bytes(8 * len(self.FIELDS)))
+        self.by_price: Dict[str, array] = {}
+        self.context_by_model: Dict[str, QuantileSketch] = {}
+
+    def __getitem__(self, name: str) -> int:
+        return self.totals[self._INDEX[name]]
+
+    def add_turn(self, model: str, price_key: str, input_tokens: int, output_tokens: int,
+                 cache_creation: int, cache_read: int):
+        """Count one API turn of a canonical model."""
+        turn_context = input_tokens + cache_creation + cache_read
+        totals = self.totals
+        totals[0] += input_tokens
+        totals[1] += output_tokens
+        totals[2] += cache_creation
+        totals[3] += cache_read
+        if turn_context > totals[4]:
+            totals[4] = turn_context
+        totals[5] += turn_context
+        totals[6] += 1
+        if turn_context > CONTEXT_WINDOW:
+            totals[7] += 1
+
+        counts = self.by_price.get(price_key)
+        if counts is None:
+            counts = self.by_price[price_key] = array("q", bytes(8 * len(PRICE_FIELDS)))
+        counts[0] += input_tokens
+        counts[1] += output_tokens
+        counts[2] += cache_creation
+        counts[3] += cache_read
+
+        sketch = self.context_by_model.get(model)
+        if sketch is None:
+            sketch = self.context_by_model[model] = QuantileSketch()
+        sketch.add(turn_context)
+
+    def add_hour(self, timestamp: Optional[str], counters: List):
+        """Fold in pre-aggregated turns in ShardCollector's hour counter layout, priced as of timestamp."""
+        turns, total_context, max_context, turns_over_200k, tokens_by_model, context_by_model, _ = counters
+        totals = self.totals
+        if max_context > totals[4]:
+            totals[4] = max_context
+        totals[5] += total_context
+        totals[6] += turns
+        totals[7] += turns_over_200k
+        for model, tokens in tokens_by_model.items():
+            totals[0] += tokens[0]
+            totals[1] += tokens[1]
+            totals[2] += tokens[2]
+            totals[3] += tokens[3]
+            self._add_prices(price_table().price_key(model, timestamp), tokens)
+        for model, sketch in context_by_model.items():
+            self.context_by_model.setdefault(model, QuantileSketch()).merge(QuantileSketch.from_json(sketch))
+
+    def _add_prices(self, price_key: str, tokens):
+        counts = self.by_price.get(price_key)
+        if counts is None:
+            self.by_price[price_key] = array("q", tokens)
+        else:
+            counts[:] = array("q", map(add, counts, tokens))
+
+    def __iadd__(self, other: "UsageCounters") -> "UsageCounters":
+        peak = max(self.totals[self.MAX_FIELD], other.totals[self.MAX_FIELD])
+        self.totals = array("q", map(add, self.totals, other.totals))
+        self.totals[self.MAX_FIELD] = peak
+        for price_key, tokens in other.by_price.items():
+            self._add_prices(price_key, tokens)
+        for model, sketch in other.context_by_model.items():
+            self.context_by_model.setdefault(model, QuantileSketch()).merge(sketch)
+        return self
+
+    def context(self) -> QuantileSketch:
+        """Context sizes of every turn, all models together."""
+        return merge_sketches(self.context_by_model.values())
+
+    def usage(self) -> Dict:
+        """Export form: FIELDS by name, tokens_by_model and cost_by_model (see price_tokens()) and context percentiles."""
+        data = dict(zip(self.FIELDS, self.totals))
+        tokens_by_model, data["cost_by_model"] = price_tokens(self.by_price)
+        data["tokens_by_model"] = tokens_by_model
+        context = self.context()
+        data["context_percentiles"] = context.percentiles()
+        data["context_histogram"] = context.histogram_buckets()
+        return data
+
+    def to_json(self) -> List:
+        return [list(self.totals), {price_key: list(counts) for price_key, counts in self.by_price.items()},
+                {model: sketch.to_json() for model, sketch in self.context_by_model.items()}]
+
+    @classmethod
+    def from_json(cls, data: List) -> "UsageCounters":
+        counters = cls()
+        counters.totals = array("q", data[0])
+        counters.by_price = {price_key: array("q", counts) for price_key, counts in data[1].items()}
+        counters.context_by_model = {model: QuantileSketch.from_json(sketch) for model, sketch in data[2].items()}
+        return counters
+
+
+def extract_usage(msg: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+    """Return the (usage, model) pair of a decoded record, or (None, None)."""
+    # Usage data can be in msg.usage or msg.message.usage
+    if not isinstance(msg, dict):
+        return None, None
+    if "usage" in msg:
+        usage, model = msg["usage"], msg.get("model", "unknown")
+    elif "message" in msg and isinstance(msg["message"], dict) and "usage" in msg["message"]:
+        usage, model = msg["message"]["usage"], msg["message"].get("model", "unknown")
+    else:
+        return None, None
+    if not isinstance(usage, dict):
+        return None, None
+    return usage, model
+
+
+def add_usage(session_data: UsageCounters, model: str, usage: Dict, timestamp: Optional[str] = None):
+    """Accumulate one usage object into session_data (integer adds only; no pricing)."""
+    model = normalize_model_name(model)
+    session_data.add_turn(
+        model,
+        price_table().price_key(model, timestamp),
+        usage.get("input_tokens", 0),
+        usage.get("output_tokens", 0),
+        usage.get("cache_creation_input_tokens", 0),
+        usage.get("cache_read_input_tokens", 0),
+    )
+
+
+class ScanStats:
+    """Counters filled in by the session file scanners while installed (see set_scan_stats()).
+
+    The report installs one while profiling; the archive command installs
+    its own to learn whether a transcript was read to its end (read_errors
+    counts the files whose read failed part way).
+    """
+
+    FIELDS = ("files_opened", "files_cached", "bytes_read", "lines_decoded", "lines_skipped",
+              "decode_errors", "usage_records", "sessions_rolled_up", "read_errors")
+
+    def __init__(self):
+        self.counts = dict.fromkeys(self.FIELDS, 0)
+
+    def add(self, **counts):
+        for field, value in counts.items():
+            self.counts[field] += value
+
+    def merge(self, other: "ScanStats"):
+        self.add(**other.counts)
+
+
+_scan_stats: Optional[ScanStats] = None
+
+
+def set_scan_stats(stats: Optional[ScanStats]):
+    """Install the ScanStats the scanners count into, or None (the default) to count nothing."""
+    global _scan_stats
+    _scan_stats = stats
+
+
+def _count_usage(session_data: UsageCounters, msg: Dict, model: str, usage: Dict, time_range: Optional[TimeRange],
+                 on_usage: Optional[UsageHandler]) -> bool:
+    """Count one usage record unless it falls outside time_range; returns False once past its end."""
+    if time_range:
+        range_start, range_end = time_range
+        timestamp = parse_timestamp(msg.get("timestamp"))
+        if timestamp:
+            if range_start and timestamp < range_start:
+                return True
+            if range_end and timestamp > range_end:
+                return False
+    add_usage(session_data, model, usage, msg.get("timestamp"))
+    if on_usage:
+        on_usage(msg, model, usage)
+    return True
+
+
+def scan_session_file(session_path: Path, session_data: UsageCounters, start_offset: int = 0,
+                      time_range: Optional[TimeRange] = None, on_usage: Optional[UsageHandler] = None,
+                      on_content: Optional[ContentHandler] = None) -> int:
+    """Stream the lines of a session JSONL file from start_offset into session_data.
+
+    Only one line is held in memory at a time and decoded records are dropped
+    immediately. Lines that cannot carry a usage payload are skipped without
+    being decoded. Returns the byte offset just past the last complete line,
+    so a later call can resume from there once the file has grown; a trailing
+    line without a newline that does not decode yet is left unconsumed.
+
+    With a time_range only usage records whose own timestamp falls inside it
+    are counted: reading starts at the offset found by find_time_offset() and
+    stops at the first record past the end of the range.
+
+    on_usage, if given, is called with (msg, model, usage) for every usage
+    record that was counted.
+
+    on_content, if given, is called with every decoded record, before its
+    usage (if any) is counted; records holding tool results are then decoded
+    too, and the file is always read line by line. The other skipped lines
+    are passed as a minimal {"timestamp"} record read from the raw bytes.
+    Records before the start of a time_range are skipped unseen, as for
+    on_usage.
+
+    Archived (.gz or .zst) files are decompressed as a stream; they cannot
+    be bisected or resumed, so they are always read from the start and a
+    nonzero start_offset raises ValueError.
+
+    While a ScanStats is installed (--profile) files, bytes, lines and
+    records are counted into it.
+    """
+    archived = is_archived(session_path)
+    if archived and start_offset:
+        raise ValueError(f"{session_path} is an archive and cannot be read from offset {start_offset}")
+    range_start = time_range[0] if time_range else None
+    offset = start_offset
+    stats = _scan_stats
+    decoded = skipped = errors = records = failed = 0
+
+    try:
+        with open_session_file(session_path) as f:
+            if stats is not None:
+                stats.add(files_opened=1)
+            if range_start and not archived:
+                start_offset = max(start_offset, find_time_offset(f, range_start))
+            offset = start_offset
+            if not archived:
+                f.seek(start_offset)
+            for line in f:
+                complete = line.endswith(b"\n")
+                if complete and USAGE_KEY not in line and (on_content is None or TOOL_RESULT_KEY not in line):
+                    offset += len(line)
+                    skipped += 1
+                    if on_content is not None:
+                        match = TIMESTAMP_RE.search(line)
+                        if match:
+                            on_content({"timestamp": match.group(1).decode("ascii", "replace")})
+                    continue
+                if not line.strip():
+                    continue
+                decoded += 1
+                try:
+                    msg = json.loads(line)
+                except ValueError:
+                    errors += 1
+                    if complete:
+                        offset += len(line)
+                    continue
+                offset += len(line)
+
+                if on_content is not None:
+                    on_content(msg)
+                usage, model = extract_usage(msg)
+                if usage and model:
+                    records += 1
+                    if not _count_usage(session_data, msg, model, usage, time_range, on_usage):
+                        break
+    except Exception as e:
+        print(f"Error reading {session_path}: {e}")
+        failed = 1
+    finally:
+        if stats is not None:
+            stats.add(bytes_read=offset - start_offset, lines_decoded=decoded, lines_skipped=skipped,
+                      decode_errors=errors, usage_records=records, read_errors=failed)
+
+    return offset
+
+
+def parse_session_file(session_path: Path, time_range: Optional[TimeRange] = None,
+                       on_usage: Optional[UsageHandler] = None,
+                       on_content: Optional[ContentHandler] = None) -> UsageCounters:
+    """Parse a session JSONL file and extract usage data.
+
+    Runs in constant memory regardless of file size; use
+    iter_session_messages() when the decoded records themselves are needed.
+    """
+    session_data = UsageCounters()
+    scan_session_file(session_path, session_data, time_range=time_range, on_usage=on_usage, on_content=on_content)
+    return session_data
+
+
+def make_usage_handler(collectors: List, source: RecordSource) -> UsageHandler:
+    """Build an on_usage callback that feeds UsageRecords from one file to collectors."""
+    def handle(msg: Dict, model: str, usage: Dict):
+        record = UsageRecord(
+            source,
+            msg.get("timestamp"),
+            normalize_model_name(model),
+            usage.get("input_tokens", 0),
+            usage.get("output_tokens", 0),
+            usage.get("cache_creation_input_tokens", 0),
+            usage.get("cache_read_input_tokens", 0),
+        )
+        for collector in collectors:
+            collector.add(record)
+    return handle
+
+
+def make_content_handler(collectors: List, source: RecordSource) -> Optional[ContentHandler]:
+    """Build an on_content callback for the collectors that read message content, or None if none do.
+
+    Such collectors have an add_content(source, msg) method, called for
+    each record of the file before the UsageRecord made from it (if any).
+    """
+    readers = [collector for collector in collectors if hasattr(collector, "add_content")]
+    if not readers:
+        return None
+
+    def handle(msg: Dict):
+        for collector in readers:
+            collector.add_content(source, msg)
+    return handle
+
+
+def _line_timestamp(line: bytes) -> Optional[datetime]:
+    """Pull the record timestamp out of a raw JSONL line without decoding it."""
+    match = TIMESTAMP_RE.search(line)
+    if not match:
+        return None
+    return parse_timestamp(match.group(1).decode("ascii", "replace"))
+
+
+def find_time_offset(f, start: datetime) -> int:
+    """Bisect an open session file for a line-start offset safe to begin reading at for start.
+
+    Records are appended in time order, so every record before the returned
+    offset is older than start. Returns 0 when no such point can be located.
+    """
+    f.seek(0, os.SEEK_END)
+    lo, hi = 0, f.tell()
+
+    while hi - lo > BISECT_MIN_BYTES:
+        mid = (lo + hi) // 2
+        f.seek(mid)
+        f.readline()  # skip the partial line we landed in
+        timestamp = None
+        line_start = f.tell()
+        for _ in range(BISECT_PROBE_LINES):
+            line_start = f.tell()
+            line = f.readline()
+            if not line:
+                break
+            timestamp = _line_timestamp(line)
+            if timestamp:
+                break
+
+        if timestamp is None or timestamp >= start:
+            hi = mid
+        else:
+            lo = line_start
+
+    return lo
+
+
+def is_archived(session_path: Path) -> bool:
+    """Whether a transcript path is a compressed archive written by the archive command."""
+    return session_path.suffix in ARCHIVE_SUFFIXES
+
+
+def session_file_id(session_path: Path) -> str:
+    """Session or agent id of a transcript: its file name without .jsonl and any archive suffix."""
+    name = session_path.name
+    if is_archived(session_path):
+        name = name[:-len(session_path.suffix)]
+    return name[:-len(".jsonl")] if name.endswith(".jsonl") else name
+
+
+def open_session_file(session_path: Path):
+    """Open a transcript for reading bytes line by line, decompressing archives as a stream.
+
+    Raises OSError, also when a .zst archive is read without the zstandard module.
+    """
+    if session_path.suffix == ".gz":
+        return gzip.open(session_path, 'rb')
+    if session_path.suffix == ".zst":
+        if zstandard is None:
+            raise OSError(f"reading {session_path.name} needs the zstandard module")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(session_path, 'rb')))
+    return open(session_path, 'rb')
+
+
+def iter_session_messages(session_path: Path) -> Iterator[Dict]:
+    """Yield every decoded record of a session JSONL file, skipping invalid lines."""
+    with open_session_file(session_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def default_cache_file() -> Path:
+    """Location of the persistent parse cache (honours XDG_CACHE_HOME)."""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or str(Path.home() / ".cache")
+    return Path(cache_home) / "claude-sessions" / "parse-cache.json"
+
+
+def load_parse_cache(cache_file: Path) -> Dict:
+    """Load the parse cache, starting fresh if it is missing, corrupt or outdated.
+
+    Cached token counters are keyed by price period, so the cache is also
+    dropped when the price table's effective dates change.
+    """
+    pricing = price_table().signature()
+    try:
+        with open(cache_file, 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {"version": CACHE_VERSION, "pricing": pricing, "files": {}}
+
+    if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION or cache.get("pricing") != pricing:
+        return {"version": CACHE_VERSION, "pricing": pricing, "files": {}}
+    cache.setdefault("files", {})
+    return cache
+
+
+def save_parse_cache(cache_file: Path, cache: Dict):
+    """Write the parse cache atomically, dropping entries for deleted files."""
+    cache["files"] = {path: entry for path, entry in cache["files"].items() if os.path.exists(path)}
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_file.with_name(cache_file.name + ".tmp")
+        with open(tmp_file, 'w') as f:
+            json.dump(cache, f, separators=(",", ":"))
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        print(f"Warning: could not write parse cache {cache_file}: {e}")
+
+
+def file_fingerprint(session_path: Path, offset: int) -> str:
+    """Hash the head of the file and the bytes just before offset.
+
+    Used to tell an appended-to file (same prefix) from one that was rewritten in place.
+    """
+    digest = hashlib.sha1()
+    with open(session_path, 'rb') as f:
+        digest.update(f.read(min(offset, FINGERPRINT_BYTES)))
+        tail_start = max(0, offset - FINGERPRINT_BYTES)
+        f.seek(tail_start)
+        digest.update(f.read(offset - tail_start))
+    return digest.hexdigest()
+
+
+def parse_session_file_cached(session_path: Path, cache: Optional[Dict], time_range: Optional[TimeRange] = None,
+                              on_usage: Optional[UsageHandler] = None,
+                              on_content: Optional[ContentHandler] = None,
+                              st: Optional[os.stat_result] = None) -> UsageCounters:
+    """Parse a session file, reusing the cached aggregates for bytes already seen.
+
+    Session files are append-only, so when the inode is unchanged and the
+    previously consumed prefix still matches, only the appended tail is decoded.
+    Truncated or rewritten files are parsed again from the start, as are
+    archives that changed at all. Cached aggregates cover whole files and
+    not individual records, so a time_range or an on_usage callback
+    bypasses the cache here (parse_session_files() answers those from the
+    hour counters of parse_session_file_hours()). st is the file's stat() if
+    the caller has it.
+    """
+    if cache is None or time_range or on_usage or on_content:
+        return parse_session_file(session_path, time_range, on_usage, on_content)
+    return parse_session_file_hours(session_path, cache, st, hours=False)[0]
+
+
+def parse_session_file_hours(session_path: Path, cache: Dict, st: Optional[os.stat_result] = None,
+                             hours: bool = True) -> Tuple[UsageCounters, Optional[Dict[str, List]]]:
+    """Parse a session file through the cache, as parse_session_file_cached(), and also return its hour counters.
+
+    The hour counters are the file's turns in ShardCollector's layout (in
+    to_json() form), which any time range of whole hours, --by bucket or
+    --group-by group can be rebuilt from. They are kept in the cache entry
+    once asked for and then resumed from its offset like the totals; an
+    entry without them is parsed again from the start. Returns the file's
+    totals and its hour counters (None if not asked for and not cached).
+    """
+    key = str(session_path.absolute())
+    try:
+        st = st or session_path.stat()
+    except OSError as e:
+        print(f"Error reading {session_path}: {e}")
+        return UsageCounters(), {} if hours else None
+
+    entry = cache["files"].get(key)
+    session_data = None
+    start_offset = 0
+    collector = ShardCollector() if hours or (entry and "hours" in entry) else None
+    if entry and entry.get("inode") == st.st_ino and entry.get("offset", 0) <= st.st_size and (
+            collector is None or "hours" in entry):
+        if entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+            if _scan_stats is not None:
+                _scan_stats.add(files_cached=1)
+            return UsageCounters.from_json(entry["session_data"]), entry.get("hours")
+        try:
+            if not is_archived(session_path) and file_fingerprint(session_path, entry["offset"]) == entry.get("fingerprint"):
+                session_data = UsageCounters.from_json(entry["session_data"])
+                start_offset = entry["offset"]
+                if collector is not None:
+                    collector.add_hours(_FILE_SOURCE, entry["hours"])
+        except OSError:
+            pass
+
+    if session_data is None:
+        session_data = UsageCounters()
+    on_usage = make_usage_handler([collector], _FILE_SOURCE) if collector is not None else None
+    offset = scan_session_file(session_path, session_data, start_offset, on_usage=on_usage)
+    file_hours = collector.hours_json(None) if collector is not None else None
+
+    try:
+        fingerprint = file_fingerprint(session_path, offset)
+    except OSError:
+        cache["files"].pop(key, None)
+        return session_data, file_hours
+
+    cache["files"][key] = {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "inode": st.st_ino,
+        "offset": offset,
+        "fingerprint": fingerprint,
+        "session_data": session_data.to_json(),
+    }
+    if file_hours is not None:
+        cache["files"][key]["hours"] = file_hours
+    return session_data, file_hours
+
+
+def format_number(num: int) -> str:
+    """Format large numbers with commas and k/M suffixes."""
+    if num >= 1_000_000:
+        return f"{num / 1_000_000:.1f}M"
+    elif num >= 1_000:
+        return f"{num / 1_000:.1f}k"
+    return str(num)
+
+
+def parse_date_filter(date_str: str) -> datetime:
+    """Parse date string in YYYY-MM-DD format to datetime with UTC timezone."""
+    try:
+        # Parse date and make it timezone-aware (UTC) at start of day
+        dt = datetime.strptime(date_str, "%Y-%m-%d")
+        return dt.replace(tzinfo=datetime.now().astimezone().tzinfo)
+    except ValueError:
+        raise ValueError(f"Invalid date format: {date_str}. Expected YYYY-MM-DD")
+
+
+def parse_timestamp(timestamp_str: Optional[str]) -> Optional[datetime]:
+    """Parse an ISO-8601 record timestamp, returning None when missing or invalid."""
+    if not timestamp_str:
+        return None
+    try:
+        return datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+def end_of_day(date: datetime) -> datetime:
+    """Last second of the given day, used to make --end-date inclusive."""
+    return date.replace(hour=23, minute=59, second=59)
+
+
+def session_overlaps_range(entry: Dict, start_date: Optional[datetime], end_date: Optional[datetime]) -> bool:
+    """Check whether a session's created..modified span touches the date range.
+
+    Sessions with unknown dates are kept, mirroring is_in_date_range().
+    """
+    created = parse_timestamp(entry.get("created"))
+    modified = parse_timestamp(entry.get("modified")) or created
+    if start_date and modified and modified < start_date:
+        return False
+    if end_date and created and created > end_of_day(end_date):
+        return False
+    return True
+
+
+def is_in_date_range(session_date_str: Optional[str], start_date: Optional[datetime], end_date: Optional[datetime]) -> bool:
+    """Check if a session date is within the specified range."""
+    if not session_date_str:
+        return True  # Include sessions with no date
+
+    try:
+        session_date = datetime.fromisoformat(session_date_str.replace('Z', '+00:00'))
+    except:
+        return True  # Include sessions with invalid dates
+
+    if start_date and session_date < start_date:
+        return False
+    if end_date and session_date > end_of_day(end_date):
+        return False
+
+    return True
+
+
+def _parse_file_job(session_path: Path, use_cache: bool, entry: Optional[Dict], time_range: Optional[TimeRange],
+                    collectors: Optional[List], source: Optional[RecordSource], profile: bool,
+                    st: Optional[os.stat_result], hourly: bool) -> Tuple[UsageCounters, Optional[Dict],
+                                                                         Optional[List], Optional[ScanStats],
+                                                                         Optional[Dict[str, List]]]:
+    """Worker-side parse of one file.
+
+    Returns the file's UsageCounters, the new cache entry, the filled-in
+    per-file collectors (fresh ones spawned from the given prototypes),
+    when profiling the file's ScanStats, and when hourly its hour counters
+    (see parse_session_file_hours()).
+    """
+    set_scan_stats(ScanStats() if profile else None)
+    key = str(session_path.absolute())
+    cache = None
+    if use_cache:
+        cache = {"files": {key: entry} if entry else {}}
+    if hourly:
+        session_data, hours = parse_session_file_hours(session_path, cache, st)
+        return session_data, cache["files"].get(key), None, _scan_stats, hours
+    on_usage = on_content = None
+    if collectors:
+        collectors = [collector.spawn() for collector in collectors]
+        on_usage = make_usage_handler(collectors, source)
+        on_content = make_content_handler(collectors, source)
+    session_data = parse_session_file_cached(session_path, cache, time_range, on_usage, on_content, st)
+    return session_data, cache["files"].get(key) if cache else None, collectors, _scan_stats, None
+
+
+def _is_unchanged(session_path: Path, cache: Dict, st: Optional[os.stat_result] = None, hours: bool = False) -> bool:
+    """Whether the cached entry for a file still matches its size, mtime and inode (st, or a fresh stat()).
+
+    With hours, the entry must also hold the file's hour counters.
+    """
+    entry = cache["files"].get(str(session_path.absolute()))
+    if not entry or (hours and "hours" not in entry):
+        return False
+    try:
+        st = st or session_path.stat()
+    except OSError:
+        return False
+    return (entry.get("inode") == st.st_ino and entry.get("size") == st.st_size
+            and entry.get("mtime_ns") == st.st_mtime_ns)
+
+
+def _on_hour_boundaries(time_range: Optional[TimeRange]) -> bool:
+    """Whether time_range starts and ends on whole UTC hours, so that hour counters cover it exactly."""
+    if not time_range:
+        return True
+    range_start, range_end = time_range
+    edges = [range_start, range_end + timedelta(microseconds=1) if range_end else None]
+    return all(edge is None or edge.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0) == edge
+               for edge in edges)
+
+
+def parse_session_files(session_paths: List[Path], cache: Optional[Dict], jobs: int = 1,
+                        time_range: Optional[TimeRange] = None, collectors: Optional[List] = None,
+                        sources: Optional[List[RecordSource]] = None,
+                        stats: Optional[List[Optional[os.stat_result]]] = None) -> List[UsageCounters]:
+    """Parse many session files, returning their UsageCounters in the order given.
+
+    With jobs > 1 the files that actually need decoding are spread over a
+    process pool (largest first, for better load balancing). Each file is
+    parsed independently and results are merged by the caller in input order,
+    so the output is identical to the serial path.
+
+    collectors receive a UsageRecord per counted turn, tagged with the
+    matching entry of sources (and, if they have add_content(), every
+    decoded record; see make_content_handler()). Each file fills its own
+    spawn() of every collector, which is then merge()d back in input order.
+
+    The parse cache still serves a time_range of whole UTC hours and
+    collectors that can be fed hour counters (add_hours(), as the --by,
+    --group-by and --shard-out ones can): each file's hour counters are
+    kept in its cache entry (see parse_session_file_hours()), cut to the
+    range, and fed to the collectors in input order. Other collectors need
+    the records themselves, so the cache is bypassed for them.
+
+    stats, if given, holds each file's stat() result (None where unknown),
+    as taken by a SessionInventory, so files are not stat()ed again.
+    """
+    collectors = collectors or []
+    hourly = bool(cache is not None and (time_range or collectors) and _on_hour_boundaries(time_range)
+                  and all(hasattr(collector, "add_hours") for collector in collectors))
+    if (time_range or collectors) and not hourly:
+        cache = None
+    stats = stats or [None] * len(session_paths)
+
+    def from_hours(idx: int, session_data: UsageCounters, hours: Optional[Dict[str, List]]) -> UsageCounters:
+        hours = hours_in_range(hours or {}, time_range)
+        for collector in collectors:
+            collector.add_hours(sources[idx], hours)
+        return session_data_from_hours(hours) if time_range else session_data
+
+    if jobs <= 1 or len(session_paths) < 2:
+        results = []
+        for idx, path in enumerate(session_paths):
+            if hourly:
+                results.append(from_hours(idx, *parse_session_file_hours(path, cache, stats[idx])))
+                continue
+            on_usage = make_usage_handler(collectors, sources[idx]) if collectors else None
+            on_content = make_content_handler(collectors, sources[idx]) if collectors else None
+            results.append(parse_session_file_cached(path, cache, time_range, on_usage, on_content, stats[idx]))
+        return results
+
+    results: List[Optional[UsageCounters]] = [None] * len(session_paths)
+    file_collectors: List[Optional[List]] = [None] * len(session_paths)
+    file_hours: List[Optional[Dict[str, List]]] = [None] * len(session_paths)
+    pending = []
+    for idx, path in enumerate(session_paths):
+        if cache is not None and _is_unchanged(path, cache, stats[idx], hourly):
+            if hourly:
+                results[idx], file_hours[idx] = parse_session_file_hours(path, cache, stats[idx])
+            else:
+                results[idx] = parse_session_file_cached(path, cache, st=stats[idx])
+        else:
+            pending.append(idx)
+
+    def file_size(idx: int) -> int:
+        try:
+            return (stats[idx] or session_paths[idx].stat()).st_size
+        except OSError:
+            return 0
+
+    pending.sort(key=file_size, reverse=True)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=set_price_table, initargs=(price_table(),)) as pool:
+        futures = {}
+        for idx in pending:
+            path = session_paths[idx]
+            entry = cache["files"].get(str(path.absolute())) if cache is not None else None
+            futures[idx] = pool.submit(_parse_file_job, path, cache is not None, entry, time_range,
+                                       collectors, sources[idx] if collectors else None, _scan_stats is not None,
+                                       stats[idx], hourly)
+
+        for idx in pending:
+            results[idx], entry, file_collectors[idx], scan_stats, file_hours[idx] = futures[idx].result()
+            if scan_stats is not None and _scan_stats is not None:
+                _scan_stats.merge(scan_stats)
+            if cache is not None and entry is not None:
+                cache["files"][str(session_paths[idx].absolute())] = entry
+
+    if hourly:
+        return [from_hours(idx, session_data, hours)
+                for idx, (session_data, hours) in enumerate(zip(results, file_hours))]
+    for parts in file_collectors:
+        for collector, part in zip(collectors, parts or []):
+            collector.merge(part)
+
+    return results
+
+
+def hour_key(timestamp_str: Optional[str]) -> str:
+    """UTC "YYYY-MM-DDTHH" hour of a record timestamp, or "" when it has none."""
+    if not timestamp_str:
+        return ""
+    if timestamp_str.endswith("Z") and len(timestamp_str) >= 13 and timestamp_str[10] == "T":
+        return timestamp_str[:13]
+    timestamp = parse_timestamp(timestamp_str)
+    if timestamp is None:
+        return ""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.strftime("%Y-%m-%dT%H")
+
+
+def hour_timestamp(hour: str) -> Optional[str]:
+    """Representative timestamp of a hour_key() hour, for pricing and bucketing."""
+    return f"{hour}:00:00.000Z" if hour else None
+
+
+class ShardCollector:
+    """Per-file, per-hour token counters for partial aggregate shards (--shard-out).
+
+    Counters are keyed by (session_id, agent_id) and then by UTC hour as
+    [turns, total_context, max_context, turns_over_200k, {model: [input,
+    output, cache_creation, cache_read]}, {model: QuantileSketch of context
+    sizes}, {model: turns_over_200k}] (sketches in to_json() form once
+    written). They do not depend on prices
+    (price periods start on a day boundary), so shards written with any
+    price table can be priced again when merged, and every --by
+    granularity can be rebuilt from them.
+    """
+
+    def __init__(self):
+        self.files: Dict[Tuple[str, Optional[str]], Dict[str, List]] = {}
+
+    def add(self, record: UsageRecord):
+        hours = self.files.get((record.source.session_id, record.source.agent_id))
+        if hours is None:
+            hours = self.files[(record.source.session_id, record.source.agent_id)] = {}
+        hour = hour_key(record.timestamp)
+        counters = hours.get(hour)
+        if counters is None:
+            counters = hours[hour] = [0, 0, 0, 0, {}, {}, {}]
+        turn_context = record.input_tokens + record.cache_creation_tokens + record.cache_read_tokens
+        counters[0] += 1
+        counters[1] += turn_context
+        counters[2] = max(counters[2], turn_context)
+        if turn_context > CONTEXT_WINDOW:
+            counters[3] += 1
+            counters[6][record.model] = counters[6].get(record.model, 0) + 1
+        tokens = counters[4].get(record.model)
+        if tokens is None:
+            tokens = counters[4][record.model] = [0, 0, 0, 0]
+        tokens[0] += record.input_tokens
+        tokens[1] += record.output_tokens
+        tokens[2] += record.cache_creation_tokens
+        tokens[3] += record.cache_read_tokens
+        sketch = counters[5].get(record.model)
+        if sketch is None:
+            sketch = counters[5][record.model] = QuantileSketch()
+        sketch.add(turn_context)
+
+    def spawn(self) -> "ShardCollector":
+        return ShardCollector()
+
+    def merge(self, other: "ShardCollector"):
+        for key, hours in other.files.items():
+            ours = self.files.setdefault(key, {})
+            for hour, counters in hours.items():
+                if hour not in ours:
+                    ours[hour] = counters
+                    continue
+                mine = ours[hour]
+                mine[0] += counters[0]
+                mine[1] += counters[1]
+                mine[2] = max(mine[2], counters[2])
+                mine[3] += counters[3]
+                for model, tokens in counters[4].items():
+                    counts = mine[4].setdefault(model, [0, 0, 0, 0])
+                    counts[:] = map(add, counts, tokens)
+                for model, sketch in counters[5].items():
+                    mine[5].setdefault(model, QuantileSketch()).merge(sketch)
+                for model, over in counters[6].items():
+                    mine[6][model] = mine[6].get(model, 0) + over
+
+    def add_hours(self, source: RecordSource, hours: Dict[str, List]):
+        """Fold in the hour counters (in to_json() form, as hours_json() gives them) of source's file."""
+        other = ShardCollector()
+        other.files[(source.session_id, source.agent_id)] = {
+            hour: counters[:4] + [{model: list(tokens) for model, tokens in counters[4].items()},
+                                  {model: QuantileSketch.from_json(sketch) for model, sketch in counters[5].items()},
+                                  dict(counters[6])]
+            for hour, counters in hours.items()}
+        self.merge(other)
+
+    def hours_json(self, session_id: Optional[str], agent_id: Optional[str] = None) -> Dict[str, List]:
+        """The hour counters of one file, with the sketches in to_json() form."""
+        return {hour: counters[:5] + [{model: sketch.to_json() for model, sketch in counters[5].items()},
+                                      dict(counters[6])]
+                for hour, counters in self.files.get((session_id, agent_id), {}).items()}
+
+    def shard_session(self, entry: Dict, original_path: str, subagent_files: List[Path]) -> Dict:
+        """Shard record of one session: its index entry fields plus main and subagent counters."""
+        session_id = entry.get("sessionId")
+        return {
+            "session_id": session_id,
+            "project_path": original_path,
+            "entry": {
+                "firstPrompt": entry.get("firstPrompt", "")[:100],
+                "summary": entry.get("summary", ""),
+                "messageCount": entry.get("messageCount", 0),
+                "created": entry.get("created"),
+                "modified": entry.get("modified"),
+                "gitBranch": entry.get("gitBranch", ""),
+            },
+            "hours": self.hours_json(session_id),
+            "subagents": {session_file_id(path): self.hours_json(session_id, session_file_id(path))
+                          for path in subagent_files},
+        }
+
+
+def session_data_from_hours(hours: Dict[str, List]) -> UsageCounters:
+    """Rebuild a file's UsageCounters from ShardCollector hour counters."""
+    session_data = UsageCounters()
+    for hour, counters in hours.items():
+        session_data.add_hour(hour_timestamp(hour), counters)
+    return session_data
+
+
+def hours_in_range(hours: Dict[str, List], time_range: Optional[TimeRange]) -> Dict[str, List]:
+    """The hour counters whose hour falls inside time_range (exact for whole-hour UTC offsets)."""
+    if not time_range:
+        return hours
+    range_start, range_end = time_range
+    kept = {}
+    for hour, counters in hours.items():
+        timestamp = parse_timestamp(hour_timestamp(hour))
+        if timestamp and ((range_start and timestamp < range_start) or (range_end and timestamp > range_end)):
+            continue
+        kept[hour] = counters
+    return kept
@@ -0,0 +1,137 @@
+"""
+Partial aggregate shards for analyze_claude_sessions.py.
+
+A shard holds each session's hour counters (see ShardCollector) with its
+index entry, so shards written on several machines (--shard-out) merge
+into one report without reading a transcript. The per-project rollups of
+archived sessions are shards too, read with load_rollups().
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies)
+"""
+
+import gzip
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from claude_session_export import write_export
+from claude_session_pricing import price_table
+from claude_session_scan import (CONTEXT_WINDOW, RecordSource, TimeRange, UsageCounters, hours_in_range,
+                                 session_data_from_hours)
+from claude_session_sketch import CONTEXT_HISTOGRAM_WIDTH
+
+# Per-host partial aggregate (--shard-out, merge command) file signature and format version
+SHARD_FORMAT = "claude-sessions-shard"
+SHARD_VERSION = 3
+
+# Per-project rollup file of the archived sessions (a shard of them)
+ROLLUP_FILE = "session-rollups.json.gz"
+
+
+def shard_session_in_range(session: Dict, time_range: Optional[TimeRange]) -> Dict:
+    """A shard session record restricted to the hours inside time_range."""
+    if not time_range:
+        return session
+    return dict(session, hours=hours_in_range(session["hours"], time_range),
+                subagents={agent_id: hours_in_range(hours, time_range)
+                           for agent_id, hours in session["subagents"].items()})
+
+
+def shard_session_usages(session: Dict) -> Tuple[UsageCounters, List[Tuple[Path, UsageCounters]]]:
+    """(usage_data, subagent_usages) of a shard session record, as build_session_info() takes them."""
+    return (session_data_from_hours(session["hours"]),
+            [(Path(agent_id), session_data_from_hours(hours)) for agent_id, hours in session["subagents"].items()])
+
+
+def add_shard_buckets(bucket_aggregator, session: Dict):
+    """Feed the hour counters of a shard session record, main file first, to a GroupAggregator."""
+    source = RecordSource(session["session_id"], session["project_path"], session["entry"].get("gitBranch", ""), None)
+    for agent_id, hours in [(None, session["hours"]), *session["subagents"].items()]:
+        bucket_aggregator.add_hours(source._replace(agent_id=agent_id), hours)
+
+
+def _shard_rank(session: Dict) -> Tuple[int, str]:
+    """Rank of one copy of a session: most turns (transcripts only grow), then most recently modified."""
+    turns = sum(counters[0] for counters in session["hours"].values())
+    turns += sum(counters[0] for hours in session["subagents"].values() for counters in hours.values())
+    return turns, session["entry"].get("modified") or ""
+
+
+def merge_shard_sessions(sessions: Dict[str, Dict], shard_sessions: List[Dict]):
+    """Fold a shard's sessions into sessions (session_id -> record), keeping one copy of each.
+
+    The best-ranked copy wins and the canonical encoding breaks ties, so the
+    result never depends on the order shards are merged in.
+    """
+    for session in shard_sessions:
+        ours = sessions.get(session["session_id"])
+        if ours is not None:
+            rank, our_rank = _shard_rank(session), _shard_rank(ours)
+            if rank < our_rank or (rank == our_rank and
+                                   json.dumps(session, sort_keys=True) <= json.dumps(ours, sort_keys=True)):
+                continue
+        sessions[session["session_id"]] = session
+
+
+def write_shard(shard_file: Path, sessions: List[Dict], hosts: List[str]):
+    """Write a partial aggregate shard (compact JSON, gzipped when the name ends in .gz)."""
+    header = {
+        "format": SHARD_FORMAT,
+        "version": SHARD_VERSION,
+        "hosts": sorted(set(hosts)),
+        "generated_at": datetime.now().isoformat(),
+        "pricing": price_table().signature(),
+    }
+    write_export(shard_file, header, "sessions", sessions, "compact", shard_file.suffix == ".gz")
+
+
+def load_shard(shard_file: Path) -> Dict:
+    """Read a shard written by write_shard(), upgrading version 2 hour counters. Raises OSError or ValueError."""
+    with open(shard_file, 'rb') as f:
+        compressed = f.read(2) == b"\x1f\x8b"
+    with (gzip.open(shard_file, 'rt') if compressed else open(shard_file, 'r')) as f:
+        shard = json.load(f)
+    if not isinstance(shard, dict) or shard.get("format") != SHARD_FORMAT:
+        raise ValueError("not a session shard")
+    if shard.get("version") == 2:
+        for session in shard.get("sessions", []):
+            for hours in [session["hours"], *session["subagents"].values()]:
+                for counters in hours.values():
+                    counters.append(_over_by_model_v2(counters))
+    elif shard.get("version") != SHARD_VERSION:
+        raise ValueError(f"unsupported shard version {shard.get('version')!r}")
+    return shard
+
+
+def _over_by_model_v2(counters: List) -> Dict[str, int]:
+    """Turns over 200k per model of a version 2 hour counter, which only kept the hour's total.
+
+    Exact unless the hour holds several models with turns over 200k; those
+    are then read off each model's context histogram.
+    """
+    if not counters[3]:
+        return {}
+    if len(counters[4]) == 1:
+        return {next(iter(counters[4])): counters[3]}
+    over_by_model = {}
+    for model, sketch in counters[5].items():
+        over = sum(count for slot, count in sketch[4].items() if int(slot) * CONTEXT_HISTOGRAM_WIDTH >= CONTEXT_WINDOW)
+        if over:
+            over_by_model[model] = over
+    return over_by_model
+
+
+def load_rollups(project_dir: Path) -> Dict[str, Dict]:
+    """Rollup records of a project's archived sessions (session_id -> shard session record)."""
+    rollup_file = project_dir / ROLLUP_FILE
+    if not rollup_file.exists():
+        return {}
+    try:
+        shard = load_shard(rollup_file)
+    except (OSError, ValueError) as e:
+        print(f"Error reading {rollup_file}: {e}")
+        return {}
+    return {session["session_id"]: session for session in shard.get("sessions", [])}
@@ -0,0 +1,135 @@
+"""
+Context-size distributions for analyze_claude_sessions.py.
+
+QuantileSketch counts values in logarithmically spaced bins next to a
+fixed-width histogram, so percentiles come out within a relative error in
+memory that does not grow with the number of turns, and sketches built on
+separate files, processes or machines merge exactly.
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies)
+"""
+
+import math
+from typing import Dict, List
+
+# Context size distribution: quantile sketch relative accuracy, the percentiles reported,
+# and the width of the fixed histogram buckets
+SKETCH_RELATIVE_ACCURACY = 0.01
+CONTEXT_PERCENTILES = (50, 90, 99)
+CONTEXT_HISTOGRAM_WIDTH = 10_000
+
+
+class QuantileSketch:
+    """Mergeable streaming quantile sketch of context sizes, plus a fixed-width histogram.
+
+    Values are counted in logarithmically spaced bins (as in DDSketch), so
+    any quantile is within SKETCH_RELATIVE_ACCURACY of the true value while
+    memory is bounded by the log of the value range (under 800 bins up to
+    2M tokens) whatever the number of turns. The histogram counts turns
+    exactly in CONTEXT_HISTOGRAM_WIDTH-token buckets. Merging adds counts,
+    so sketches of subagents, sessions, days and hosts combine in any order.
+    """
+
+    __slots__ = ("zeros", "min", "max", "bins", "histogram")
+
+    GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+    LOG_GAMMA = math.log(GAMMA)
+
+    def __init__(self):
+        self.zeros = 0
+        self.min = None
+        self.max = None
+        self.bins: Dict[int, int] = {}
+        self.histogram: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return self.zeros + sum(self.bins.values())
+
+    def add(self, value: int):
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if value < 1:
+            self.zeros += 1
+        else:
+            idx = math.ceil(math.log(value) / self.LOG_GAMMA)
+            self.bins[idx] = self.bins.get(idx, 0) + 1
+        slot = value // CONTEXT_HISTOGRAM_WIDTH
+        self.histogram[slot] = self.histogram.get(slot, 0) + 1
+
+    def merge(self, other: "QuantileSketch"):
+        if other.min is None:
+            return
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self.zeros += other.zeros
+        for counts, theirs in ((self.bins, other.bins), (self.histogram, other.histogram)):
+            for key, count in theirs.items():
+                counts[key] = counts.get(key, 0) + count
+
+    def quantiles(self, qs: List[float]) -> List[int]:
+        """Approximate q-quantiles (each 0..1, ascending) of the values added, all 0 when empty."""
+        count = len(self)
+        if not count:
+            return [0] * len(qs)
+        ranks = [q * (count - 1) for q in qs]
+        results = []
+        seen = self.zeros
+        bins = iter(sorted(self.bins.items()))
+        for rank in ranks:
+            if rank < self.zeros:
+                results.append(self.min)
+                continue
+            while seen <= rank:
+                idx, binned = next(bins, (None, 0))
+                if idx is None:
+                    break
+                seen += binned
+            if seen <= rank:
+                results.append(self.max)
+                continue
+            value = 2 * self.GAMMA ** idx / (self.GAMMA + 1)  # bin midpoint, relative error <= accuracy
+            results.append(int(round(min(max(value, self.min), self.max))))
+        return results
+
+    def percentiles(self) -> Dict[str, int]:
+        values = self.quantiles([p / 100 for p in CONTEXT_PERCENTILES])
+        return {f"p{p}": value for p, value in zip(CONTEXT_PERCENTILES, values)}
+
+    def histogram_buckets(self) -> Dict[str, int]:
+        """Turns per histogram bucket, labelled like "190k-200k", in ascending order."""
+        width = CONTEXT_HISTOGRAM_WIDTH // 1000
+        return {f"{slot * width}k-{(slot + 1) * width}k": self.histogram[slot] for slot in sorted(self.histogram)}
+
+    def summary(self) -> Dict:
+        """Export form: percentiles and the fixed histogram."""
+        return {"percentiles": self.percentiles(), "histogram": self.histogram_buckets()}
+
+    def to_json(self) -> List:
+        return [self.zeros, self.min, self.max, dict(self.bins), dict(self.histogram)]
+
+    @classmethod
+    def from_json(cls, data: List) -> "QuantileSketch":
+        sketch = cls()
+        sketch.zeros, sketch.min, sketch.max = data[0], data[1], data[2]
+        sketch.bins = {int(idx): count for idx, count in data[3].items()}
+        sketch.histogram = {int(slot): count for slot, count in data[4].items()}
+        return sketch
+
+
+def merge_sketches(sketches) -> QuantileSketch:
+    """One sketch holding everything in an iterable of sketches."""
+    merged = QuantileSketch()
+    for sketch in sketches:
+        merged.merge(sketch)
+    return merged
+
+
+def add_context_sketches(context_by_model: Dict[str, QuantileSketch], usages):
+    """Merge the per-model context sketches of UsageCounters into context_by_model."""
+    for counters in usages:
+        for model, sketch in counters.context_by_model.items():
+            context_by_model.setdefault(model, QuantileSketch()).merge(sketch)
@@ -0,0 +1,216 @@
+"""
+Per-tool context and cost attribution (--by-tool) for analyze_claude_sessions.py.
+
+ToolAttribution puts each turn's context growth down to the tool results
+(or prompt, or initial context) that caused it and its output down to the
+tool calls and text it wrote, then charges every tool what re-reading
+what it added cost in the turns that followed.
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies)
+"""
+
+import json
+from operator import add
+from typing import Dict, List, Tuple
+
+from claude_session_cache import CACHE_BUST_FRACTION
+from claude_session_pricing import price_table
+from claude_session_scan import RecordSource, UsageRecord, format_number
+from claude_session_sketch import CONTEXT_PERCENTILES, QuantileSketch
+
+# --by-tool: pseudo-tools that context growth and output not caused by a tool are put down to,
+# the sketch of per-call context added that each tool's percentiles come from, and how many
+# tools the report lists (the export has all of them)
+TOOL_TEXT = "(text)"
+TOOL_PROMPT = "(prompt)"
+TOOL_INITIAL = "(initial context)"
+TOOL_UNKNOWN = "(unknown tool)"
+TOOL_REPORT_TOP = 25
+
+
+def _content_size(content) -> int:
+    """Characters of a tool_result's content: its text, or its blocks' text (other blocks count their JSON)."""
+    if isinstance(content, str):
+        return len(content)
+    if not isinstance(content, list):
+        return 0
+    size = 0
+    for block in content:
+        if isinstance(block, dict) and block.get("type") == "text":
+            size += len(block.get("text") or "")
+        else:
+            size += len(json.dumps(block))
+    return size
+
+
+class ToolAttribution:
+    """Context growth and output tokens per tool, attributed turn by turn (--by-tool).
+
+    Turns are followed in file order. The context a turn adds over the
+    previous one is split among the tool_result blocks that arrived in
+    between, in proportion to their size; with none, it came from the
+    user or the harness and goes to TOOL_PROMPT, and a file's first turn
+    goes to TOOL_INITIAL. A turn's output tokens are split among its
+    tool_use blocks (by the size of their input) and its text and thinking
+    (TOOL_TEXT). Only tool_use ids and the sizes of the current turn's
+    blocks are kept, never the messages themselves.
+
+    Added tokens are priced at the turn's cache write rate and output at
+    its output rate. What a tool added stays in context, so every later
+    turn of the file re-reads it: that is charged to the tool at the cache
+    read rate until the context is compacted (shrinks below
+    CACHE_BUST_FRACTION of the previous turn). Acts as a collector for
+    parse_session_files().
+
+    Tool counters are [calls, context_tokens, output_tokens, write_cost,
+    output_cost, reread_cost, QuantileSketch of context added per call].
+    """
+
+    def __init__(self):
+        self.tools: Dict[str, List] = {}
+        # State of the file being fed: tool names by tool_use id, the (tool, size) results and
+        # output blocks pending for the next turn, the previous turn's context and live tokens per tool
+        self._source = None
+        self._names: Dict[str, str] = {}
+        self._results: List[Tuple[str, int]] = []
+        self._blocks: List[Tuple[str, int]] = []
+        self._previous = None
+        self._live: Dict[str, float] = {}
+
+    def _reset(self, source: RecordSource):
+        self._source = source
+        self._names = {}
+        self._results = []
+        self._blocks = []
+        self._previous = None
+        self._live = {}
+
+    def _counters(self, tool: str) -> List:
+        counters = self.tools.get(tool)
+        if counters is None:
+            counters = self.tools[tool] = [0, 0.0, 0.0, 0.0, 0.0, 0.0, QuantileSketch()]
+        return counters
+
+    def add_content(self, source: RecordSource, msg: Dict):
+        if source != self._source:
+            self._reset(source)
+        message = msg.get("message")
+        content = message.get("content") if isinstance(message, dict) else None
+        if not isinstance(content, list):
+            return
+        if message.get("role") == "assistant":
+            self._blocks = []
+        for block in content:
+            if not isinstance(block, dict):
+                continue
+            kind = block.get("type")
+            if kind == "tool_use":
+                name = block.get("name") or TOOL_UNKNOWN
+                self._names[block.get("id")] = name
+                self._blocks.append((name, len(json.dumps(block.get("input")))))
+            elif kind == "text":
+                self._blocks.append((TOOL_TEXT, len(block.get("text") or "")))
+            elif kind == "thinking":
+                self._blocks.append((TOOL_TEXT, len(block.get("thinking") or "")))
+            elif kind == "tool_result":
+                name = self._names.get(block.get("tool_use_id"), TOOL_UNKNOWN)
+                self._results.append((name, _content_size(block.get("content"))))
+
+    @staticmethod
+    def _split(tokens: float, shares: List[Tuple[str, int]]) -> List[Tuple[str, float]]:
+        total = sum(size for _, size in shares)
+        if not total:
+            return [(tool, tokens / len(shares)) for tool, _ in shares]
+        return [(tool, tokens * size / total) for tool, size in shares]
+
+    def add(self, record: UsageRecord):
+        if record.source != self._source:
+            self._reset(record.source)
+        table = price_table()
+        _, output_price, write_price, read_price = table.prices(table.price_key(record.model, record.timestamp))
+        context = record.input_tokens + record.cache_creation_tokens + record.cache_read_tokens
+        previous = self._previous
+        self._previous = context
+
+        if previous is not None and context < CACHE_BUST_FRACTION * previous:
+            self._live = {}
+        for tool, tokens in self._live.items():
+            self.tools[tool][5] += tokens * read_price
+
+        results, self._results = self._results, []
+        if previous is None:
+            added, shares = context, [(TOOL_INITIAL, 1)]
+        else:
+            added, shares = context - previous, results or [(TOOL_PROMPT, 1)]
+        if added > 0:
+            for (tool, _), (_, tokens) in zip(shares, self._split(added, shares)):
+                counters = self._counters(tool)
+                counters[0] += 1
+                counters[1] += tokens
+                counters[3] += tokens * write_price
+                counters[6].add(round(tokens))
+                self._live[tool] = self._live.get(tool, 0.0) + tokens
+        else:
+            for tool, _ in results:  # calls whose output did not grow the context (compacted or cleared)
+                counters = self._counters(tool)
+                counters[0] += 1
+                counters[6].add(0)
+
+        blocks, self._blocks = self._blocks or [(TOOL_TEXT, 1)], []
+        for tool, tokens in self._split(record.output_tokens, blocks):
+            counters = self._counters(tool)
+            counters[2] += tokens
+            counters[4] += tokens * output_price
+
+    def spawn(self) -> "ToolAttribution":
+        return ToolAttribution()
+
+    def merge(self, other: "ToolAttribution"):
+        for tool, counters in other.tools.items():
+            mine = self.tools.get(tool)
+            if mine is None:
+                self.tools[tool] = counters
+                continue
+            mine[:6] = map(add, mine[:6], counters[:6])
+            mine[6].merge(counters[6])
+
+    def summary(self) -> Dict:
+        """Export shape: per-tool totals, cost and per-call percentiles, costliest tool first."""
+        context_total = sum(counters[1] for counters in self.tools.values())
+        tools = {}
+        for tool, (calls, context, output, write_cost, output_cost, reread_cost, sketch) in self.tools.items():
+            tools[tool] = {
+                "calls": calls,
+                "context_tokens": round(context),
+                "context_share": context / context_total if context_total else 0.0,
+                "output_tokens": round(output),
+                "context_per_call": sketch.percentiles(),
+                "max_context_per_call": sketch.max or 0,
+                "write_cost": write_cost,
+                "output_cost": output_cost,
+                "reread_cost": reread_cost,
+                "cost": write_cost + output_cost + reread_cost,
+            }
+        return dict(sorted(tools.items(), key=lambda item: item[1]["cost"], reverse=True))
+
+
+def render_tool_attribution(lines: List[str], summary: Dict):
+    """Append the per-tool attribution section (ToolAttribution.summary()) to lines."""
+    percentiles = "  ".join(f"{f'p{p}':>6}" for p in CONTEXT_PERCENTILES)
+    lines.append(f"{'CONTEXT AND OUTPUT BY TOOL':<30} {'Calls':>7} {'Context':>9} {'Share':>6}  {percentiles}  "
+                 f"{'Output':>8} {'Write':>9} {'Re-read':>10} {'Total':>10}")
+    lines.append("-" * 120)
+    for tool, stats in list(summary.items())[:TOOL_REPORT_TOP]:
+        per_call = "  ".join(f"{format_number(value):>6}" for value in stats["context_per_call"].values())
+        lines.append(f"  {tool[:28]:<28} {stats['calls']:>7} {format_number(stats['context_tokens']):>9} "
+                     f"{stats['context_share'] * 100:>5.1f}%  {per_call}  {format_number(stats['output_tokens']):>8} "
+                     f"${stats['write_cost'] + stats['output_cost']:>8.4f} ${stats['reread_cost']:>9.4f} "
+                     f"${stats['cost']:>9.4f}")
+    if len(summary) > TOOL_REPORT_TOP:
+        lines.append(f"  ... and {len(summary) - TOOL_REPORT_TOP} more tools (see the export)")
+    lines.append(f"  Context is the growth between turns split over the tool results in between (percentiles per "
+                 f"call); {TOOL_PROMPT} is growth with no tool result, {TOOL_TEXT} output outside tool calls.")
+    lines.append("  Write prices added context at the cache write rate plus output; re-read is what later turns "
+                 "paid to read it back until compaction.")
@@ -0,0 +1,303 @@
+"""
+Columnar per-turn store (--turns-out and the turns command) for analyze_claude_sessions.py.
+
+A report run with --turns-out collects every counted API turn into a
+TurnStore file; the turns command groups that file again by model,
+project, session, hour or day without reading a transcript.
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies)
+"""
+
+import json
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, timezone
+from itertools import compress, islice, repeat
+from operator import add, mul, ne, or_
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from claude_session_pricing import PriceTable, price_table
+from claude_session_scan import UsageRecord, format_number, parse_timestamp
+
+# Columnar per-turn store (--turns-out) file signature and format version
+TURN_STORE_MAGIC = b"CCTURNS\0"
+TURN_STORE_VERSION = 1
+
+
+def _read_array(f, typecode: str, itemsize: int, count: int, swap: bool) -> array:
+    """Read count fixed-width items written by array.tofile(), fixing byte order if needed."""
+    values = array(typecode)
+    if values.itemsize != itemsize:
+        raise ValueError(f"Stored '{typecode}' items are {itemsize} bytes, this platform uses {values.itemsize}")
+    values.fromfile(f, count)
+    if swap:
+        values.byteswap()
+    return values
+
+
+class TurnStore:
+    """Columnar table with one row per API turn.
+
+    Session ids, project paths and model names are dictionary-encoded into
+    integer codes and every column is a fixed-width array, so a store with
+    millions of turns takes a few tens of MB and can be re-aggregated without
+    touching the raw transcripts. Acts as a collector for parse_session_files().
+    """
+
+    COLUMNS = [
+        ("timestamp", "q"),  # epoch milliseconds (UTC), 0 when unknown
+        ("session", "I"),
+        ("project", "I"),
+        ("model", "I"),
+        ("input", "I"),
+        ("output", "I"),
+        ("cache_creation", "I"),
+        ("cache_read", "I"),
+    ]
+    TOKEN_COLUMNS = ["input", "output", "cache_creation", "cache_read"]
+    DICTIONARY_COLUMNS = ["session", "project", "model"]
+    GROUP_BY = ["model", "project", "session", "hour", "day"]
+
+    def __init__(self):
+        self.columns = {name: array(typecode) for name, typecode in self.COLUMNS}
+        self.dictionaries = {name: [] for name in self.DICTIONARY_COLUMNS}
+        self._codes = {name: {} for name in self.DICTIONARY_COLUMNS}
+        self._sorted = True
+        self._runs: Optional[array] = None
+
+    def __len__(self) -> int:
+        return len(self.columns["timestamp"])
+
+    def _encode(self, column: str, value: str) -> int:
+        codes = self._codes[column]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(self.dictionaries[column])
+            self.dictionaries[column].append(value)
+        return code
+
+    def add(self, record: UsageRecord):
+        timestamp = parse_timestamp(record.timestamp)
+        columns = self.columns
+        columns["timestamp"].append(int(timestamp.timestamp() * 1000) if timestamp else 0)
+        columns["session"].append(self._encode("session", record.source.session_id or ""))
+        columns["project"].append(self._encode("project", record.source.project_path or ""))
+        columns["model"].append(self._encode("model", record.model))
+        columns["input"].append(record.input_tokens)
+        columns["output"].append(record.output_tokens)
+        columns["cache_creation"].append(record.cache_creation_tokens)
+        columns["cache_read"].append(record.cache_read_tokens)
+        self._sorted = False
+        self._runs = None
+
+    def spawn(self) -> "TurnStore":
+        return TurnStore()
+
+    def merge(self, other: "TurnStore"):
+        """Append the rows of another store, re-mapping its dictionary codes onto ours."""
+        for name in self.DICTIONARY_COLUMNS:
+            remap = [self._encode(name, value) for value in other.dictionaries[name]]
+            self.columns[name].extend(array(self.columns[name].typecode, map(remap.__getitem__, other.columns[name])))
+        for name in ["timestamp"] + self.TOKEN_COLUMNS:
+            self.columns[name].extend(other.columns[name])
+        self._sorted = self._sorted and not len(other)
+        self._runs = None
+
+    def sort_rows(self):
+        """Order rows by (session, model, timestamp) so every aggregation works on contiguous runs.
+
+        Rows arrive file by file, so they are already nearly in this order and
+        the sort is cheap.
+        """
+        if self._sorted:
+            return
+        model_count = max(len(self.dictionaries["model"]), 1)
+        keys = list(map(add,
+                        map(mul, map(add, map(mul, self.columns["session"], repeat(model_count)), self.columns["model"]),
+                            repeat(1 << 42)),
+                        map(max, self.columns["timestamp"], repeat(0))))
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        for name, column in self.columns.items():
+            self.columns[name] = array(column.typecode, map(column.__getitem__, order))
+        self._sorted = True
+
+    def runs(self) -> array:
+        """Start offsets of the runs of rows sharing (session, model), plus the end offset.
+
+        Saved alongside the columns, so a loaded store never has to rescan its rows for them.
+        """
+        self.sort_rows()
+        if self._runs is None:
+            rows = len(self)
+            sessions = self.columns["session"]
+            models = self.columns["model"]
+            changed = map(or_, map(ne, islice(sessions, 1, None), sessions), map(ne, islice(models, 1, None), models))
+            self._runs = array("I", [0] + list(compress(range(1, rows), changed)) + [rows] if rows else [0])
+        return self._runs
+
+    def save(self, path: Path):
+        """Write the store atomically: magic, JSON header, then each column's raw bytes."""
+        runs = self.runs()
+        header = {
+            "version": TURN_STORE_VERSION,
+            "rows": len(self),
+            "runs": [len(runs), runs.itemsize],
+            "byteorder": sys.byteorder,
+            "columns": [[name, typecode, self.columns[name].itemsize] for name, typecode in self.COLUMNS],
+            "dictionaries": self.dictionaries,
+        }
+        header_bytes = json.dumps(header, separators=(",", ":")).encode()
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(TURN_STORE_MAGIC)
+            f.write(struct.pack("<I", len(header_bytes)))
+            f.write(header_bytes)
+            for name, _ in self.COLUMNS:
+                self.columns[name].tofile(f)
+            runs.tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "TurnStore":
+        """Read a store written by save(); raises ValueError for malformed files."""
+        store = cls()
+        with open(path, 'rb') as f:
+            if f.read(len(TURN_STORE_MAGIC)) != TURN_STORE_MAGIC:
+                raise ValueError(f"{path} is not a turn store file")
+            try:
+                (header_len,) = struct.unpack("<I", f.read(4))
+                header = json.loads(f.read(header_len))
+                if header.get("version") != TURN_STORE_VERSION:
+                    raise ValueError(f"Unsupported turn store version {header.get('version')} in {path}")
+
+                swap = header["byteorder"] != sys.byteorder
+                for name, typecode, itemsize in header["columns"]:
+                    store.columns[name] = _read_array(f, typecode, itemsize, header["rows"], swap)
+                run_count, itemsize = header["runs"]
+                store._runs = _read_array(f, "I", itemsize, run_count, swap)
+                store.dictionaries = header["dictionaries"]
+            except (KeyError, TypeError, EOFError, struct.error) as e:
+                raise ValueError(f"Corrupt turn store {path}: {e!r}")
+
+        store._codes = {name: {value: code for code, value in enumerate(values)}
+                        for name, values in store.dictionaries.items()}
+        return store
+
+    def _time_segments(self, by: str, lo: int, hi: int, labels: Dict[int, str]) -> Iterator[Tuple[str, int, int]]:
+        """Split one (session, model) run, [lo, hi), into (time bucket label, start, end) pieces.
+
+        labels memoizes bucket start -> label across calls.
+        """
+        timestamps = self.columns["timestamp"]
+        bucket_ms = {"hour": 3_600_000, "day": 86_400_000}[by]
+        label_format = "%Y-%m-%d %H:00" if by == "hour" else "%Y-%m-%d"
+        pos = lo
+        while pos < hi:
+            if timestamps[pos] <= 0:
+                end = bisect_right(timestamps, 0, pos, hi)
+                yield "Unknown", pos, end
+                pos = end
+                continue
+            bucket_start = timestamps[pos] - timestamps[pos] % bucket_ms
+            end = bisect_left(timestamps, bucket_start + bucket_ms, pos, hi)
+            label = labels.get(bucket_start)
+            if label is None:
+                label = labels[bucket_start] = datetime.fromtimestamp(
+                    bucket_start / 1000, tz=timezone.utc).strftime(label_format)
+            yield label, pos, end
+            pos = end
+
+    def _price_segments(self, model: str, lo: int, hi: int, table: PriceTable,
+                        boundaries: Dict[str, List[int]]) -> Iterator[Tuple[str, int, int]]:
+        """Split a piece of one (session, model) run, [lo, hi), into (price key, start, end) pieces.
+
+        boundaries memoizes model -> epoch ms at which each later price period starts.
+        """
+        dates = table.effective_dates(model)
+        if len(dates) == 1:
+            yield model, lo, hi
+            return
+        if model not in boundaries:
+            boundaries[model] = [int(datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+                                 for date in dates[1:]]
+        timestamps = self.columns["timestamp"]
+        known = bisect_right(timestamps, 0, lo, hi)
+        if known > lo:
+            yield table.price_key(model, None), lo, known
+        cuts = [known] + [bisect_left(timestamps, boundary, known, hi) for boundary in boundaries[model]] + [hi]
+        for idx, (start, end) in enumerate(zip(cuts, cuts[1:])):
+            if end > start:
+                yield (model if idx == 0 else f"{model}@{dates[idx]}"), start, end
+
+    def aggregate(self, by: str) -> Dict[str, Dict]:
+        """Sum tokens, turns and cost per group, where by is one of GROUP_BY.
+
+        Rows are sorted by (session, model, timestamp), so each (session, model)
+        pair is a contiguous run and each time bucket a contiguous piece of it.
+        Token sums are slice sums over those pieces, and cost is computed once
+        per (group, model, price period) rather than once per turn.
+        """
+        runs = self.runs()
+        columns = self.columns
+        model_names = self.dictionaries["model"]
+        table = price_table()
+        by_price = defaultdict(lambda: {"input": 0, "output": 0, "cache_creation": 0, "cache_read": 0, "turns": 0})
+
+        bucket_labels = {}
+        price_boundaries = {}
+        for lo, hi in zip(runs, islice(runs, 1, None)):
+            model_code = columns["model"][lo]
+            if by in ("hour", "day"):
+                pieces = self._time_segments(by, lo, hi, bucket_labels)
+            elif by == "model":
+                pieces = [(model_names[model_code], lo, hi)]
+            else:
+                pieces = [(self.dictionaries[by][columns[by][lo]], lo, hi)]
+
+            for label, start, end in pieces:
+                for price_key, seg_start, seg_end in self._price_segments(
+                        model_names[model_code], start, end, table, price_boundaries):
+                    tokens = by_price[(label, price_key)]
+                    for name in self.TOKEN_COLUMNS:
+                        tokens[name] += sum(columns[name][seg_start:seg_end])
+                    tokens["turns"] += seg_end - seg_start
+
+        groups = defaultdict(lambda: {"input": 0, "output": 0, "cache_creation": 0, "cache_read": 0,
+                                      "turns": 0, "cost": 0.0})
+        for (label, price_key), tokens in by_price.items():
+            group = groups[label]
+            for name in self.TOKEN_COLUMNS + ["turns"]:
+                group[name] += tokens[name]
+            group["cost"] += table.cost(price_key, [tokens[name] for name in self.TOKEN_COLUMNS])
+
+        return dict(groups)
+
+
+def report_turn_store(store_file: Path, by: str):
+    """Print totals per group from a turn store, without reading any transcript."""
+    try:
+        store = TurnStore.load(store_file)
+    except (OSError, ValueError) as e:
+        print(f"Error reading {store_file}: {e}")
+        return
+
+    groups = store.aggregate(by)
+    print("=" * 120)
+    print(f"TURN STORE: {store_file} ({len(store)} turns) - by {by}")
+    print("=" * 120)
+    print(f"{by.upper():<40} {'Turns':<10} {'Input':<12} {'Output':<12} {'Cache Read':<12} {'Cache Write':<12} {'Cost':<12}")
+    print("-" * 120)
+    for label, data in sorted(groups.items(), key=lambda x: x[1]["cost"], reverse=True):
+        print(f"{label[:40]:<40} {data['turns']:<10} {format_number(data['input']):<12} {format_number(data['output']):<12} "
+              f"{format_number(data['cache_read']):<12} {format_number(data['cache_creation']):<12} ${data['cost']:.4f}")
+    totals = {name: sum(g[name] for g in groups.values()) for name in TurnStore.TOKEN_COLUMNS + ["cost"]}
+    print("-" * 120)
+    print(f"{'TOTAL':<40} {len(store):<10} {format_number(totals['input']):<12} {format_number(totals['output']):<12} "
+          f"{format_number(totals['cache_read']):<12} {format_number(totals['cache_creation']):<12} ${totals['cost']:.4f}")
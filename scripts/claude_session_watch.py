@@ -0,0 +1,252 @@
+"""
+Live usage totals (--watch) for analyze_claude_sessions.py.
+
+UsageWatcher follows the session files under ~/.claude/projects, reading
+only the bytes appended to each since the last look, and keeps today's
+cost and turns and the active session's cost and context; watch_sessions()
+publishes them as a waybar custom module payload.
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies)
+"""
+
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from claude_session_inventory import SessionInventory
+from claude_session_pricing import calculate_cost
+from claude_session_scan import (CONTEXT_WINDOW, UsageCounters, default_cache_file, format_number, is_archived,
+                                 parse_timestamp, scan_session_file, session_file_id)
+
+# --watch: a session counts as active this long after its last turn, and the
+# waybar payload is rewritten at least this often (keeps "today" correct)
+WATCH_ACTIVE_SECONDS = 300
+WATCH_REFRESH_SECONDS = 60
+
+
+def default_waybar_file() -> Path:
+    """Location of the waybar payload written by --watch."""
+    return default_cache_file().with_name("waybar.json")
+
+
+class UsageWatcher:
+    """Follows session files and keeps running totals for today and for the active session.
+
+    Each file is read from the offset where the previous read stopped, so an
+    update costs time proportional to the bytes appended. Files last modified
+    before today start at their end; a session that comes back to life has its
+    older bytes read once so its totals are complete. What each file added is
+    kept, so a file that was truncated, or replaced by its archive, can be
+    taken back out of the totals before it is read again.
+    """
+
+    def __init__(self, projects_dir: Path, output_file: Path):
+        self.projects_dir = projects_dir
+        self.output_file = output_file
+        self.offsets: Dict[Path, int] = {}
+        self.cold = set()  # files last modified before today, skipped to their end
+        self.session_files = defaultdict(list)
+        self.sessions = defaultdict(lambda: {"cost": 0.0, "turns": 0, "context": 0, "peak_context": 0,
+                                             "project": "", "last_seen": 0.0})
+        self.contributions = defaultdict(lambda: {"cost": 0.0, "turns": 0, "day_cost": 0.0, "day_turns": 0})
+        self.today = datetime.now().date()
+        self.day_cost = 0.0
+        self.day_turns = 0
+        self.current_session: Optional[str] = None
+
+    def session_key(self, path: Path) -> str:
+        # <project>/<session>.jsonl or <project>/<session>/subagents/agent-*.jsonl, or their archives
+        return session_file_id(path) if path.parent.parent == self.projects_dir else path.parent.parent.name
+
+    def discover(self) -> List[Path]:
+        """Walk the projects tree (a SessionInventory) and register files not seen yet; returns them oldest first."""
+        midnight = datetime.combine(self.today, datetime.min.time()).timestamp()
+        inventory = SessionInventory(self.projects_dir)
+        found = [path for sessions in inventory.projects.values() for path in sessions.values()]
+        found.extend(path for paths in inventory.subagents.values() for path in paths)
+
+        new_files = []
+        for path in found:
+            if path in self.offsets:
+                continue
+            st = inventory.stat(path)
+            if st is None:
+                continue
+            cold = st.st_mtime < midnight
+            live = path.with_name(session_file_id(path) + ".jsonl")
+            if is_archived(path) and live in self.offsets:
+                # The archive takes over from the transcript it replaced
+                cold = live in self.cold
+                self._forget(live)
+                del self.offsets[live]
+                self.cold.discard(live)
+                self.session_files[self.session_key(live)].remove(live)
+            self.session_files[self.session_key(path)].append(path)
+            if cold:
+                self.offsets[path] = st.st_size
+                self.cold.add(path)
+            else:
+                self.offsets[path] = 0
+            new_files.append((st.st_mtime, path))
+        return [path for _, path in sorted(new_files)]
+
+    def _on_usage(self, key: str, project: str, path: Path):
+        contribution = self.contributions[path]
+
+        def handle(msg: Dict, model: str, usage: Dict):
+            cost = calculate_cost(model, usage, msg.get("timestamp"))
+            context = (usage.get("input_tokens", 0) + usage.get("cache_creation_input_tokens", 0)
+                       + usage.get("cache_read_input_tokens", 0))
+            session = self.sessions[key]
+            session["cost"] += cost
+            session["turns"] += 1
+            contribution["cost"] += cost
+            contribution["turns"] += 1
+            session["context"] = context
+            session["peak_context"] = max(session["peak_context"], context)
+            session["project"] = project
+            timestamp = parse_timestamp(msg.get("timestamp"))
+            if timestamp and timestamp.astimezone().date() == self.today:
+                self.day_cost += cost
+                self.day_turns += 1
+                contribution["day_cost"] += cost
+                contribution["day_turns"] += 1
+        return handle
+
+    def _forget(self, path: Path):
+        """Take what path added back out of its session's and today's totals.
+
+        The peak context of the session is kept, as a maximum cannot be
+        taken back.
+        """
+        contribution = self.contributions.pop(path, None)
+        if contribution is None:
+            return
+        session = self.sessions[self.session_key(path)]
+        session["cost"] -= contribution["cost"]
+        session["turns"] -= contribution["turns"]
+        self.day_cost -= contribution["day_cost"]
+        self.day_turns -= contribution["day_turns"]
+
+    def _read(self, path: Path) -> int:
+        key = self.session_key(path)
+        project = path.parent.name if path.parent.parent == self.projects_dir else path.parent.parent.parent.name
+        return scan_session_file(path, UsageCounters(), self.offsets[path],
+                                 on_usage=self._on_usage(key, project, path))
+
+    def update(self, path: Path) -> bool:
+        """Read whatever was appended to path; returns True if anything was consumed."""
+        if path not in self.offsets:
+            return False
+        try:
+            st = path.stat()
+        except OSError:
+            return False
+        size = st.st_size
+        if size == self.offsets[path] or (self.offsets[path] and is_archived(path)):
+            return False
+        if size < self.offsets[path]:
+            # Truncated or replaced: take its turns out and start over
+            self._forget(path)
+            self.offsets[path] = 0
+
+        # A session resumed after today's start: read its older files in full once
+        key = self.session_key(path)
+        to_read = []
+        for session_file in self.session_files[key]:
+            if session_file in self.cold:
+                self.cold.discard(session_file)
+                self.offsets[session_file] = 0
+                if session_file != path:
+                    to_read.append(session_file)
+        to_read.append(path)
+
+        for session_file in to_read:
+            self.offsets[session_file] = self._read(session_file)
+        self.sessions[key]["last_seen"] = st.st_mtime
+        self.current_session = key
+        return True
+
+    def rollover(self) -> bool:
+        """Reset today's totals when the local date changes."""
+        today = datetime.now().date()
+        if today == self.today:
+            return False
+        self.today = today
+        self.day_cost = 0.0
+        self.day_turns = 0
+        for contribution in self.contributions.values():
+            contribution["day_cost"] = 0.0
+            contribution["day_turns"] = 0
+        return True
+
+    def payload(self) -> Dict:
+        """Build a waybar custom module payload (return-type: json)."""
+        tooltip = [f"Claude Code today: ${self.day_cost:.2f} over {self.day_turns} turns"]
+        text = f"${self.day_cost:.2f}"
+        percentage = 0
+        alt = "idle"
+        if self.current_session:
+            session = self.sessions[self.current_session]
+            percentage = min(100, session["context"] * 100 // CONTEXT_WINDOW)
+            text += f" · {format_number(session['context'])}"
+            if time.time() - session["last_seen"] < WATCH_ACTIVE_SECONDS:
+                alt = "active"
+            tooltip.append(f"Session {self.current_session[:8]} ({session['project']}): "
+                           f"${session['cost']:.2f} over {session['turns']} turns")
+            tooltip.append(f"Context: {format_number(session['context'])} / {format_number(CONTEXT_WINDOW)} "
+                           f"(peak {format_number(session['peak_context'])})")
+        css_class = "critical" if percentage >= 90 else "warning" if percentage >= 75 else alt
+        return {"text": text, "alt": alt, "tooltip": "\n".join(tooltip), "class": css_class,
+                "percentage": percentage}
+
+    def publish(self):
+        """Atomically replace the payload file so waybar never reads a partial write."""
+        try:
+            self.output_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.output_file.with_name(self.output_file.name + ".tmp")
+            with open(tmp_file, 'w') as f:
+                json.dump(self.payload(), f)
+            os.replace(tmp_file, self.output_file)
+        except OSError as e:
+            print(f"Warning: could not write {self.output_file}: {e}")
+
+
+def watch_sessions(output_file: Path, interval: float = 2.0):
+    """Run the watch daemon until interrupted, publishing a waybar payload on every change.
+
+    Every interval seconds the tree is walked for new files and each known
+    file is checked for appended bytes; only those are read.
+    """
+    projects_dir = Path.home() / ".claude" / "projects"
+    if not projects_dir.exists():
+        print(f"Error: Claude projects directory not found at {projects_dir}")
+        return
+
+    watcher = UsageWatcher(projects_dir, output_file)
+    for path in watcher.discover():
+        watcher.update(path)
+    watcher.publish()
+    print(f"Watching {projects_dir} every {interval:g}s, publishing to {output_file}")
+
+    last_publish = time.monotonic()
+    try:
+        while True:
+            time.sleep(interval)
+            changed = watcher.rollover()
+            for path in watcher.discover():
+                changed = watcher.update(path) or changed
+            for path in list(watcher.offsets):
+                changed = watcher.update(path) or changed
+
+            if changed or time.monotonic() - last_publish >= WATCH_REFRESH_SECONDS:
+                watcher.publish()
+                last_publish = time.monotonic()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,247 @@
+"""
+Usage dashboard for the serve command of analyze_claude_sessions.py.
+
+A single page (DASHBOARD_HTML) and the JSON API it calls, answered by a
+threaded http.server from a LiveUsageIndex that a background thread keeps
+refreshing; no request touches the session files:
+
+    GET /                 the page
+    GET /api/groups       one dimension's groups (by, project, branch, model,
+                          session, since, until, sort, order, limit, offset)
+    GET /api/facets       the values of each filter
+    GET /api/status       what the index holds and when it was refreshed
+
+Start it with:
+    python3 analyze_claude_sessions.py serve [--host HOST] [--port PORT] [--interval SECONDS]
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies)
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Dict
+from urllib.parse import parse_qs, urlsplit
+
+# Largest page of rows /api/groups answers
+SERVE_MAX_LIMIT = 1000
+
+DASHBOARD_HTML = r"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Claude Code usage</title>
+<style>
+body { font: 14px system-ui, sans-serif; margin: 1.5em; color: #222; }
+form { display: flex; flex-wrap: wrap; gap: .6em; align-items: center; margin-bottom: 1em; }
+table { border-collapse: collapse; width: 100%; }
+th, td { padding: .3em .6em; border-bottom: 1px solid #ddd; text-align: right; white-space: nowrap; }
+th { cursor: pointer; user-select: none; background: #f4f4f4; }
+td:first-child, th:first-child { text-align: left; max-width: 40em; overflow: hidden; text-overflow: ellipsis; }
+tr.total td { font-weight: bold; }
+tbody tr:hover { background: #f8f8ff; cursor: pointer; }
+#status { color: #777; margin-top: .8em; }
+</style></head><body>
+<h2>Claude Code usage</h2>
+<form id="filters">
+  <label>Group by <select name="by">
+    <option>day</option><option>project</option><option>branch</option><option>model</option><option>session</option>
+  </select></label>
+  <label>Project <select name="project"></select></label>
+  <label>Branch <select name="branch"></select></label>
+  <label>Model <select name="model"></select></label>
+  <label>From <input type="date" name="since"></label>
+  <label>To <input type="date" name="until"></label>
+  <label>Rows <select name="limit"><option>25</option><option selected>50</option><option>100</option><option>500</option></select></label>
+  <button type="button" id="prev">&larr;</button><span id="page"></span><button type="button" id="next">&rarr;</button>
+</form>
+<table><thead><tr id="head"></tr></thead><tbody id="rows"></tbody></table>
+<div id="status"></div>
+<script>
+const COLUMNS = [["key", ""], ["sessions", "Sessions"], ["turns", "Turns"], ["input", "Input"], ["output", "Output"],
+                 ["cache_read", "Cache Read"], ["cache_write", "Cache Write"], ["peak_context", "Peak Context"], ["cost", "Cost"]];
+const form = document.getElementById("filters");
+let state = {sort: null, descending: true, offset: 0, total: 0};
+
+function fmt(name, value) {
+  if (name === "cost") return "$" + value.toFixed(2);
+  if (typeof value !== "number" || name === "sessions" || name === "turns") return value;
+  if (value >= 1e6) return (value / 1e6).toFixed(1) + "M";
+  if (value >= 1e3) return (value / 1e3).toFixed(1) + "k";
+  return value;
+}
+
+function fillSelect(name, values) {
+  const select = form.elements[name], current = select.value;
+  select.innerHTML = "<option value=''>(all)</option>" +
+    values.map(v => `<option value="=${encodeURIComponent(v)}">${v === "" ? "(none)" : v.replace(/</g, "&lt;")}</option>`).join("");
+  select.value = current;
+}
+
+function params() {
+  const p = new URLSearchParams();
+  for (const name of ["by", "since", "until", "limit"]) if (form.elements[name].value) p.set(name, form.elements[name].value);
+  for (const name of ["project", "branch", "model"]) {
+    const value = form.elements[name].value;
+    if (value) p.set(name, decodeURIComponent(value.slice(1)));
+  }
+  if (state.sort) p.set("sort", state.sort);
+  p.set("order", state.descending ? "desc" : "asc");
+  p.set("offset", state.offset);
+  return p;
+}
+
+async function load() {
+  const started = performance.now();
+  const response = await fetch("/api/groups?" + params());
+  const data = await response.json();
+  if (!response.ok) { document.getElementById("status").textContent = data.error; return; }
+  state.total = data.total_rows;
+  document.getElementById("head").innerHTML = COLUMNS.map(([name, title]) =>
+    `<th data-sort="${name}">${title || data.by}${data.sort === name ? (data.descending ? " ▼" : " ▲") : ""}</th>`).join("");
+  const cells = row => COLUMNS.map(([name]) => `<td>${name === "key" ? label(data.by, row) : fmt(name, row[name])}</td>`).join("");
+  document.getElementById("rows").innerHTML = data.rows.map(row =>
+    `<tr data-key="${encodeURIComponent(row.key)}">${cells(row)}</tr>`).join("") +
+    `<tr class="total">${cells(Object.assign({}, data.totals, {key: "Total"}))}</tr>`;
+  const last = Math.min(state.offset + data.rows.length, state.total);
+  document.getElementById("page").textContent = ` ${state.total ? state.offset + 1 : 0}-${last} of ${state.total} `;
+  document.getElementById("status").textContent =
+    `Answered in ${data.elapsed_ms.toFixed(2)} ms (${(performance.now() - started).toFixed(0)} ms round trip); ` +
+    `index refreshed ${data.status.refreshed_at}, ${data.status.files} files, ${data.status.sessions} sessions`;
+}
+
+function label(by, row) {
+  const key = String(row.key).replace(/</g, "&lt;");
+  if (by !== "session" || row.key === "Total") return key || "(none)";
+  const prompt = (row.summary || row.first_prompt || "").replace(/</g, "&lt;");
+  return `${key.slice(0, 8)} <small>${(row.project || "").replace(/</g, "&lt;")} ${prompt}</small>`;
+}
+
+async function loadFacets() {
+  const response = await fetch("/api/facets");
+  const facets = await response.json();
+  for (const name of ["project", "branch", "model"]) fillSelect(name, facets[name]);
+}
+
+form.addEventListener("change", event => {
+  if (event.target.name === "by") state.sort = null;
+  state.offset = 0;
+  load();
+});
+document.getElementById("head").addEventListener("click", event => {
+  const sort = event.target.dataset.sort;
+  if (!sort) return;
+  state.descending = state.sort === sort ? !state.descending : true;
+  state.sort = sort;
+  load();
+});
+document.getElementById("rows").addEventListener("click", event => {
+  const tr = event.target.closest("tr[data-key]"), by = form.elements.by.value;
+  if (!tr || by === "session") return;
+  const key = decodeURIComponent(tr.dataset.key);
+  if (by === "day") { form.elements.since.value = form.elements.until.value = key; }
+  else { form.elements[by].value = "=" + encodeURIComponent(key); }
+  form.elements.by.value = by === "day" ? "session" : "day";
+  state.sort = null; state.offset = 0;
+  load();
+});
+document.getElementById("prev").onclick = () => { state.offset = Math.max(0, state.offset - +form.elements.limit.value); load(); };
+document.getElementById("next").onclick = () => {
+  if (state.offset + +form.elements.limit.value < state.total) { state.offset += +form.elements.limit.value; load(); }
+};
+loadFacets().then(load);
+setInterval(() => loadFacets().then(load), 10000);
+</script></body></html>
+"""
+
+
+class _DashboardServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _dashboard_handler(live):
+    """Request handler class answering the dashboard page and its JSON API from live."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: bytes, content_type: str):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _json(self, status: int, data: Dict):
+            self._send(status, json.dumps(data).encode(), "application/json")
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            if url.path == "/":
+                self._send(200, DASHBOARD_HTML.encode(), "text/html; charset=utf-8")
+            elif url.path == "/api/groups":
+                try:
+                    by = query.get("by", "day")
+                    sort = query.get("sort")
+                    limit = int(query.get("limit", 50))
+                    offset = int(query.get("offset", 0))
+                    if by not in live.index.DIMENSIONS:
+                        raise ValueError(f"by must be one of {', '.join(live.index.DIMENSIONS)}")
+                    if sort is not None and sort != "key" and sort not in live.index.METRICS:
+                        raise ValueError(f"sort must be key or one of {', '.join(live.index.METRICS)}")
+                    if not 0 < limit <= SERVE_MAX_LIMIT or offset < 0:
+                        raise ValueError(f"limit must be 1..{SERVE_MAX_LIMIT} and offset 0 or more")
+                except ValueError as e:
+                    self._json(400, {"error": str(e)})
+                    return
+                filters = {dimension: query.get(dimension) for dimension in ("project", "branch", "model", "session")}
+                started = time.perf_counter()
+                with live.lock:
+                    data = live.index.query(by, filters, query.get("since"), query.get("until"), sort,
+                                            query.get("order", "desc") != "asc", limit, offset)
+                data["elapsed_ms"] = (time.perf_counter() - started) * 1000
+                data["status"] = live.status()
+                self._json(200, data)
+            elif url.path == "/api/facets":
+                with live.lock:
+                    self._json(200, live.index.facets())
+            elif url.path == "/api/status":
+                self._json(200, live.status())
+            else:
+                self._json(404, {"error": f"no such page: {url.path}"})
+
+        def log_message(self, format, *args):
+            pass  # keep the terminal for the refresh log
+
+    return Handler
+
+
+def serve(live, host: str, port: int, interval: float):
+    """Serve the dashboard from live, a refreshed LiveUsageIndex, until interrupted.
+
+    A background thread calls live.refresh() every interval seconds; a
+    refresh that fails leaves the last good index in place.
+    """
+    try:
+        server = _DashboardServer((host, port), _dashboard_handler(live))
+    except OSError as e:
+        print(f"Error: cannot listen on {host}:{port}: {e}")
+        return
+
+    def refresh_forever():
+        while True:
+            time.sleep(interval)
+            try:
+                live.refresh()
+            except Exception as e:  # keep serving the last good index
+                print(f"Error refreshing the index: {e}")
+
+    threading.Thread(target=refresh_forever, daemon=True).start()
+    print(f"Serving the usage dashboard on http://{host}:{server.server_address[1]}/ (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,926 @@
+"""
+Tests for analyze_claude_sessions.py and the claude_session_*.py modules it is built from.
+
+Each test builds the transcripts it needs under a scratch home directory, so
+nothing is read from the real ~/.claude. Run from the repository root:
+    python3 -m unittest discover -s scripts
+
+Requirements:
+    - Python 3.7+
+    - Standard library only (no external dependencies)
+"""
+
+import contextlib
+import gzip
+import io
+import json
+import math
+import os
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+from datetime import datetime, timezone
+from operator import itemgetter
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import analyze_claude_sessions as analyzer  # noqa: E402
+import claude_session_archive as archiving  # noqa: E402
+import claude_session_cache as caching  # noqa: E402
+import claude_session_db as sessions_db  # noqa: E402
+import claude_session_export as exports  # noqa: E402
+import claude_session_index as usage_index  # noqa: E402
+import claude_session_inventory as inventory  # noqa: E402
+import claude_session_pricing as pricing  # noqa: E402
+import claude_session_sample as sampling  # noqa: E402
+import claude_session_scan as scan  # noqa: E402
+import claude_session_shards as shards  # noqa: E402
+import claude_session_sketch as sketching  # noqa: E402
+import claude_session_tools as attribution  # noqa: E402
+
+MODELS = ["claude-opus-4-5-20251101", "claude-sonnet-4-5-20250929", "claude-haiku-4-5-20251001"]
+
+
+def turn_line(timestamp: str, model: str = MODELS[0], input_tokens: int = 10, output_tokens: int = 100,
+              cache_creation: int = 1000, cache_read: int = 20000) -> bytes:
+    """One assistant record with a usage payload, as a JSONL line."""
+    return (json.dumps({
+        "type": "assistant",
+        "timestamp": timestamp,
+        "message": {"role": "assistant", "model": model, "usage": {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cache_creation_input_tokens": cache_creation,
+            "cache_read_input_tokens": cache_read,
+        }},
+    }) + "\n").encode()
+
+
+def random_turns(rng: random.Random, count: int, day: str = "2026-01-15") -> list:
+    """UsageRecord-shaped tuples (timestamp, model, input, output, cache_creation, cache_read)."""
+    return [(f"{day}T{rng.randrange(24):02d}:{rng.randrange(60):02d}:00.000Z",
+             pricing.normalize_model_name(rng.choice(MODELS)), rng.randrange(100), rng.randrange(5000),
+             rng.randrange(50000), rng.randrange(300000))
+            for _ in range(count)]
+
+
+def counters_of(turns) -> scan.UsageCounters:
+    counters = scan.UsageCounters()
+    for timestamp, model, input_tokens, output_tokens, cache_creation, cache_read in turns:
+        counters.add_turn(model, pricing.price_table().price_key(model, timestamp), input_tokens, output_tokens,
+                          cache_creation, cache_read)
+    return counters
+
+
+def copy_counters(counters: scan.UsageCounters) -> scan.UsageCounters:
+    return scan.UsageCounters.from_json(counters.to_json())
+
+
+def prompt_line(timestamp: str, text: str = "prompt", **fields) -> bytes:
+    """One user record, as a JSONL line; fields are added at the top level (cwd, gitBranch...)."""
+    return (json.dumps(dict({"type": "user", "timestamp": timestamp,
+                             "message": {"role": "user", "content": text}}, **fields)) + "\n").encode()
+
+
+def write_session(projects_dir: Path, session_id: str, lines: list, created: str, modified: str = None,
+                  subagents: dict = None, project: str = "-home-u-proj", indexed: bool = True):
+    """Write a transcript (and its subagents' as {agent_id: lines}), listing it in sessions-index.json."""
+    project_dir = projects_dir / project
+    project_dir.mkdir(parents=True, exist_ok=True)
+    (project_dir / f"{session_id}.jsonl").write_bytes(b"".join(lines))
+    for agent_id, agent_lines in (subagents or {}).items():
+        subagent_dir = project_dir / session_id / "subagents"
+        subagent_dir.mkdir(parents=True, exist_ok=True)
+        (subagent_dir / f"{agent_id}.jsonl").write_bytes(b"".join(agent_lines))
+    if not indexed:
+        return
+    index_file = project_dir / "sessions-index.json"
+    index = json.loads(index_file.read_text()) if index_file.exists() else {
+        "version": 1, "originalPath": "/" + project.strip("-").replace("-", "/"), "entries": []}
+    index["entries"].append({"sessionId": session_id, "firstPrompt": "prompt", "summary": "", "messageCount": len(lines),
+                             "created": created, "modified": modified or created, "gitBranch": "main"})
+    index_file.write_text(json.dumps(index))
+
+
+class ScratchHomeTestCase(unittest.TestCase):
+    """Points HOME (and the parse cache) at an empty temporary directory for each test."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.home = Path(tmp.name)
+        self.projects_dir = self.home / ".claude" / "projects"
+        self.projects_dir.mkdir(parents=True)
+        patcher = mock.patch.dict(os.environ, {"HOME": str(self.home), "XDG_CACHE_HOME": str(self.home / ".cache")})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def analyze(self, **kwargs) -> dict:
+        """Run the report quietly and return its export."""
+        output_file = self.home / "analysis.json"
+        with contextlib.redirect_stdout(io.StringIO()):
+            analyzer.analyze_all_sessions(output_file=output_file, **kwargs)
+        return json.loads(output_file.read_text())
+
+
+def write_random_sessions(projects_dir: Path, rng: random.Random, count: int, projects: int = 2):
+    """count sessions of random turns over a few days, spread over projects, each with a subagent."""
+    for idx in range(count):
+        day = f"2026-01-{10 + idx % 5:02d}"
+        lines = [turn_line(timestamp, model, *tokens)
+                 for timestamp, model, *tokens in sorted(random_turns(rng, rng.randrange(1, 30), day))]
+        agent_lines = [turn_line(timestamp, model, *tokens)
+                       for timestamp, model, *tokens in sorted(random_turns(rng, rng.randrange(1, 8), day))]
+        write_session(projects_dir, f"s{idx:02d}", lines, f"{day}T00:00:00.000Z", subagents={"agent-a": agent_lines},
+                      project=f"-home-u-proj{idx % projects}")
+
+
+def records_of(session_id: str, turns, agent_id=None) -> list:
+    source = scan.RecordSource(session_id, "/home/u/proj", "main", agent_id)
+    return [scan.UsageRecord(source, *turn) for turn in turns]
+
+
+class MergeAssociativityTest(unittest.TestCase):
+    """Partial aggregates must combine to the same result in any grouping."""
+
+    def setUp(self):
+        rng = random.Random(7)
+        self.parts = [random_turns(rng, count) for count in (40, 1, 25)]
+
+    def test_usage_counters(self):
+        a, b, c = (counters_of(part) for part in self.parts)
+        left = copy_counters(a)
+        left += b
+        left += c
+        right = copy_counters(b)
+        right += c
+        grouped = copy_counters(a)
+        grouped += right
+        serial = counters_of(self.parts[0] + self.parts[1] + self.parts[2])
+        self.assertEqual(left.to_json(), serial.to_json())
+        self.assertEqual(grouped.to_json(), serial.to_json())
+
+    def test_quantile_sketch(self):
+        sketches = []
+        for part in self.parts:
+            sketch = sketching.QuantileSketch()
+            for _, _, input_tokens, _, cache_creation, cache_read in part:
+                sketch.add(input_tokens + cache_creation + cache_read)
+            sketches.append(sketch)
+        left = sketching.merge_sketches(sketches)
+        right = sketching.merge_sketches([sketches[0], sketching.merge_sketches(sketches[1:])])
+        reversed_order = sketching.merge_sketches(reversed(sketches))
+        self.assertEqual(left.to_json(), right.to_json())
+        self.assertEqual(left.to_json(), reversed_order.to_json())
+
+        values = sorted(turn[2] + turn[4] + turn[5] for part in self.parts for turn in part)
+        for q, estimate in zip((0.5, 0.9, 0.99), left.quantiles([0.5, 0.9, 0.99])):
+            exact = values[int(q * (len(values) - 1))]
+            self.assertLessEqual(abs(estimate - exact), exact * sketching.SKETCH_RELATIVE_ACCURACY * 2 + 1)
+
+    def test_group_aggregator(self):
+        # One session whose turns span three files (main transcript and two subagents), then another
+        records = (records_of("s1", self.parts[0]) + records_of("s1", self.parts[1], "agent-a")
+                   + records_of("s2", self.parts[2]))
+        dimensions = ("day", "model")
+        serial = analyzer.GroupAggregator(dimensions)
+        for record in records:
+            serial.add(record)
+
+        for split in (1, 40, 41, 50):
+            head, tail = analyzer.GroupAggregator(dimensions), analyzer.GroupAggregator(dimensions).spawn()
+            for record in records[:split]:
+                head.add(record)
+            for record in records[split:]:
+                tail.add(record)
+            head.merge(tail)
+            self.assertEqual(head.groups(), serial.groups(), f"split at {split}")
+        self.assertEqual(sum(group["sessions"] for group in serial.groups().values()),
+                         len({(record.source.session_id, record.timestamp[:10], record.model) for record in records}))
+
+    def test_group_aggregator_from_shard(self):
+        # Two models in one hour, one turn exactly at the context window (not over it) and one past it
+        window = scan.CONTEXT_WINDOW
+        opus, sonnet = (pricing.normalize_model_name(model) for model in MODELS[:2])
+        turns = self.parts[0] + [("2026-01-15T10:00:00.000Z", opus, 0, 1, 0, window),
+                                 ("2026-01-15T10:30:00.000Z", sonnet, 1, 1, 0, window)]
+        records = records_of("s1", turns)
+        dimensions = ("hour", "model")
+        direct, from_shard, collector = (analyzer.GroupAggregator(dimensions), analyzer.GroupAggregator(dimensions),
+                                         scan.ShardCollector())
+        for record in records:
+            direct.add(record)
+            collector.add(record)
+        session = json.loads(json.dumps(collector.shard_session({"sessionId": "s1"}, "/home/u/proj", [])))
+        session["entry"]["gitBranch"] = "main"
+        shards.add_shard_buckets(from_shard, session)
+        self.assertEqual(from_shard.groups(), direct.groups())
+
+    def test_merge_shards(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            shard_files = []
+            for idx, session_ids in enumerate((["s1", "s2"], ["s2", "s3"], ["s4"])):
+                collector = scan.ShardCollector()
+                sessions = []
+                for session_id in session_ids:
+                    rng = random.Random(session_id)
+                    for record in records_of(session_id, random_turns(rng, 5)):
+                        collector.add(record)
+                    sessions.append(collector.shard_session({"sessionId": session_id, "created": "2026-01-15"},
+                                                            "/home/u/proj", []))
+                shard_files.append(tmp / f"shard{idx}.json")
+                shards.write_shard(shard_files[-1], sessions, [f"host{idx}"])
+
+            def merged(files, name):
+                output = tmp / f"{name}.json"
+                with contextlib.redirect_stdout(io.StringIO()):
+                    self.assertTrue(analyzer.merge_shards(files, output_file=output, shard_out=tmp / f"{name}.shard"))
+                export = json.loads(output.read_text())
+                export.pop("generated_at")
+                return export
+
+            everything = merged(shard_files, "all")
+            pair = merged(shard_files[:2], "pair")
+            self.assertEqual(merged([tmp / "pair.shard", shard_files[2]], "nested"), everything)
+            self.assertEqual(merged(list(reversed(shard_files)), "reversed"), everything)
+            self.assertEqual(everything["total_sessions"], 4)
+            self.assertEqual(pair["total_sessions"], 3)
+
+
+class ParseCacheTest(unittest.TestCase):
+    """The cache resumes after the last complete line, whatever was appended since."""
+
+    def test_partial_line(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "session.jsonl"
+            lines = [turn_line(f"2026-01-15T10:0{idx}:00.000Z", output_tokens=idx + 1) for idx in range(4)]
+            path.write_bytes(lines[0] + lines[1] + lines[2][:25])
+            cache = {"version": scan.CACHE_VERSION, "pricing": pricing.price_table().signature(), "files": {}}
+
+            first = scan.parse_session_file_cached(path, cache)
+            self.assertEqual(first["turn_count"], 2)
+            self.assertEqual(cache["files"][str(path.absolute())]["offset"], len(lines[0] + lines[1]))
+
+            with open(path, "ab") as f:
+                f.write(lines[2][25:] + lines[3])
+            resumed = scan.parse_session_file_cached(path, cache)
+            self.assertEqual(resumed.to_json(), scan.parse_session_file(path).to_json())
+            self.assertEqual(resumed["turn_count"], 4)
+            self.assertEqual(resumed["output_tokens"], 1 + 2 + 3 + 4)
+            self.assertEqual(cache["files"][str(path.absolute())]["offset"], path.stat().st_size)
+
+    def test_rewritten_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "session.jsonl"
+            path.write_bytes(turn_line("2026-01-15T10:00:00.000Z") * 3)
+            cache = {"version": scan.CACHE_VERSION, "pricing": pricing.price_table().signature(), "files": {}}
+            scan.parse_session_file_cached(path, cache)
+            path.write_bytes(turn_line("2026-01-15T11:00:00.000Z", output_tokens=7))
+            rewritten = scan.parse_session_file_cached(path, cache)
+            self.assertEqual(rewritten["turn_count"], 1)
+            self.assertEqual(rewritten["output_tokens"], 7)
+
+
+class ParallelParseTest(ScratchHomeTestCase):
+    """--jobs spreads the files over a process pool without changing a byte of the report."""
+
+    def report(self, **kwargs) -> str:
+        """The printed report and the export, without the generation time and the process's peak memory."""
+        output_file = self.home / "analysis.json"
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            analyzer.analyze_all_sessions(output_file=output_file, **kwargs)
+        report = re.sub(r"Peak memory \(RSS\): .*", "", out.getvalue())
+        return report + re.sub(r'"generated_at": "[^"]*"', "", output_file.read_text())
+
+    def test_same_as_serial(self):
+        write_random_sessions(self.projects_dir, random.Random(2), 12)
+        for kwargs in ({}, dict(by="day"), dict(group_by=("project", "model")), dict(sort_by="cost", limit=5)):
+            serial = self.report(jobs=1, **kwargs)
+            for jobs in (2, 4):
+                self.assertEqual(self.report(jobs=jobs, **kwargs), serial, f"{kwargs} with {jobs} jobs")
+            self.assertEqual(self.report(jobs=4, cache_file=self.home / "cache.json", **kwargs), serial)
+
+
+class DateFilterTest(ScratchHomeTestCase):
+    """--start-date/--end-date are applied to the index before any transcript is opened."""
+
+    def test_same_as_filtering_parsed_sessions(self):
+        write_random_sessions(self.projects_dir, random.Random(4), 15)
+        start, end = datetime(2026, 1, 11, tzinfo=timezone.utc), datetime(2026, 1, 12, tzinfo=timezone.utc)
+        everything = self.analyze()["sessions"]
+        expected = [session for session in everything if scan.is_in_date_range(session["created"], start, end)]
+        self.assertTrue(0 < len(expected) < len(everything))
+
+        profiler = analyzer.Profiler()
+        export = self.analyze(start_date=start, end_date=end, profiler=profiler)
+        self.assertEqual(export["sessions"], expected)
+        self.assertEqual(export["total_sessions"], len(expected))
+        self.assertAlmostEqual(export["total_cost"], sum(session["total_cost"] for session in expected))
+        # Only the transcripts of the sessions in range were read: each main file and its subagent
+        self.assertEqual(profiler.stats.counts["files_opened"], 2 * len(expected))
+
+
+class TimeBucketTest(ScratchHomeTestCase):
+    """Turns are bucketed by their own timestamp, in UTC, with ISO weeks."""
+
+    def test_time_keys(self):
+        aggregator = analyzer.GroupAggregator(("day",))
+        cases = [
+            # ISO week 1 of 2026 starts on Monday 2025-12-29
+            ("2025-12-29T10:00:00.000Z", "2025-12-29 10:00", "2025-12-29", "2026-W01", "2025-12"),
+            ("2026-01-04T23:30:00.000Z", "2026-01-04 23:00", "2026-01-04", "2026-W01", "2026-01"),
+            ("2026-01-05T00:00:00.000Z", "2026-01-05 00:00", "2026-01-05", "2026-W02", "2026-01"),
+            # An offset moves the turn to the UTC hour, day, week and month it fell in
+            ("2026-01-04T23:30:00.000-05:00", "2026-01-05 04:00", "2026-01-05", "2026-W02", "2026-01"),
+            ("2026-02-01T01:30:00+02:00", "2026-01-31 23:00", "2026-01-31", "2026-W05", "2026-01"),
+            (None, "Unknown", "Unknown", "Unknown", "Unknown"),
+        ]
+        granularities = ("hour", "day", "week", "month")
+        for _ in range(2):  # the second time round the week labels come from the memo
+            for timestamp, *expected in cases:
+                self.assertEqual([aggregator.time_key(granularity, timestamp) for granularity in granularities],
+                                 expected, timestamp)
+
+    def test_session_across_midnight(self):
+        write_session(self.projects_dir, "late", [
+            turn_line("2026-01-04T23:50:00.000Z", output_tokens=1),
+            turn_line("2026-01-05T00:10:00.000Z", output_tokens=20),
+            turn_line("2026-01-04T22:00:00.000-05:00", output_tokens=300),
+        ], "2026-01-04T23:45:00.000Z")
+        days = self.analyze(by="day")["buckets"]
+        self.assertEqual({day: bucket["output_tokens"] for day, bucket in days.items()},
+                         {"2026-01-04": 1, "2026-01-05": 320})
+        self.assertEqual({day: bucket["sessions"] for day, bucket in days.items()}, {"2026-01-04": 1, "2026-01-05": 1})
+        weeks = self.analyze(by="week")["buckets"]
+        self.assertEqual({week: bucket["output_tokens"] for week, bucket in weeks.items()},
+                         {"2026-W01": 1, "2026-W02": 320})
+
+
+class PriceTableTest(ScratchHomeTestCase):
+    """Turns are priced at the rate in force on their own (UTC) day."""
+
+    def setUp(self):
+        super().setUp()
+        price_file = self.home / "pricing.json"
+        price_file.write_text(json.dumps({"version": pricing.PRICE_FILE_VERSION, "fallback_model": "claude-opus-4-5",
+                                          "models": {"claude-opus-4-5": [
+                                              {"effective": "2026-01-15", "input": 2.0, "output": 20.0,
+                                               "cache_write": 0.0, "cache_read": 0.0},
+                                              {"effective": "2026-01-01", "input": 1.0, "output": 10.0,
+                                               "cache_write": 0.0, "cache_read": 0.0},
+                                          ]}}))
+        self.table = pricing.PriceTable.load(price_file)
+        pricing.set_price_table(self.table)
+        self.addCleanup(pricing.set_price_table, None)
+
+    def test_price_keys(self):
+        model = "claude-opus-4-5"
+        for timestamp, key in [("2025-12-31T23:59:59.000Z", model), ("2026-01-01T00:00:00.000Z", model),
+                               ("2026-01-14T23:59:59.999Z", model), ("2026-01-15T00:00:00.000Z", f"{model}@2026-01-15"),
+                               ("2026-03-01T10:00:00.000Z", f"{model}@2026-01-15"), (None, f"{model}@2026-01-15")]:
+            self.assertEqual(self.table.price_key(model, timestamp), key, timestamp)
+        self.assertAlmostEqual(self.table.cost(model, (1_000_000, 1_000_000, 0, 0)), 11.0)
+        self.assertAlmostEqual(self.table.cost(f"{model}@2026-01-15", (1_000_000, 1_000_000, 0, 0)), 22.0)
+
+    def test_unknown_model_warned_once(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            key = self.table.price_key("claude-next", "2026-01-20T00:00:00.000Z")
+            costs = [self.table.cost(key, (1_000_000, 0, 0, 0)) for _ in range(3)]
+        self.assertEqual(costs, [2.0] * 3)
+        self.assertEqual(out.getvalue().count("Unknown model claude-next"), 1)
+
+    def test_malformed_file(self):
+        price_file = self.home / "bad.json"
+        for data in ({"version": 99, "models": {}}, {"version": pricing.PRICE_FILE_VERSION,
+                                                      "models": {"claude-opus-4-5": [{"effective": "2026-01-01"}]}}):
+            price_file.write_text(json.dumps(data))
+            with self.assertRaises(ValueError):
+                pricing.PriceTable.load(price_file)
+
+    def test_session_across_a_price_change(self):
+        tokens = dict(input_tokens=1_000_000, output_tokens=0, cache_creation=0, cache_read=0)
+        write_session(self.projects_dir, "s1", [turn_line("2026-01-14T23:00:00.000Z", **tokens),
+                                                turn_line("2026-01-15T01:00:00.000Z", **tokens)],
+                      "2026-01-14T23:00:00.000Z")
+        for kwargs in ({}, dict(by="day")):
+            export = self.analyze(**kwargs)
+            self.assertAlmostEqual(export["total_cost"], 1.0 + 2.0, msg=str(kwargs))
+        self.assertEqual({day: bucket["total_cost"] for day, bucket in export["buckets"].items()},
+                         {"2026-01-14": 1.0, "2026-01-15": 2.0})
+
+
+class ExportTest(unittest.TestCase):
+    """The streamed export matches json.dump() output, in every format, and replaces the file atomically."""
+
+    HEADER = {"generated_at": datetime(2026, 1, 15, 10, 0), "total_cost": 1.25, "total_tokens": {"input": 3},
+              "nested": {"empty": {}, "list": [1, "two", None, 0.5], "ü": "ünïcode"}}
+    SESSIONS = [{"session_id": "a", "usage": {"turn_count": 2, "cost_by_model": {"m": 0.5}}, "subagents": []},
+                {"session_id": "b", "usage": {}, "subagents": [{"agent_id": "agent-1", "tokens": [1, 2]}]}]
+    BUCKETS = {"2026-01-14": {"sessions": 1, "total_cost": 0.25}, "2026-01-15": {"sessions": 2, "tokens": {}}}
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+
+    def export(self, items_key: str, items, export_format: str = "json", compress: bool = False) -> str:
+        output_file = self.dir / "export"
+        exports.write_export(output_file, self.HEADER, items_key, items, export_format, compress)
+        opener = gzip.open if compress else open
+        with opener(output_file, "rt") as f:
+            return f.read()
+
+    def test_json_layout(self):
+        for items_key, items in (("sessions", self.SESSIONS), ("buckets", self.BUCKETS), ("sessions", []),
+                                 ("buckets", {})):
+            expected = json.dumps(dict(self.HEADER, **{items_key: items}), indent=2, default=str)
+            self.assertEqual(self.export(items_key, items), expected)
+            self.assertEqual(self.export(items_key, items, compress=True), expected)
+            self.assertEqual(self.export(items_key, items, "compact"),
+                             json.dumps(dict(self.HEADER, **{items_key: items}), separators=(",", ":"), default=str))
+
+    def test_ndjson(self):
+        header, *sessions = self.export("sessions", self.SESSIONS, "ndjson").splitlines()
+        self.assertEqual(json.loads(header), json.loads(json.dumps(self.HEADER, default=str)))
+        self.assertEqual([json.loads(line) for line in sessions], self.SESSIONS)
+        _, *buckets = self.export("buckets", self.BUCKETS, "ndjson", compress=True).splitlines()
+        self.assertEqual([json.loads(line) for line in buckets],
+                         [dict(bucket=key, **value) for key, value in self.BUCKETS.items()])
+
+    def test_atomic_replace(self):
+        output_file = self.dir / "export"
+        output_file.write_text("previous export")
+
+        def failing_sessions():
+            yield self.SESSIONS[0]
+            raise OSError("disk full")
+
+        with self.assertRaises(OSError):
+            exports.write_export(output_file, self.HEADER, "sessions", failing_sessions())
+        self.assertEqual(output_file.read_text(), "previous export")
+        self.assertEqual(sorted(path.name for path in self.dir.iterdir()), ["export"])
+
+
+class PagingTest(ScratchHomeTestCase):
+    """--top/--limit/--offset show a page of the full ranking; totals still cover everything."""
+
+    def test_select_page(self):
+        rng = random.Random(6)
+        items = [(rng.randrange(10), idx) for idx in range(200)]  # many ties on the key
+        key = itemgetter(0)
+        ranking = sorted(items, key=key, reverse=True)
+        for offset in (0, 1, 7, 199, 250):
+            self.assertEqual(analyzer.select_page(items, key, offset), ranking[offset:])
+            for limit in (0, 1, 5, 200):
+                self.assertEqual(analyzer.select_page(items, key, offset, limit), ranking[offset:offset + limit],
+                                 f"offset {offset}, limit {limit}")
+
+    def test_report_pages(self):
+        for idx, output_tokens in enumerate((5, 500, 50, 5000, 50000)):
+            line = turn_line("2026-01-15T10:00:00.000Z", output_tokens=output_tokens)
+            write_session(self.projects_dir, f"session{idx}", [line], f"2026-01-1{idx}T00:00:00.000Z")
+        everything = self.analyze()
+
+        def shown(**kwargs) -> list:
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                analyzer.analyze_all_sessions(output_file=self.home / "page.json", sort_by="cost", **kwargs)
+            self.assertEqual(json.loads((self.home / "page.json").read_text())["total_cost"], everything["total_cost"])
+            return re.findall(r"\] Session: (\w+)\.\.\.", out.getvalue())
+
+        self.assertEqual(shown(), ["session4", "session3", "session1", "session2", "session0"])
+        self.assertEqual(shown(limit=2), ["session4", "session3"])
+        self.assertEqual(shown(limit=2, offset=2), ["session1", "session2"])
+        self.assertEqual(shown(limit=2, offset=4), ["session0"])
+        self.assertEqual(shown(offset=5), [])
+
+
+class CacheEfficiencyTest(ScratchHomeTestCase):
+    """A bust re-writes a prefix that a run of turns was reading; it is put down to a cause and priced."""
+
+    OPUS = pricing.normalize_model_name(MODELS[0])
+    SONNET = pricing.normalize_model_name(MODELS[1])
+
+    @classmethod
+    def turns(cls) -> list:
+        """(timestamp, model, input, output, cache_creation, cache_read): one bust of each cause, then a compaction."""
+        opus, sonnet = cls.OPUS, cls.SONNET
+        plan = [  # (minute, model, cache_creation, cache_read)
+            (0, opus, 20000, 0),
+            (1, opus, 1000, 20000),
+            (2, opus, 1000, 21000),
+            (3, opus, 22000, 0),       # prefix changed
+            (4, opus, 1000, 22000),
+            (5, opus, 1000, 23000),
+            (15, opus, 24000, 0),      # idle past TTL
+            (16, opus, 1000, 24000),
+            (17, opus, 1000, 25000),
+            (18, sonnet, 26000, 0),    # model switch
+            (19, sonnet, 1000, 26000),
+            (20, sonnet, 1000, 27000),
+            (21, sonnet, 9000, 0),     # too small a write to be a bust
+            (22, sonnet, 1000, 40000),
+            (23, sonnet, 1000, 41000),
+            (24, sonnet, 12000, 0),    # compaction
+            (25, sonnet, 1000, 12000),
+            (26, sonnet, 1000, 13000),
+        ]
+        return [(f"2026-01-15T10:{minute:02d}:00.000Z", model, 10, 100, written, read)
+                for minute, model, written, read in plan]
+
+    @staticmethod
+    def agent_turns() -> list:
+        # Its own conversation: no read run carries over from the main file, and two writes in a row are no bust
+        return [("2026-01-15T10:30:00.000Z", CacheEfficiencyTest.OPUS, 10, 100, 30000, 0),
+                ("2026-01-15T10:31:00.000Z", CacheEfficiencyTest.OPUS, 10, 100, 40000, 0)]
+
+    def test_busts_causes_and_compactions(self):
+        cache = caching.CacheEfficiencyAnalyzer()
+        for record in records_of("s1", self.turns()) + records_of("s1", self.agent_turns(), agent_id="agent-a"):
+            cache.add(record)
+        summary = cache.summary()
+
+        table = pricing.price_table()
+
+        def lost(model, rewritten):
+            prices = table.prices(table.price_key(model, "2026-01-15T10:00:00.000Z"))
+            return rewritten * (prices[2] - prices[3])
+
+        expected = {"prefix changed": (22000, lost(self.OPUS, 22000)),
+                    "idle past TTL": (24000, lost(self.OPUS, 24000)),
+                    "model switch": (26000, lost(self.SONNET, 26000))}
+        for cause, (rewritten, cost) in expected.items():
+            totals = summary["by_cause"][cause]
+            self.assertEqual((totals["busts"], totals["tokens_rewritten"]), (1, rewritten), cause)
+            self.assertAlmostEqual(totals["lost_cost"], cost)
+        self.assertEqual(summary["overall"]["busts"], 3)
+        self.assertEqual(summary["overall"]["compactions"], 1)
+        self.assertAlmostEqual(summary["overall"]["lost_cost"], sum(cost for _, cost in expected.values()))
+        self.assertEqual(summary["by_model"][self.OPUS]["busts"], 2)
+        self.assertEqual(summary["by_model"][self.SONNET]["busts"], 1)
+
+        busts = {bust["cause"]: bust for bust in summary["top_busts"]}
+        self.assertEqual(busts["idle past TTL"]["idle_seconds"], 600)
+        self.assertEqual(busts["prefix changed"]["idle_seconds"], 60)
+        # The rewritten tokens stop at the previous turn's context
+        self.assertEqual((busts["model switch"]["previous_context"], busts["model switch"]["cache_creation_tokens"]),
+                         (26010, 26000))
+        self.assertEqual([bust["lost_cost"] for bust in summary["top_busts"]],
+                         sorted((bust["lost_cost"] for bust in summary["top_busts"]), reverse=True))
+
+    def test_parallel_merge(self):
+        lines = [turn_line(timestamp, model, *tokens) for timestamp, model, *tokens in self.turns()]
+        agent_lines = [turn_line(timestamp, model, *tokens) for timestamp, model, *tokens in self.agent_turns()]
+        for idx in range(3):
+            write_session(self.projects_dir, f"s{idx}", lines, "2026-01-15T10:00:00.000Z",
+                          subagents={"agent-a": agent_lines})
+
+        # Workers add up the dollars in another order, so those are compared to nine decimal places
+        serial, parallel = (json.loads(json.dumps(self.analyze(cache_efficiency=True, jobs=jobs)["cache_efficiency"]),
+                                       parse_float=lambda text: round(float(text), 9)) for jobs in (1, 3))
+        self.assertEqual(serial, parallel)
+        self.assertEqual((serial["overall"]["busts"], serial["overall"]["compactions"]), (3 * 3, 3))
+        self.assertEqual(sorted(serial["by_session"]), ["s0", "s1", "s2"])
+
+
+class ToolAttributionTest(ScratchHomeTestCase):
+    """Context a turn adds goes to the tool results before it by size, and its output to its own blocks."""
+
+    READ_INPUT = {"file_path": "/home/u/proj/main.py"}
+    BASH_INPUT = {"command": "make test", "timeout": 60000}
+
+    @staticmethod
+    def assistant_line(timestamp: str, content: list, output_tokens: int, cache_creation: int,
+                       cache_read: int) -> bytes:
+        """One assistant record with content blocks and a usage payload, as a JSONL line."""
+        return (json.dumps({
+            "type": "assistant",
+            "timestamp": timestamp,
+            "message": {"role": "assistant", "model": MODELS[0], "content": content, "usage": {
+                "input_tokens": 10,
+                "output_tokens": output_tokens,
+                "cache_creation_input_tokens": cache_creation,
+                "cache_read_input_tokens": cache_read,
+            }},
+        }) + "\n").encode()
+
+    def lines(self) -> list:
+        read_size, bash_size = len(json.dumps(self.READ_INPUT)), len(json.dumps(self.BASH_INPUT))
+        results = [
+            {"type": "tool_result", "tool_use_id": "t1", "content": "y" * 3000},
+            {"type": "tool_result", "tool_use_id": "t2", "content": [{"type": "text", "text": "z" * 1000}]},
+        ]
+        return [
+            prompt_line("2026-01-15T10:00:00.000Z", "fix the tests"),
+            # Initial context 1000; output split 100 / read_size / bash_size among the text and the two calls
+            self.assistant_line("2026-01-15T10:00:05.000Z", [
+                {"type": "text", "text": "x" * 100},
+                {"type": "tool_use", "id": "t1", "name": "Read", "input": self.READ_INPUT},
+                {"type": "tool_use", "id": "t2", "name": "Bash", "input": self.BASH_INPUT},
+            ], 100 + read_size + bash_size, 990, 0),
+            (json.dumps({"type": "user", "timestamp": "2026-01-15T10:00:06.000Z",
+                         "message": {"role": "user", "content": results}}) + "\n").encode(),
+            # 4000 added: 3000 to Read and 1000 to Bash
+            self.assistant_line("2026-01-15T10:00:10.000Z", [{"type": "text", "text": "done"}], 50, 4000, 990),
+            prompt_line("2026-01-15T10:01:00.000Z", "and the docs"),
+            # 600 added with no tool result before it
+            self.assistant_line("2026-01-15T10:01:05.000Z", [{"type": "text", "text": "ok"}], 20, 600, 4990),
+            # Compacted: nothing is re-read any more, and what the next turn adds came from the prompt
+            self.assistant_line("2026-01-15T10:02:00.000Z", [], 0, 1990, 0),
+            self.assistant_line("2026-01-15T10:02:05.000Z", [], 0, 100, 1990),
+        ]
+
+    def test_attribution(self):
+        write_session(self.projects_dir, "s1", self.lines(), "2026-01-15T10:00:00.000Z")
+        tools = self.analyze(by_tool=True)["tool_attribution"]
+
+        table = pricing.price_table()
+        _, _, write_price, read_price = table.prices(table.price_key(pricing.normalize_model_name(MODELS[0]),
+                                                                     "2026-01-15T10:00:00.000Z"))
+        read_size, bash_size = len(json.dumps(self.READ_INPUT)), len(json.dumps(self.BASH_INPUT))
+        self.assertEqual({tool: (totals["calls"], totals["context_tokens"], totals["output_tokens"])
+                          for tool, totals in tools.items()}, {
+            attribution.TOOL_INITIAL: (1, 1000, 0),
+            "Read": (1, 3000, read_size),
+            "Bash": (1, 1000, bash_size),
+            attribution.TOOL_PROMPT: (2, 700, 0),
+            attribution.TOOL_TEXT: (0, 0, 100 + 50 + 20),
+        })
+        self.assertAlmostEqual(tools["Read"]["context_share"], 3000 / 5700)
+        self.assertAlmostEqual(tools["Read"]["write_cost"], 3000 * write_price)
+        # Re-read by every later turn until the compaction
+        self.assertAlmostEqual(tools["Read"]["reread_cost"], 3000 * read_price)
+        self.assertAlmostEqual(tools[attribution.TOOL_INITIAL]["reread_cost"], 2 * 1000 * read_price)
+        self.assertEqual(tools[attribution.TOOL_PROMPT]["reread_cost"], 0.0)
+        self.assertEqual(tools["Read"]["max_context_per_call"], 3000)
+        costs = [totals["cost"] for totals in tools.values()]
+        self.assertEqual(costs, sorted(costs, reverse=True))
+
+    def test_parallel_merge(self):
+        for idx in range(3):
+            write_session(self.projects_dir, f"s{idx}", self.lines(), "2026-01-15T10:00:00.000Z",
+                          subagents={"agent-a": self.lines()[1:]})
+
+        # Workers add up the dollars in another order, so those are compared to nine decimal places
+        serial, parallel = (json.loads(json.dumps(self.analyze(by_tool=True, jobs=jobs)["tool_attribution"]),
+                                       parse_float=lambda text: round(float(text), 9)) for jobs in (1, 3))
+        self.assertEqual(serial, parallel)
+        self.assertEqual(serial["Read"]["calls"], 3 * 2)
+
+
+class SampleTest(ScratchHomeTestCase):
+    """--sample estimates the totals with intervals; drawing everything gives them exactly."""
+
+    def exact(self) -> dict:
+        values = {}
+        for path in sorted(self.projects_dir.rglob("*.jsonl")):
+            sampling._add_values(values, sampling._sample_values(scan.parse_session_file(path)))
+        return values
+
+    def test_t_quantiles(self):
+        self.assertAlmostEqual(sampling._t_quantile(5), 2.571)
+        self.assertAlmostEqual(sampling._t_quantile(1), 12.706)
+        self.assertAlmostEqual(sampling._t_quantile(0.5), 12.706)  # fewer than 1 are taken as 1
+        self.assertEqual(sampling._t_quantile(math.inf), sampling.SAMPLE_Z)
+        quantiles = [sampling._t_quantile(dof) for dof in [1, 1.5, 2, 3, 5, 7.5, 10, 30, 100, 1000, 10 ** 6]]
+        self.assertEqual(quantiles, sorted(quantiles, reverse=True))
+        self.assertGreater(quantiles[-1], sampling.SAMPLE_Z)
+
+    def test_stratified_interval(self):
+        estimate = sampling.SampleEstimate()
+        estimate.add_stratum("a", 4, 2)
+        for value in (1.0, 3.0):
+            estimate.add("a", {("All models", "turns"): value}, {})
+        estimate.add_stratum("b", 3, 3)
+        for value in (5.0, 5.0, 6.0):
+            estimate.add("b", {("All models", "turns"): value}, {})
+        total, half = estimate.estimates()[("All models", "turns")]
+        # 4 * mean(1, 3) + 16; only the half-sampled stratum varies: 4² (1 - 2/4) s² / 2 with s² = 2, on 1 dof
+        self.assertAlmostEqual(total, 8.0 + 16.0)
+        self.assertAlmostEqual(half, 12.706 * math.sqrt(8.0))
+
+    def test_full_sample_is_exact(self):
+        write_random_sessions(self.projects_dir, random.Random(11), 12, projects=3)
+        exact = self.exact()
+        # Files over SAMPLE_FILE_BYTES are cut into chunks, every one of them read at fraction 1
+        with mock.patch.object(sampling, "SAMPLE_FILE_BYTES", 1000), \
+                mock.patch.object(sampling, "SAMPLE_CHUNK_BYTES", 512):
+            totals = self.analyze(sample=1.0)["totals"]
+        for metric in sampling.SAMPLE_METRICS:
+            self.assertAlmostEqual(totals[metric]["estimate"], exact[("All models", metric)], msg=metric)
+            self.assertEqual(totals[metric]["margin"], 0.0, metric)
+
+    def test_intervals_cover_exact(self):
+        # A 95% interval misses now and then: over a few corpora, nearly all of them must cover the exact total
+        covered = intervals = 0
+        for seed in range(8):
+            shutil.rmtree(self.projects_dir)
+            write_random_sessions(self.projects_dir, random.Random(seed), 40, projects=2)
+            exact = self.exact()
+            export = self.analyze(sample=0.3)
+            self.assertLess(export["sample"]["sessions_sampled"], export["sample"]["sessions"])
+            for metric in sampling.SAMPLE_METRICS:
+                estimate, margin = export["totals"][metric]["estimate"], export["totals"][metric]["margin"]
+                self.assertGreater(margin, 0.0, metric)
+                intervals += 1
+                covered += abs(estimate - exact[("All models", metric)]) <= margin
+        self.assertGreaterEqual(covered, 0.85 * intervals, f"{covered} of {intervals}")
+
+    def test_validate_sample(self):
+        write_random_sessions(self.projects_dir, random.Random(13), 10)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.assertTrue(sampling.validate_sample(1.0))
+        covered = re.search(r"(\d+) of (\d+) intervals cover the exact value", output.getvalue())
+        self.assertIsNotNone(covered, output.getvalue())
+        self.assertEqual(covered.group(1), covered.group(2))
+        self.assertNotIn(" NO\n", output.getvalue())
+
+        self.projects_dir.rename(self.home / "elsewhere")
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertFalse(sampling.validate_sample(1.0))
+
+
+class CachedHoursTest(ScratchHomeTestCase):
+    """--by, --group-by and --filter-turns are answered from the hour counters in the cache, exactly."""
+
+    def test_same_report(self):
+        rng = random.Random(5)
+        for idx in range(3):
+            lines = [turn_line(timestamp, model, *tokens)
+                     for timestamp, model, *tokens in sorted(random_turns(rng, 20, f"2026-01-1{idx}"))]
+            write_session(self.projects_dir, f"s{idx}", lines, f"2026-01-1{idx}T00:00:00.000Z")
+        cache_file = self.home / "cache.json"
+        reports = [dict(by="day"), dict(group_by=("hour", "model")),
+                   dict(start_date=datetime(2026, 1, 11, tzinfo=timezone.utc), filter_turns=True)]
+        for appended in range(2):
+            for kwargs in reports:
+                expected = self.analyze(**kwargs)
+                expected.pop("generated_at")
+                for jobs in (1, 2, 1):
+                    export = self.analyze(cache_file=cache_file, jobs=jobs, **kwargs)
+                    export.pop("generated_at")
+                    self.assertEqual(export, expected, f"{kwargs} with {jobs} jobs")
+                profiler = analyzer.Profiler()
+                self.analyze(cache_file=cache_file, profiler=profiler, **kwargs)
+                self.assertEqual(profiler.stats.counts["files_opened"], 0, "served from the cache")
+            with open(self.projects_dir / "-home-u-proj" / "s0.jsonl", "ab") as f:
+                f.write(turn_line("2026-01-12T10:00:00.000Z", MODELS[1]))
+        self.assertTrue(all("hours" in entry for entry in json.loads(cache_file.read_text())["files"].values()))
+
+
+class FilterTurnsTest(ScratchHomeTestCase):
+    """--filter-turns keeps a session by its turns' timestamps, the subagents' included."""
+
+    def test_subagent_turns_in_range(self):
+        write_session(self.projects_dir, "s-old", [turn_line("2026-01-01T10:00:00.000Z", output_tokens=1)],
+                      "2026-01-01T09:00:00.000Z", "2026-01-25T10:00:00.000Z",
+                      {"agent-a": [turn_line("2026-01-15T10:00:00.000Z", output_tokens=20),
+                                   turn_line("2026-01-25T10:00:00.000Z", output_tokens=300)]})
+        write_session(self.projects_dir, "s-outside", [turn_line("2026-01-02T10:00:00.000Z", output_tokens=4000)],
+                      "2026-01-02T09:00:00.000Z")
+        write_session(self.projects_dir, "s-inside", [turn_line("2026-01-12T10:00:00.000Z", output_tokens=50000)],
+                      "2026-01-12T09:00:00.000Z")
+
+        export = self.analyze(start_date=datetime(2026, 1, 10, tzinfo=timezone.utc),
+                              end_date=datetime(2026, 1, 20, 23, 59, 59, tzinfo=timezone.utc), filter_turns=True)
+        self.assertEqual(sorted(session["session_id"] for session in export["sessions"]), ["s-inside", "s-old"])
+        self.assertEqual(export["total_tokens"]["output"], 20 + 50000)
+
+    def test_without_filter_turns(self):
+        write_session(self.projects_dir, "s-old", [turn_line("2026-01-01T10:00:00.000Z", output_tokens=1)],
+                      "2026-01-01T09:00:00.000Z", "2026-01-15T10:00:00.000Z",
+                      {"agent-a": [turn_line("2026-01-15T10:00:00.000Z")]})
+        export = self.analyze(start_date=datetime(2026, 1, 10, tzinfo=timezone.utc))
+        self.assertEqual(export["total_sessions"], 0)
+
+
+class LatencyTest(ScratchHomeTestCase):
+    """Latency pairs each response with the record before it in the same file, and merges across workers."""
+
+    def test_pairing_and_parallel_merge(self):
+        for idx in range(3):
+            write_session(self.projects_dir, f"s{idx}", [
+                prompt_line(f"2026-01-15T10:0{idx}:00.000Z"),
+                turn_line(f"2026-01-15T10:0{idx}:02.000Z", output_tokens=100),
+                turn_line(f"2026-01-15T10:0{idx}:03.000Z", output_tokens=50),
+            ], f"2026-01-15T10:0{idx}:00.000Z", subagents={"agent-a": [turn_line("2026-01-15T11:00:00.000Z")]})
+
+        serial = self.analyze(latency=True, jobs=1)["latency"]
+        parallel = self.analyze(latency=True, jobs=3)["latency"]
+        self.assertEqual(serial, parallel)
+        # The second record of each response and the subagents' turns have no request before them
+        self.assertEqual(serial["overall"]["unpaired_turns"], 3 * 2)
+        model = pricing.normalize_model_name(MODELS[0])
+        self.assertEqual(serial["by_model"][model]["turns"], 3)
+        self.assertAlmostEqual(serial["by_model"][model]["mean_latency_seconds"], 2.0)
+        self.assertAlmostEqual(serial["by_model"][model]["mean_output_tokens_per_second"], 50.0)
+
+
+class OrphanInferenceTest(ScratchHomeTestCase):
+    """Transcripts missing from sessions-index.json are costed with an entry read from their first records."""
+
+    def test_entry_from_records(self):
+        write_session(self.projects_dir, "orphan", [
+            b'{"type": "summary", "summary": "Fix the parser"}\n',
+            prompt_line("2026-01-15T10:00:00.000Z", "fix the bug", cwd="/home/u/other", gitBranch="dev"),
+            turn_line("2026-01-15T10:00:05.000Z"),
+        ], "", indexed=False)
+        path = self.projects_dir / "-home-u-proj" / "orphan.jsonl"
+        entry, cwd = inventory.infer_index_entry(path, path.stat())
+        self.assertEqual(cwd, "/home/u/other")
+        self.assertEqual((entry["sessionId"], entry["created"], entry["firstPrompt"], entry["gitBranch"],
+                          entry["summary"]), ("orphan", "2026-01-15T10:00:00.000Z", "fix the bug", "dev",
+                                              "Fix the parser"))
+        self.assertTrue(entry["orphan"])
+
+    def test_created_falls_back_to_mtime(self):
+        write_session(self.projects_dir, "undated", [b'{"type": "summary", "summary": "no timestamps"}\n'], "",
+                      indexed=False)
+        path = self.projects_dir / "-home-u-proj" / "undated.jsonl"
+        entry, _ = inventory.infer_index_entry(path, path.stat())
+        self.assertIsNotNone(entry["created"])
+        self.assertEqual(entry["created"], entry["modified"])
+
+    def test_report_counts_orphans(self):
+        write_session(self.projects_dir, "indexed", [turn_line("2026-01-15T10:00:00.000Z", output_tokens=1)],
+                      "2026-01-15T09:00:00.000Z")
+        write_session(self.projects_dir, "orphan", [turn_line("2026-01-16T10:00:00.000Z", output_tokens=20)], "",
+                      indexed=False)
+        write_session(self.projects_dir, "undated", [b'{"type": "summary", "summary": "no timestamps"}\n'], "",
+                      indexed=False)
+        export = self.analyze()
+        self.assertEqual(export["total_sessions"], 3)
+        self.assertEqual(export["total_tokens"]["output"], 21)
+
+
+class ArchiveTest(ScratchHomeTestCase):
+    """Archiving sessions must not change what the report, ingest or serve count."""
+
+    def setUp(self):
+        super().setUp()
+        rng = random.Random(3)
+        for idx in range(3):
+            lines = [turn_line(timestamp, model, *tokens) for timestamp, model, *tokens in random_turns(rng, 20)]
+            agent_lines = [turn_line(timestamp, model, *tokens) for timestamp, model, *tokens in random_turns(rng, 5)]
+            write_session(self.projects_dir, f"s{idx}", lines, "2026-01-15T00:00:00.000Z",
+                          subagents={"agent-a": agent_lines})
+        old = time.time() - 60 * 86400
+        for path in self.projects_dir.rglob("*.jsonl"):
+            os.utime(path, (old, old))
+
+    def archive(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertTrue(archiving.archive_sessions(30))
+        self.assertEqual(list(self.projects_dir.rglob("*.jsonl")), [])
+        self.assertEqual(len(list(self.projects_dir.rglob("*.jsonl.gz"))), 6)
+
+    def test_report(self):
+        before = self.analyze()
+        self.archive()
+        after = self.analyze()
+        for key in ("total_sessions", "total_tokens"):
+            self.assertEqual(after[key], before[key])
+        self.assertAlmostEqual(after["total_cost"], before["total_cost"])
+        self.assertEqual(self.analyze(use_rollups=False)["total_tokens"], before["total_tokens"])
+
+    def test_ingest(self):
+        db_file = self.home / "usage.db"
+
+        def turns() -> int:
+            with contextlib.redirect_stdout(io.StringIO()):
+                sessions_db.ingest_sessions(db_file)
+            with contextlib.closing(sqlite3.connect(str(db_file))) as conn:
+                return conn.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+
+        self.assertEqual(turns(), 3 * 25)
+        self.archive()
+        self.assertEqual(turns(), 3 * 25)
+
+    def test_archives_are_not_resumed(self):
+        self.archive()
+        archive = next(self.projects_dir.rglob("s0.jsonl.gz"))
+        with self.assertRaises(ValueError):
+            scan.scan_session_file(archive, scan.UsageCounters(), 100)
+
+    def test_live_index(self):
+        live = usage_index.LiveUsageIndex(self.projects_dir)
+        live.refresh()
+        before = live.index.query("model")["totals"]
+        self.assertEqual(before["turns"], 3 * 25)
+        self.archive()
+        live.refresh()
+        self.assertEqual(live.index.query("model")["totals"], before)
+
+
+if __name__ == "__main__":
+    unittest.main()